@@ -2,19 +2,53 @@ import json
 import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 import logging
 from dotenv import load_dotenv
 
 import cv2
-import numpy as np
-from flask import Flask, Response, jsonify, request
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
-from ultralytics import YOLO
-from ultralytics.utils.plotting import Annotator, colors
 
-from capture import VideoCapture
+from calibration import IMGSZ_CANDIDATES, RECALL_THRESHOLD, calibrate_imgsz, parse_imgsz, parse_imgsz_candidates
+import camera_pipeline
+from camera_pipeline import (
+    CAPTURE_HEIGHT,
+    CAPTURE_WIDTH,
+    CASCADE_MODE,
+    DEFAULT_IMGSZ,
+    MODEL_PATH,
+    OCCUPANCY_ENGINE,
+    detect_boxes,
+    get_model,
+    warm_up_model,
+)
+from camera_supervisor import CameraSupervisor
+from camera_workers import CameraWorkerPool
+from cascade import CASCADE_MODES
+from evidence_clips import clip_dir, evidence_store, list_clips, load_clip, new_clip_id
+from frame_hub import FrameHubPump, frame_hub
+from history_downsample import (
+    MAX_HISTORY_HOURS,
+    SERIES_COLUMNS,
+    bucket_series,
+    bucket_seconds_for,
+    lttb,
+    parse_bucket_seconds,
+    parse_hours,
+    parse_method,
+    parse_points,
+)
+from metrics import render_prometheus
+from model_manager import SHADOW_SAMPLE_RATE, is_valid_model_path, model_swapper, start_shadow, stop_shadow
+from occupancy_feed import FEED_KEEPALIVE_SECONDS, SSE_KEEPALIVE, occupancy_feed, parse_camera_filter, sse_message
+from occupancy_state import parse_confirm_seconds
+from rate_controller import DEFAULT_PRIORITY, DEFAULT_TARGET_FPS, parse_priority, parse_target_fps, rate_controller
+from spot_geometry import normalize_areas, parse_reference_size, scale_areas
+from stream_sources import display_demand, display_source, inference_source, parse_stream_url
 from supabase_client import db
 
 # Carregar variáveis de ambiente
@@ -33,53 +67,50 @@ CORS(app, resources={
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization", "ngrok-skip-browser-warning"],
-        "expose_headers": ["Content-Type"]
+        "expose_headers": ["Content-Type", "ETag"]
     }
 })
 
 # Configurações
-os.environ.setdefault(
-    "OPENCV_FFMPEG_CAPTURE_OPTIONS",
-    "rtsp_transport;tcp|stimeout;15000000|max_delay;5000000|reorder_queue_size;2",
-)
-
-CAPTURE_WIDTH = 1280
-CAPTURE_HEIGHT = 720
-MAX_DISPLAY_WIDTH = 1280
-MAX_DISPLAY_HEIGHT = 720
-FPS_SMOOTHING_ALPHA = 0.15
-FRAME_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 80]
-PARKING_DETAILS_VERSION = 1
 CAMERA_SYNC_INTERVAL = 60  # seconds
+CALIBRATION_FRAMES = 8
+CALIBRATION_FRAME_INTERVAL = 0.5  # seconds entre frames amostrados
+# Processos worker para os pipelines de câmera (0 = threads no próprio processo da API)
+CAMERA_WORKERS = int(os.getenv('CAMERA_WORKERS', '0'))
+# Câmeras iniciadas em paralelo no boot (as aberturas RTSP ainda passam por MAX_CONCURRENT_CONNECTS)
+STARTUP_CONCURRENCY = int(os.getenv('STARTUP_CONCURRENCY', '8'))
 
 # URL base para streaming (Cloudflare Tunnel ou servidor público)
 STREAM_BASE_URL = os.getenv('STREAM_BASE_URL', 'http://localhost:5000')
 
-# Classes de veículos para detecção
-VEHICLE_CLASSES = {
-    "car", "truck", "bus", "motorbike", "motorcycle",
-    "vehicle", "bicycle", "van"
-}
-
-# Modelo YOLO com otimizações de GPU
-model = YOLO("yolo11s.pt", verbose=False)
-model.to("cuda")
-
-# Configurações de performance
-model.fuse()  # Fuse layers para melhor performance
-
 # Armazenamento de câmeras
 cameras_config: Dict[str, Dict] = {}  # {camera_id: {name, location, url, areas, status}}
-cameras_capture: Dict[str, VideoCapture] = {}  # {camera_id: VideoCapture}
-cameras_frames: Dict[str, Optional[bytes]] = {}  # Último frame JPEG
-cameras_locks: Dict[str, threading.Lock] = {}  # {camera_id: threading.Lock}
 cameras_stats: Dict[str, Dict] = {}  # {camera_id: {occupied, free, total, fps, spots}}
-cameras_last_save: Dict[str, float] = {}  # {camera_id: timestamp} - Para controle de persistência
 last_camera_sync = 0.0
 config_lock = threading.Lock()
+worker_pool: Optional[CameraWorkerPool] = None  # Ativo quando CAMERA_WORKERS > 0
+frame_pump: Optional[FrameHubPump] = None  # Copia frames dos workers para o frame_hub
+STREAM_WAIT_TIMEOUT = 1.0  # seconds; intervalo máximo entre checagens de câmera parada
+OCCUPANCY_POLL_INTERVAL = 0.2  # seconds; leitura das estatísticas dos workers para o feed de ocupação
+# Listagem /api/cameras servida da memória: a versão muda com o config ou a ocupação
+# (fps, frescor e taxa ficam fora, em /api/cameras/stats)
+CAMERAS_LONG_POLL_MAX = 30.0  # seconds
+cameras_version = 0
+cameras_changed = threading.Condition()
+cameras_listing_cache: Optional[Tuple[str, bytes]] = None  # (etag, JSON)
+startup_started_at: Optional[float] = None  # Início do auto-start (para /api/startup)
+process_started_at = time.time()
+# Fases do startup em background: {fase: {status, started_at, seconds, error}}
+startup_phases: Dict[str, Dict] = {}
+READINESS_PHASES = ('supabase', 'model_load', 'warmup', 'cameras')
 
 CONFIG_FILE = Path("cameras_config.json")
-OCCUPANCY_SAVE_INTERVAL = 60  # Salva ocupação a cada 60 segundos
+# Campos que só existem no config local e sobrevivem à sincronização com o Supabase
+LOCAL_CAMERA_FIELDS = (
+    'areas_reference_size', 'imgsz', 'imgsz_calibration', 'occupancy_engine', 'cascade_mode',
+    'target_fps', 'priority', 'interpolate', 'confirm_on_seconds', 'confirm_off_seconds',
+    'max_frame_age', 'inference_url', 'display_url',
+)
 
 
 def load_cameras_config():
@@ -89,9 +120,12 @@ def load_cameras_config():
         try:
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+            for config in data.values():
+                normalize_camera_areas(config)
             count = len(data)
             with config_lock:
                 cameras_config = data
+            mark_cameras_changed()
             logger.info(f"Loaded {count} cameras from config")
         except Exception as e:
             logger.error(f"Error loading cameras config: {e}")
@@ -99,8 +133,20 @@ def load_cameras_config():
                 cameras_config = {}
 
 
+def normalize_camera_areas(config: Dict) -> Dict:
+    """Converte as áreas da câmera para coordenadas normalizadas (in-place)"""
+    reference = parse_reference_size(
+        config.get('areas_reference_size'),
+        default=(CAPTURE_WIDTH, CAPTURE_HEIGHT),
+    )
+    config['areas'] = normalize_areas(config.get('areas', []), reference)
+    config['areas_reference_size'] = list(reference)
+    return config
+
+
 def save_cameras_config():
     """Salva configuração de câmeras no arquivo JSON"""
+    mark_cameras_changed()
     try:
         with config_lock:
             snapshot = json.dumps(cameras_config, indent=2, ensure_ascii=False)
@@ -145,330 +191,278 @@ def sync_cameras_from_supabase(force: bool = False) -> None:
                 if isinstance(points, list) and len(points) == 4:
                     areas.append(points)
 
-            new_config[camera_id] = {
+            local_config = cameras_config.get(camera_id, {})
+            camera_config = {
                 'name': camera.get('name', ''),
                 'location': camera.get('location', ''),
                 'url': camera.get('url', ''),
                 'areas': areas,
-                'status': camera.get('status', 'offline')
+                'status': camera.get('status', 'offline'),
+                'stream_url': camera.get('stream_url') or local_config.get('stream_url', ''),
             }
+            for field in LOCAL_CAMERA_FIELDS:
+                if field in local_config:
+                    camera_config[field] = local_config[field]
+            new_config[camera_id] = normalize_camera_areas(camera_config)
 
         # Proteção: NÃO sobrescrever se Supabase retornar vazio e já temos câmeras localmente
         if len(new_config) == 0 and len(cameras_config) > 0:
             logger.warning("Supabase returned 0 cameras but we have %d locally - keeping local config", len(cameras_config))
             return
 
+        if new_config == cameras_config:
+            last_camera_sync = now
+            return
+
         with config_lock:
             cameras_config = new_config
         last_camera_sync = now
         save_cameras_config()
+        for camera_id in new_config:
+            notify_camera_config(camera_id)
         logger.info("Synced %d cameras from Supabase", len(new_config))
     except Exception as exc:
         logger.error("Failed to sync cameras from Supabase: %s", exc)
 
 
-def resolve_class_ids(names_map, target_names):
-    """Resolve IDs das classes de interesse"""
-    resolved = set()
-    if isinstance(names_map, dict):
-        iterable = names_map.items()
-    else:
-        iterable = enumerate(names_map)
-    for idx, name in iterable:
-        if str(name).lower() in target_names:
-            resolved.add(int(idx))
-    return resolved
-
-
-target_class_ids = resolve_class_ids(model.names, VEHICLE_CLASSES)
-
-
-def compute_parking_status(polygons, detections):
-    """Calcula status de ocupação das vagas"""
-    if not polygons:
-        return []
-    status = []
-    for pts in polygons:
-        pts_array = np.array(pts, dtype=np.int32)
-        occupied = False
-        for cx, cy in detections:
-            if cv2.pointPolygonTest(pts_array, (float(cx), float(cy)), False) >= 0:
-                occupied = True
-                break
-        status.append(occupied)
-    return status
-
-
-def draw_parking_overlay(frame, polygons, status):
-    """Desenha overlay das vagas no frame"""
-    if not polygons:
-        return
-
-    overlay = frame.copy()
-    for idx, (pts, occupied) in enumerate(zip(polygons, status), start=1):
-        pts_array = np.array(pts, dtype=np.int32)
-        color = (0, 0, 255) if occupied else (0, 255, 0)
-        cv2.fillPoly(overlay, [pts_array], color)
-    cv2.addWeighted(overlay, 0.35, frame, 0.65, 0, dst=frame)
-
-    for idx, (pts, occupied) in enumerate(zip(polygons, status), start=1):
-        pts_array = np.array(pts, dtype=np.int32)
-        color = (0, 0, 255) if occupied else (0, 255, 0)
-        cv2.polylines(frame, [pts_array], True, color, 2, cv2.LINE_AA)
-        center = tuple(np.mean(pts_array, axis=0).astype(int))
-        label = f"#{idx} {'Ocupada' if occupied else 'Livre'}"
-        cv2.putText(frame, label, center, cv2.FONT_HERSHEY_SIMPLEX,
-                   0.6, (0, 0, 0), 3, cv2.LINE_AA)
-        cv2.putText(frame, label, center, cv2.FONT_HERSHEY_SIMPLEX,
-                   0.6, (255, 255, 255), 2, cv2.LINE_AA)
-
-
-def resize_to_fit(frame, max_width=MAX_DISPLAY_WIDTH, max_height=MAX_DISPLAY_HEIGHT):
-    """Redimensiona frame mantendo aspect ratio"""
-    height, width = frame.shape[:2]
-    if width == 0 or height == 0:
-        return frame
-    scale = min(max_width / width, max_height / height, 1.0)
-    if scale < 1.0:
-        new_size = (int(width * scale), int(height * scale))
-        frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
-    return frame
-
-
-def process_camera_stream(camera_id):
-    """Processa stream de uma câmera específica"""
-    logger.info(f"Starting stream processing for camera {camera_id}")
-
-    fps_smooth = 0.0
-    prev_frame_time = None
-    cameras_last_save[camera_id] = 0.0
-
-    while camera_id in cameras_capture:
+def camera_sync_loop() -> None:
+    """Sincroniza com o Supabase em background (as requisições leem só a memória)"""
+    while True:
+        time.sleep(CAMERA_SYNC_INTERVAL)
         sync_cameras_from_supabase()
 
-        cap = cameras_capture.get(camera_id)
-        if not cap:
-            time.sleep(0.1)
-            continue
 
-        grabbed, frame, status = cap.read()
-        if not grabbed or frame is None:
-            time.sleep(0.1)
-            continue
+def mark_cameras_changed() -> None:
+    """Nova versão da listagem de câmeras (acorda os long-polls)"""
+    global cameras_version
+    with cameras_changed:
+        cameras_version += 1
+        cameras_changed.notify_all()
 
-        # Garantir resolução consistente
-        if frame.shape[1] != CAPTURE_WIDTH or frame.shape[0] != CAPTURE_HEIGHT:
-            frame = cv2.resize(frame, (CAPTURE_WIDTH, CAPTURE_HEIGHT), interpolation=cv2.INTER_AREA)
 
-        annotated_frame = frame.copy()
-        annotator = None
-        result = None
+def cameras_etag() -> str:
+    return f"{process_started_at:.0f}-{cameras_version}"
 
-        # Inferência com YOLO (GPU otimizada)
+
+def wait_cameras_change(etag: str, deadline: float) -> None:
+    """Long-poll: espera a versão mudar ou o prazo"""
+    with cameras_changed:
+        while cameras_etag() == etag:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            cameras_changed.wait(remaining)
+
+
+def get_camera_config(camera_id: str) -> Dict:
+    """Cópia rasa do config atual da câmera"""
+    with config_lock:
+        return dict(cameras_config.get(camera_id, {}))
+
+
+def notify_camera_config(camera_id: str) -> None:
+    """Repassa o config atualizado ao worker que roda a câmera (modo multiprocesso)"""
+    if worker_pool is not None and worker_pool.is_running(camera_id):
+        worker_pool.update_config(camera_id, get_camera_config(camera_id))
+
+
+def is_camera_running(camera_id: str) -> bool:
+    if worker_pool is not None:
+        return worker_pool.is_running(camera_id)
+    return supervisor.is_running(camera_id)
+
+
+def get_camera_stats(camera_id: str, default: Optional[Dict] = None) -> Optional[Dict]:
+    """Estatísticas atuais da câmera (da memória compartilhada em modo multiprocesso)"""
+    if worker_pool is not None:
+        stats = worker_pool.read_stats(camera_id)
+        if stats is not None:
+            return stats
+    return cameras_stats.get(camera_id, default)
+
+
+def public_stats(stats: Dict) -> Dict:
+    """
+    Estatísticas para a API JSON (os histogramas ficam só em /metrics), com a
+    idade atual da ocupação e do último frame exibido desde a captura.
+    """
+    public = {key: value for key, value in stats.items() if key != 'metrics'}
+    freshness = stats.get('freshness')
+    if freshness:
+        now = time.time()
+        public['freshness'] = dict(freshness)
+        for key, age_key in (('captured_at', 'age_ms'), ('display_captured_at', 'display_age_ms')):
+            if freshness.get(key):
+                public['freshness'][age_key] = round((now - freshness[key]) * 1000.0, 1)
+    return public
+
+
+def listing_stats(stats: Dict) -> Dict:
+    """
+    Parte das estatísticas que entra na listagem com ETag: só a ocupação, que
+    muda junto com a versão (occupancy_feed.update -> mark_cameras_changed).
+    """
+    if not stats:
+        return {}
+    return {
+        'occupied': stats.get('occupied', 0),
+        'free': stats.get('free', 0),
+        'total': stats.get('total', 0),
+        'spots': [
+            {'index': spot.get('index'), 'occupied': bool(spot.get('occupied'))}
+            for spot in stats.get('spots') or []
+        ],
+    }
+
+
+def publish_camera_frame(camera_id: str, frame_bytes: Optional[bytes], stats: Dict) -> None:
+    """Publica o último frame JPEG e as estatísticas de uma câmera"""
+    cameras_stats[camera_id] = stats
+    if occupancy_feed.update(camera_id, stats):
+        mark_cameras_changed()
+    if frame_bytes is not None:
+        frame_hub.publish(camera_id, frame_bytes, stats.get('freshness', {}).get('display_captured_at'))
+
+
+def mjpeg_part(frame_bytes: bytes, captured_at: Optional[float] = None) -> bytes:
+    """Parte multipart do stream MJPEG (com o momento de captura, se conhecido)"""
+    header = b'Content-Type: image/jpeg\r\n'
+    if captured_at:
+        header += b'X-Captured-At: %.3f\r\n' % captured_at
+    return b'--frame\r\n' + header + b'\r\n' + frame_bytes + b'\r\n'
+
+
+def camera_stream_url(camera_id: str) -> str:
+    return f"{STREAM_BASE_URL}/api/cameras/{camera_id}/stream"
+
+
+def run_in_background(target, *args, name: Optional[str] = None) -> None:
+    """Executa target(*args) em um thread daemon, registrando exceções no log"""
+    def runner():
         try:
-            result = model.predict(
-                annotated_frame,
-                device='cuda',
-                half=True,
-                verbose=False,
-                conf=0.25,
-                iou=0.45,
-                max_det=100,
-                classes=list(target_class_ids) if target_class_ids else None,
-            )[0]
-            annotator = Annotator(annotated_frame, line_width=2)
-        except Exception as exc:
-            logger.error(f"YOLO error on camera {camera_id}: {exc}")
-            result = None
-            annotator = None
-            annotated_frame = frame.copy()
-
-        boxes_xyxy = (
-            result.boxes.xyxy.cpu().numpy()
-            if result is not None and result.boxes is not None
-            else np.empty((0, 4))
-        )
-        classes = (
-            result.boxes.cls.int().cpu().tolist()
-            if result is not None and result.boxes is not None and result.boxes.cls is not None
-            else []
-        )
+            target(*args)
+        except Exception as e:
+            logger.error(f"Background task {name or target.__name__} failed: {e}")
 
-        vehicle_centers: List[tuple[int, int]] = []
+    threading.Thread(target=runner, name=name, daemon=True).start()
 
-        if annotator is not None and len(boxes_xyxy):
-            for xyxy, cls in zip(boxes_xyxy, classes):
-                cls_idx = int(cls) if cls is not None else None
-                if cls_idx is None:
-                    continue
 
-                class_name = (
-                    model.names.get(cls_idx, "obj")
-                    if isinstance(model.names, dict)
-                    else model.names[cls_idx]
-                )
+def camera_publisher(camera_id: str):
+    """Função publish(frame_bytes, stats) do pipeline local de uma câmera"""
+    return lambda frame_bytes, stats: publish_camera_frame(camera_id, frame_bytes, stats)
 
-                if target_class_ids and cls_idx not in target_class_ids:
-                    continue
 
-                annotator.box_label(xyxy, class_name, color=colors(cls_idx, True))
+# Pipelines locais (CAMERA_WORKERS=0): captura + thread de processamento sob watchdog
+supervisor = CameraSupervisor(
+    get_config=get_camera_config,
+    make_publisher=camera_publisher,
+)
 
-                cx = int((xyxy[0] + xyxy[2]) / 2)
-                cy = int((xyxy[1] + xyxy[3]) / 2)
-                vehicle_centers.append((cx, cy))
 
-            annotated_frame = annotator.result()
+def camera_viewers_changed(camera_id: str, watched: bool) -> None:
+    """Stream principal aberto enquanto há visualizador (e um pouco depois do último sair)"""
+    until = display_demand.hold(camera_id) if watched else display_demand.release(camera_id)
+    if worker_pool is not None:
+        worker_pool.set_display_demand(camera_id, until)
 
-        # FPS suavizado
-        frame_time = time.time()
-        if prev_frame_time is not None:
-            delta = frame_time - prev_frame_time
-            if delta > 0:
-                fps_instant = 1.0 / delta
-                fps_smooth = (
-                    fps_instant
-                    if fps_smooth == 0.0
-                    else fps_smooth * (1 - FPS_SMOOTHING_ALPHA) + FPS_SMOOTHING_ALPHA * fps_instant
-                )
-        prev_frame_time = frame_time
 
-        with config_lock:
-            cam_config = cameras_config.get(camera_id, {})
-            raw_areas = cam_config.get('areas', [])
-        areas: List[List[List[int]]] = [
-            [[int(pt[0]), int(pt[1])] for pt in polygon]
-            for polygon in raw_areas
-            if isinstance(polygon, list) and len(polygon) == 4
-        ]
-        occupied_count = 0
-        parking_status: List[bool] = []
-        spot_details: List[Dict] = []
-
-        if areas:
-            parking_status = compute_parking_status(areas, vehicle_centers)
-            occupied_count = sum(parking_status)
-            spot_details = [
-                {
-                    'index': idx,
-                    'occupied': bool(occupied),
-                    'points': area,
-                }
-                for idx, (area, occupied) in enumerate(zip(areas, parking_status))
-            ]
-            draw_parking_overlay(annotated_frame, areas, parking_status)
-
-        previous_stats = cameras_stats.get(camera_id, {})
-        previous_occupied = previous_stats.get('occupied')
-
-        cameras_stats[camera_id] = {
-            'occupied': occupied_count,
-            'free': max(len(areas) - occupied_count, 0),
-            'total': len(areas),
-            'fps': fps_smooth,
-            'spots': spot_details,
-        }
+frame_hub.viewer_listener = camera_viewers_changed
 
-        if (
-            db.is_connected()
-            and previous_occupied is not None
-            and previous_occupied != occupied_count
-        ):
-            threading.Thread(
-                target=db.log_event,
-                kwargs={
-                    'camera_id': camera_id,
-                    'event_type': 'occupancy_change',
-                    'description': f'{previous_occupied} -> {occupied_count}',
-                    'metadata': {
-                        'previous': previous_occupied,
-                        'current': occupied_count,
-                        'total': len(areas),
-                    },
-                },
-                daemon=True,
-            ).start()
-
-        if areas and db.is_connected():
-            current_time = time.time()
-            if current_time - cameras_last_save.get(camera_id, 0.0) >= OCCUPANCY_SAVE_INTERVAL:
-                cameras_last_save[camera_id] = current_time
-                free_count = len(areas) - occupied_count
-                occupancy_pct = (occupied_count / len(areas) * 100) if len(areas) else 0
-                details_payload = {
-                    'version': PARKING_DETAILS_VERSION,
-                    'spots': spot_details,
-                }
-                threading.Thread(
-                    target=db.save_occupancy,
-                    kwargs={
-                        'camera_id': camera_id,
-                        'total_spots': len(areas),
-                        'occupied_spots': occupied_count,
-                        'free_spots': free_count,
-                        'occupancy_percentage': occupancy_pct,
-                        'fps': fps_smooth,
-                        'details': details_payload,
-                    },
-                    daemon=True,
-                ).start()
-
-        # Overlay de FPS
-        cv2.putText(
-            annotated_frame,
-            f"FPS: {fps_smooth:.1f}",
-            (20, 40),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.8,
-            (0, 255, 0),
-            2,
-            cv2.LINE_AA,
-        )
 
-        annotated_frame = resize_to_fit(annotated_frame)
-        success, buffer = cv2.imencode('.jpg', annotated_frame, FRAME_JPEG_PARAMS)
-        frame_bytes = buffer.tobytes() if success else None
+def launch_camera_pipeline(camera_id: str, video_url: str) -> None:
+    """Inicia captura + processamento da câmera (thread local ou worker)"""
+    if worker_pool is not None:
+        worker_pool.start_camera(camera_id, get_camera_config(camera_id))
+        return
 
-        if not success:
-            logger.warning("Failed to encode frame for camera %s", camera_id)
+    supervisor.start_camera(camera_id)
 
-        lock = cameras_locks.get(camera_id)
-        if lock:
-            with lock:
-                cameras_frames[camera_id] = frame_bytes
 
-    logger.info(f"Stopped stream processing for camera {camera_id}")
+def shutdown_camera_pipeline(camera_id: str) -> bool:
+    """Para captura + processamento da câmera; retorna False se não estava rodando"""
+    if worker_pool is not None:
+        stopped = worker_pool.stop_camera(camera_id)
+    else:
+        stopped = supervisor.stop_camera(camera_id)
+    frame_hub.remove(camera_id)
+    occupancy_feed.remove(camera_id)
+    mark_cameras_changed()
+    return stopped
 
 
 # ========== API ENDPOINTS ==========
 
 @app.route('/api/cameras', methods=['GET'])
 def get_cameras():
-    """Lista todas as câmeras configuradas"""
-    sync_cameras_from_supabase()
-    cameras_list = []
+    """
+    Lista todas as câmeras configuradas, direto da memória. Responde 304 ao
+    If-None-Match com o ETag atual; com ?wait=<segundos> (long-poll) segura
+    a resposta até a listagem mudar. As estatísticas vivas (fps, frescor,
+    taxa, permanência) estão em /api/cameras/stats.
+    """
+    etag, body = cameras_listing()
+    wait = min(request.args.get('wait', default=0.0, type=float), CAMERAS_LONG_POLL_MAX)
+    if wait > 0 and request.if_none_match.contains(etag):
+        wait_cameras_change(etag, time.time() + wait)
+        etag, body = cameras_listing()
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-    # Buscar dados do Supabase para incluir stream_url
-    supabase_cameras = db.get_all_cameras() if db.is_connected() else []
-    supabase_dict = {cam['id']: cam for cam in supabase_cameras}
+
+def cameras_listing() -> Tuple[str, bytes]:
+    """JSON da listagem, montado uma vez por versão"""
+    global cameras_listing_cache
+    etag = cameras_etag()
+    cached = cameras_listing_cache
+    if cached is not None and cached[0] == etag:
+        return cached
 
     with config_lock:
         config_items = list(cameras_config.items())
+    cameras_list = []
     for cam_id, config in config_items:
-        # Buscar stream_url do Supabase se disponível
-        supabase_data = supabase_dict.get(cam_id, {})
-        stream_url = supabase_data.get('stream_url', '')
-
+        stats = get_camera_stats(cam_id, {})
         cameras_list.append({
             'id': cam_id,
             'name': config.get('name', ''),
             'location': config.get('location', ''),
             'url': config.get('url', ''),
             'status': config.get('status', 'offline'),
-            'stream_url': stream_url,
+            'stream_url': config.get('stream_url', ''),
             'areas_count': len(config.get('areas', [])),
-            'stats': cameras_stats.get(cam_id, {})
+            'imgsz': config.get('imgsz') or DEFAULT_IMGSZ,
+            'occupancy_engine': config.get('occupancy_engine') or OCCUPANCY_ENGINE,
+            'cascade_mode': config.get('cascade_mode') or CASCADE_MODE,
+            'priority': config.get('priority') or DEFAULT_PRIORITY,
+            'target_fps': config.get('target_fps') or DEFAULT_TARGET_FPS,
+            'stats': listing_stats(stats),
         })
-    return jsonify(cameras_list)
+    cameras_listing_cache = (etag, app.json.dumps(cameras_list).encode('utf-8'))
+    return cameras_listing_cache
+
+
+@app.route('/api/cameras/stats', methods=['GET'])
+def get_cameras_stats():
+    """Estatísticas vivas de todas as câmeras (sem ETag: mudam a cada frame)"""
+    with config_lock:
+        camera_ids = list(cameras_config)
+    live = {}
+    for cam_id in camera_ids:
+        stats = get_camera_stats(cam_id)
+        if stats:
+            live[cam_id] = {
+                'current_fps': stats.get('rate', {}).get('measured_fps'),
+                **public_stats(stats),
+            }
+    response = jsonify(live)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 @app.route('/api/cameras', methods=['POST'])
@@ -510,11 +504,7 @@ def delete_camera(camera_id):
         return jsonify({'error': 'Camera not found'}), 404
 
     # Para captura se existir
-    capture = cameras_capture.pop(camera_id, None)
-    if capture:
-        capture.stop()
-    cameras_locks.pop(camera_id, None)
-    cameras_frames.pop(camera_id, None)
+    shutdown_camera_pipeline(camera_id)
 
     camera_name = camera_data.get('name', '')
 
@@ -528,7 +518,6 @@ def delete_camera(camera_id):
     with config_lock:
         cameras_config.pop(camera_id, None)
     cameras_stats.pop(camera_id, None)
-    cameras_last_save.pop(camera_id, None)
     save_cameras_config()
     sync_cameras_from_supabase(force=True)
 
@@ -543,7 +532,8 @@ def get_snapshot(camera_id):
     if not cam_config:
         return jsonify({'error': 'Camera not found'}), 404
 
-    video_url = cam_config.get('url', '')
+    # Stream principal (resolução cheia para desenhar as vagas), não o substream da inferência
+    video_url = display_source(cam_config) or inference_source(cam_config)
 
     try:
         # Usa MESMA configuração que VideoCapture para consistência
@@ -572,16 +562,69 @@ def get_snapshot(camera_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/cameras/<camera_id>/evidence', methods=['POST'])
+def capture_camera_evidence(camera_id):
+    """Grava agora o buffer de evidência da câmera (últimos segundos do stream)"""
+    if not is_camera_running(camera_id):
+        return jsonify({'error': 'Camera not running'}), 404
+
+    if worker_pool is not None:
+        clip_id = new_clip_id('manual')
+        worker_pool.capture_evidence(camera_id, clip_id)
+        clip = {'id': clip_id, 'camera_id': camera_id, 'reason': 'manual', 'path': str(clip_dir(camera_id, clip_id))}
+    else:
+        clip = evidence_store.capture(camera_id, 'manual')
+        if clip is None:
+            return jsonify({'error': 'No buffered frames'}), 409
+
+    run_in_background(
+        db.log_event, camera_id, 'evidence_captured', f"Evidence clip {clip['id']}", {'clips': [clip]},
+        name=f"Evidence-{camera_id}",
+    )
+    # A gravação é assíncrona: o clipe aparece em GET .../evidence/<id> quando completo
+    return jsonify(clip), 202
+
+
+@app.route('/api/cameras/<camera_id>/evidence', methods=['GET'])
+def get_camera_evidence(camera_id):
+    """Clipes de evidência gravados da câmera (mais recentes primeiro)"""
+    return jsonify(list_clips(camera_id))
+
+
+@app.route('/api/cameras/<camera_id>/evidence/<clip_id>', methods=['GET'])
+def get_evidence_clip(camera_id, clip_id):
+    """Índice do clipe: frames com o momento de captura de cada um"""
+    clip = load_clip(camera_id, clip_id)
+    if clip is None:
+        return jsonify({'error': 'Clip not found'}), 404
+    return jsonify(clip)
+
+
+@app.route('/api/cameras/<camera_id>/evidence/<clip_id>/<filename>', methods=['GET'])
+def get_evidence_frame(camera_id, clip_id, filename):
+    return send_from_directory(clip_dir(camera_id, clip_id).resolve(), filename, mimetype='image/jpeg')
+
+
 @app.route('/api/cameras/<camera_id>/areas', methods=['POST'])
 def save_camera_areas(camera_id):
-    """Salva as áreas desenhadas para uma câmera"""
+    """
+    Salva as áreas desenhadas para uma câmera.
+
+    Aceita pontos em pixels (com `width`/`height` do frame em que foram
+    desenhados; default é o tamanho do snapshot) ou já normalizados (0..1).
+    """
     data = request.json
-    areas = data.get('areas', [])
+    reference = parse_reference_size(
+        [data.get('width'), data.get('height')],
+        default=(CAPTURE_WIDTH, CAPTURE_HEIGHT),
+    )
+    areas = normalize_areas(data.get('areas', []), reference)
 
     with config_lock:
         if camera_id not in cameras_config:
             return jsonify({'error': 'Camera not found'}), 404
         cameras_config[camera_id]['areas'] = areas
+        cameras_config[camera_id]['areas_reference_size'] = list(reference)
         current_fps = cameras_stats.get(camera_id, {}).get('fps', 0.0)
 
     cameras_stats[camera_id] = {
@@ -591,12 +634,13 @@ def save_camera_areas(camera_id):
         'fps': current_fps,
         'spots': [
             {'index': idx, 'occupied': False, 'points': area}
-            for idx, area in enumerate(areas)
+            for idx, area in enumerate(scale_areas(areas, CAPTURE_WIDTH, CAPTURE_HEIGHT))
         ],
     }
     save_cameras_config()
+    notify_camera_config(camera_id)
 
-    # Salva áreas no Supabase
+    # Salva áreas no Supabase (coordenadas normalizadas)
     areas_formatted = [{'points': area} for area in areas]
     db.save_parking_areas(camera_id, areas_formatted)
     db.log_event(camera_id, 'areas_configured', f'{len(areas)} parking areas configured')
@@ -605,6 +649,128 @@ def save_camera_areas(camera_id):
     return jsonify({'message': 'Areas saved successfully', 'count': len(areas)})
 
 
+# Configurações por câmera ajustáveis pela API (validador por campo)
+CAMERA_SETTINGS = {
+    'occupancy_engine': lambda value: value if value in ('detector', 'patch') else None,
+    'cascade_mode': lambda value: value if value in CASCADE_MODES else None,
+    'imgsz': parse_imgsz,
+    'target_fps': parse_target_fps,
+    'priority': parse_priority,
+    'interpolate': lambda value: value if isinstance(value, bool) else None,
+    'confirm_on_seconds': parse_confirm_seconds,
+    'confirm_off_seconds': parse_confirm_seconds,
+    'max_frame_age': camera_pipeline.parse_max_frame_age,
+    'inference_url': parse_stream_url,  # 'auto' deriva o substream Hikvision de `url` (vale no próximo start)
+    'display_url': parse_stream_url,
+}
+
+
+@app.route('/api/cameras/<camera_id>/settings', methods=['PUT'])
+def update_camera_settings(camera_id):
+    """Atualiza configurações locais da câmera (motor de ocupação, imgsz, ...)"""
+    data = request.get_json(silent=True) or {}
+    updates = {}
+    for field, value in data.items():
+        validator = CAMERA_SETTINGS.get(field)
+        if validator is None:
+            return jsonify({'error': f'Unknown setting: {field}'}), 400
+        try:
+            parsed = validator(value) if value is not None else None
+        except (TypeError, ValueError):
+            parsed = None
+        if value is not None and parsed is None:
+            return jsonify({'error': f'Invalid value for {field}: {value}'}), 400
+        updates[field] = parsed
+
+    with config_lock:
+        if camera_id not in cameras_config:
+            return jsonify({'error': 'Camera not found'}), 404
+        for field, value in updates.items():
+            if value is None:
+                cameras_config[camera_id].pop(field, None)
+            else:
+                cameras_config[camera_id][field] = value
+        settings = {field: cameras_config[camera_id].get(field) for field in CAMERA_SETTINGS}
+    save_cameras_config()
+    notify_camera_config(camera_id)
+
+    return jsonify({'message': 'Settings updated successfully', 'settings': settings})
+
+
+@app.route('/api/cameras/<camera_id>/calibrate', methods=['POST'])
+def calibrate_camera(camera_id):
+    """
+    Calibra o imgsz da câmera a partir de frames reais.
+
+    A câmera precisa estar rodando. Amostra alguns frames, compara as
+    detecções de cada tamanho candidato com o maior e salva o menor imgsz
+    que mantém o recall acima do limiar. Sem veículos suficientes nas vagas
+    o resultado é inconclusivo (409) e nada é salvo.
+    """
+    data = request.get_json(silent=True) or {}
+    candidates = IMGSZ_CANDIDATES
+    if data.get('candidates') is not None:
+        candidates = parse_imgsz_candidates(data['candidates'])
+        if candidates is None:
+            return jsonify({'error': 'candidates must be a list of positive multiples of 32'}), 400
+    with config_lock:
+        cam_config = cameras_config.get(camera_id)
+        raw_areas = cam_config.get('areas', []) if cam_config else []
+    if cam_config is None:
+        return jsonify({'error': 'Camera not found'}), 404
+
+    if worker_pool is not None:
+        return jsonify({'error': 'Calibration is only available with in-process cameras (CAMERA_WORKERS=0)'}), 409
+
+    cap = supervisor.get_capture(camera_id)
+    if not cap:
+        return jsonify({'error': 'Camera not running'}), 409
+
+    frame_count = max(1, int(data.get('frames', CALIBRATION_FRAMES)))
+    frames = []
+    deadline = time.time() + frame_count * CALIBRATION_FRAME_INTERVAL + 10.0
+    while len(frames) < frame_count and time.time() < deadline:
+        grabbed, frame, _ = cap.read()
+        if grabbed and frame is not None:
+            if frame.shape[1] != CAPTURE_WIDTH or frame.shape[0] != CAPTURE_HEIGHT:
+                frame = cv2.resize(frame, (CAPTURE_WIDTH, CAPTURE_HEIGHT), interpolation=cv2.INTER_AREA)
+            frames.append(frame)
+        time.sleep(CALIBRATION_FRAME_INTERVAL)
+
+    if not frames:
+        return jsonify({'error': 'No frames available for calibration'}), 503
+
+    try:
+        report = calibrate_imgsz(
+            frames,
+            detect_boxes,
+            scale_areas(raw_areas, CAPTURE_WIDTH, CAPTURE_HEIGHT),
+            candidates=candidates,
+            recall_threshold=float(data.get('recall_threshold', RECALL_THRESHOLD)),
+        )
+    except Exception as e:
+        logger.error(f"Calibration failed for camera {camera_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    if report['inconclusive']:
+        logger.warning("Calibration inconclusive for camera %s: %d reference detections",
+                       camera_id, report['reference_detections'])
+        return jsonify({'error': 'Not enough vehicles in the spots to calibrate', 'report': report}), 409
+
+    with config_lock:
+        if camera_id in cameras_config:
+            cameras_config[camera_id]['imgsz'] = report['imgsz']
+            cameras_config[camera_id]['imgsz_calibration'] = {
+                key: report[key] for key in ('reference_imgsz', 'recall_threshold', 'frames')
+            }
+    save_cameras_config()
+    notify_camera_config(camera_id)
+    logger.info("Camera %s calibrated to imgsz=%s", camera_id, report['imgsz'])
+    db.log_event(camera_id, 'imgsz_calibrated', f"imgsz set to {report['imgsz']}", metadata=report)
+
+    return jsonify(report)
+
+
 @app.route('/api/cameras/<camera_id>/start', methods=['POST'])
 def start_camera(camera_id):
     """Inicia o processamento de uma câmera"""
@@ -614,29 +780,22 @@ def start_camera(camera_id):
     if cam_config is None:
         return jsonify({'error': 'Camera not found'}), 404
 
-    if camera_id in cameras_capture:
+    if is_camera_running(camera_id):
         return jsonify({'message': 'Camera already running'})
 
     video_url = cam_config.get('url', '')
 
     try:
-        # Inicia captura
-        cap = VideoCapture(video_url, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT).start()
-        cameras_capture[camera_id] = cap
-        cameras_locks[camera_id] = threading.Lock()
-        cameras_frames[camera_id] = None
+        stream_url = camera_stream_url(camera_id)
         with config_lock:
             cameras_config[camera_id]['status'] = 'online'
-
-        # Inicia thread de processamento
-        thread = threading.Thread(target=process_camera_stream, args=(camera_id,), daemon=True)
-        thread.start()
+            cameras_config[camera_id]['stream_url'] = stream_url
+        launch_camera_pipeline(camera_id, video_url)
 
         save_cameras_config()
 
         # Atualiza status e stream_url no Supabase
         db.update_camera_status(camera_id, 'online')
-        stream_url = f"{STREAM_BASE_URL}/api/cameras/{camera_id}/stream"
         db.update_camera_stream_url(camera_id, stream_url)
         db.log_event(camera_id, 'camera_online', f'Camera started processing')
         sync_cameras_from_supabase(force=True)
@@ -652,23 +811,22 @@ def start_camera(camera_id):
 @app.route('/api/cameras/<camera_id>/stop', methods=['POST'])
 def stop_camera(camera_id):
     """Para o processamento de uma câmera"""
-    capture = cameras_capture.pop(camera_id, None)
-    if not capture:
+    if not shutdown_camera_pipeline(camera_id):
         return jsonify({'message': 'Camera not running'})
 
-    capture.stop()
-    cameras_locks.pop(camera_id, None)
-    cameras_frames.pop(camera_id, None)
-    cameras_last_save.pop(camera_id, None)
     with config_lock:
         if camera_id in cameras_config:
             cameras_config[camera_id]['status'] = 'offline'
-    save_cameras_config()
 
-    # Atualiza status no Supabase
-    db.update_camera_status(camera_id, 'offline')
-    db.log_event(camera_id, 'camera_offline', f'Camera stopped processing')
-    sync_cameras_from_supabase(force=True)
+    def finish_stop():
+        save_cameras_config()
+        # Atualiza status no Supabase
+        db.update_camera_status(camera_id, 'offline')
+        db.log_event(camera_id, 'camera_offline', f'Camera stopped processing')
+        sync_cameras_from_supabase(force=True)
+
+    # A captura é encerrada em background; o registro no Supabase também não segura a resposta
+    run_in_background(finish_stop, name=f"StopCamera-{camera_id}")
 
     return jsonify({'message': 'Camera stopped successfully'})
 
@@ -676,41 +834,54 @@ def stop_camera(camera_id):
 @app.route('/api/cameras/<camera_id>/stream')
 def camera_stream(camera_id):
     """Stream de vídeo processado da câmera"""
-    def generate():
-        while camera_id in cameras_frames:
-            lock = cameras_locks.get(camera_id)
-            if lock:
-                with lock:
-                    frame_data = cameras_frames.get(camera_id)
-            else:
-                frame_data = cameras_frames.get(camera_id)
+    return Response(generate_stream(camera_id), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-            if frame_data is None:
-                time.sleep(0.01)
-                continue
-
-            if isinstance(frame_data, bytes):
-                frame_bytes = frame_data
-            else:
-                ret, buffer = cv2.imencode('.jpg', frame_data)
-                if not ret:
-                    continue
-                frame_bytes = buffer.tobytes()
 
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+def generate_stream(camera_id):
+    """Stream MJPEG: cada parte é um frame novo publicado no frame_hub"""
+    last_seq = -1
+    with frame_hub.watch(camera_id):
+        while is_camera_running(camera_id):
+            frame = frame_hub.wait(camera_id, last_seq, STREAM_WAIT_TIMEOUT)
+            if frame is None:
+                continue
+            last_seq, frame_bytes, captured_at = frame
+            yield mjpeg_part(frame_bytes, captured_at)
+
+
+@app.route('/api/occupancy/events')
+def occupancy_events():
+    """
+    Push (SSE) das mudanças de vaga: snapshot inicial e depois só deltas.
+    Reconexão com Last-Event-ID (ou ?since=) recebe apenas o que perdeu.
+    """
+    cameras = parse_camera_filter(request.args.get('cameras'))
+    last_seq = occupancy_feed.parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    return Response(
+        generate_occupancy_events(last_seq, cameras),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def generate_occupancy_events(last_seq: Optional[int], cameras: Optional[Set[str]]):
+    while True:
+        events, last_seq = occupancy_feed.read(last_seq, cameras)
+        for event in events:
+            yield sse_message(event)
+        if not events:
+            occupancy_feed.wait(last_seq, FEED_KEEPALIVE_SECONDS)
+            if occupancy_feed.seq == last_seq:
+                yield SSE_KEEPALIVE
 
 
 @app.route('/api/cameras/<camera_id>/status', methods=['GET'])
 def get_camera_status(camera_id):
     """Retorna status atual das vagas de uma câmera"""
-    sync_cameras_from_supabase()
     if camera_id not in cameras_config:
         return jsonify({'error': 'Camera not found'}), 404
 
-    stats = cameras_stats.get(camera_id, {
+    stats = get_camera_stats(camera_id, {
         'occupied': 0,
         'free': 0,
         'total': 0,
@@ -718,15 +889,45 @@ def get_camera_status(camera_id):
         'spots': []
     })
 
-    return jsonify(stats)
+    return jsonify(public_stats(stats))
 
 
 @app.route('/api/cameras/<camera_id>/history', methods=['GET'])
 def get_camera_history(camera_id):
-    """Retorna histórico de ocupação de uma câmera"""
+    """
+    Retorna histórico de ocupação de uma câmera. Com ?points=N ou
+    ?bucket=<segundos> devolve a série reduzida para gráfico
+    (method=buckets com média/mín/máx por janela, ou method=lttb), para
+    janelas de até MAX_HISTORY_HOURS.
+    """
     hours = request.args.get('hours', default=24, type=int)
-    history = db.get_occupancy_history(camera_id, hours)
-    return jsonify(history)
+    if 'points' not in request.args and 'bucket' not in request.args:
+        history = db.get_occupancy_history(camera_id, hours)
+        return jsonify(history)
+
+    if parse_hours(hours) is None:
+        return jsonify({'error': f'hours must be between 1 and {MAX_HISTORY_HOURS}'}), 400
+    points = parse_points(request.args.get('points')) if 'points' in request.args else None
+    bucket = parse_bucket_seconds(request.args.get('bucket')) if 'bucket' in request.args else None
+    method = parse_method(request.args.get('method', 'buckets'))
+    if ('points' in request.args and points is None) or ('bucket' in request.args and bucket is None) or method is None:
+        return jsonify({'error': 'Invalid points, bucket or method'}), 400
+
+    rows = db.get_occupancy_series(camera_id, hours, SERIES_COLUMNS)
+    if method == 'lttb':
+        threshold = points or max(2, round(hours * 3600 / bucket))
+        series = lttb(rows, threshold)
+    else:
+        bucket = bucket or bucket_seconds_for(hours * 3600, points)
+        series = bucket_series(rows, bucket)
+    return jsonify({
+        'camera_id': camera_id,
+        'hours': hours,
+        'method': method,
+        'bucket_seconds': bucket if method == 'buckets' else None,
+        'raw_count': len(rows),
+        'points': series,
+    })
 
 
 @app.route('/api/cameras/<camera_id>/events', methods=['GET'])
@@ -752,60 +953,323 @@ def get_realtime_stats():
     return jsonify(stats)
 
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Latência por etapa, frames descartados/duplicados, reconexões, filas e cache (formato Prometheus)"""
+    with config_lock:
+        camera_ids = list(cameras_config)
+    cameras = {
+        camera_id: get_camera_stats(camera_id) if is_camera_running(camera_id) else None
+        for camera_id in camera_ids
+    }
+    process_queues = camera_pipeline.queue_depths() if worker_pool is None else {}
+    caches = {'supabase': db.cache_stats()}
+    return Response(render_prometheus(cameras, process_queues, caches), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     return jsonify({
         'message': 'Parking Monitoring API',
         'cameras': len(cameras_config),
-        'active': len(cameras_capture),
-        'supabase_connected': db.is_connected()
+        'active': sum(1 for camera_id in list(cameras_config) if is_camera_running(camera_id)),
+        'supabase_connected': db.is_connected(),
+        'workers': worker_pool.workers_info() if worker_pool is not None else [],
+        'inference_load': rate_controller.load() if worker_pool is None else None,
+    })
+
+
+def configured_imgsz_values() -> List[int]:
+    with config_lock:
+        return sorted({int(config.get('imgsz') or DEFAULT_IMGSZ) for config in cameras_config.values()})
+
+
+@app.route('/api/admin/model', methods=['GET'])
+def get_model_status():
+    """Modelo ativo, estado da última troca e relatório da avaliação sombra"""
+    if worker_pool is not None:
+        report = worker_pool.model_report()
+        return jsonify({
+            'mode': 'workers',
+            'active': report['active'] or MODEL_PATH,
+            'swap': report['swap'],
+            'shadow': None,
+            'workers': report['workers'],
+        })
+    evaluator = camera_pipeline.shadow_evaluator
+    return jsonify({
+        'mode': 'threads',
+        'active': camera_pipeline.active_model_path,
+        'swap': model_swapper.status,
+        'shadow': evaluator.report() if evaluator is not None else None,
     })
 
 
+@app.route('/api/admin/model', methods=['POST'])
+def swap_active_model():
+    """
+    Carrega, aquece e troca o modelo em background, sem parar os streams.
+
+    Body: {"path": "yolo11m.pt"}. Acompanhe em GET /api/admin/model.
+    """
+    data = request.get_json(silent=True) or {}
+    path = data.get('path')
+    if not is_valid_model_path(path):
+        return jsonify({'error': 'path must be a model file (.pt, .onnx, .engine, .torchscript)'}), 400
+
+    if worker_pool is not None:
+        worker_pool.swap_model(path)
+        return jsonify({'message': 'Model swap requested on all workers', 'path': path}), 202
+
+    if not model_swapper.start(path, configured_imgsz_values()):
+        return jsonify({'error': 'A model swap is already in progress', 'swap': model_swapper.status}), 409
+    logger.info(f"Model swap to {path} requested")
+    return jsonify({'message': 'Model swap started', 'swap': model_swapper.status}), 202
+
+
+@app.route('/api/admin/model/shadow', methods=['POST'])
+def start_shadow_model():
+    """Body: {"path": "yolo11n.pt", "sample_rate": 0.1}"""
+    if worker_pool is not None:
+        return jsonify({'error': 'Shadow evaluation is only available with in-process cameras (CAMERA_WORKERS=0)'}), 409
+    data = request.get_json(silent=True) or {}
+    path = data.get('path')
+    if not is_valid_model_path(path):
+        return jsonify({'error': 'path must be a model file (.pt, .onnx, .engine, .torchscript)'}), 400
+    try:
+        sample_rate = float(data.get('sample_rate', SHADOW_SAMPLE_RATE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_rate must be a number'}), 400
+    if not 0.0 < sample_rate <= 1.0:
+        return jsonify({'error': 'sample_rate must be in (0, 1]'}), 400
+
+    evaluator = start_shadow(path, sample_rate)
+    return jsonify({'message': 'Shadow evaluation started', 'shadow': evaluator.report()}), 202
+
+
+@app.route('/api/admin/model/shadow', methods=['DELETE'])
+def stop_shadow_model():
+    """Encerra a avaliação sombra e devolve o relatório final"""
+    report = stop_shadow()
+    if report is None:
+        return jsonify({'message': 'No shadow evaluation running'})
+    return jsonify({'message': 'Shadow evaluation stopped', 'shadow': report})
+
+
+@app.route('/api/startup', methods=['GET'])
+def get_startup_status():
+    """Prontidão de cada câmera desde o boot (primeiro frame publicado)"""
+    if worker_pool is not None:
+        cameras = worker_pool.readiness()
+    else:
+        cameras = {
+            camera_id: {key: health[key] for key in ('ready', 'startup_seconds', 'state')}
+            for camera_id, health in supervisor.health().items()
+        }
+    ready = sum(1 for info in cameras.values() if info['ready'])
+    return jsonify({
+        'elapsed': round(time.time() - startup_started_at, 2) if startup_started_at else None,
+        'total': len(cameras),
+        'ready': ready,
+        'pending': len(cameras) - ready,
+        'cameras': cameras,
+    })
+
+
+@app.route('/api/supervisor', methods=['GET'])
+def get_supervisor_health():
+    """Saúde dos pipelines: estado, idade do último frame/heartbeat e reinícios"""
+    if worker_pool is not None:
+        return jsonify({'mode': 'workers', 'workers': worker_pool.workers_info()})
+    return jsonify({'mode': 'threads', 'cameras': supervisor.health()})
+
+
+def auto_start_camera(camera_id: str, config: Dict) -> None:
+    """Inicia uma câmera no boot e registra no Supabase (roda no pool de startup)"""
+    try:
+        logger.info(f"Auto-starting camera {camera_id} ({config.get('name')})")
+        video_url = config.get('url', '')
+        launch_camera_pipeline(camera_id, video_url)
+
+        # Atualiza stream_url (memória + Supabase)
+        stream_url = camera_stream_url(camera_id)
+        with config_lock:
+            if camera_id in cameras_config:
+                cameras_config[camera_id]['stream_url'] = stream_url
+        mark_cameras_changed()
+        db.update_camera_stream_url(camera_id, stream_url)
+        db.log_event(camera_id, 'camera_online', f'Camera auto-started on server boot')
+
+        logger.info(f"Camera {camera_id} launched with stream URL: {stream_url}")
+    except Exception as e:
+        logger.error(f"Failed to auto-start camera {camera_id}: {e}")
+        with config_lock:
+            if camera_id in cameras_config:
+                cameras_config[camera_id]['status'] = 'offline'
+        mark_cameras_changed()
+        db.update_camera_status(camera_id, 'offline')
+        db.log_event(camera_id, 'camera_error', f'Failed to auto-start: {str(e)}')
+
+
 def auto_start_online_cameras():
-    """Inicia automaticamente câmeras marcadas como online"""
-    sync_cameras_from_supabase(force=True)
+    """
+    Inicia automaticamente câmeras marcadas como online.
+
+    As câmeras sobem em paralelo (até STARTUP_CONCURRENCY); cada uma fica
+    pronta ao publicar o primeiro frame, sem esperar as demais. O progresso
+    aparece em /api/startup.
+    """
+    global startup_started_at
+    startup_started_at = time.time()
     with config_lock:
         config_items = [
             (camera_id, config.copy())
             for camera_id, config in cameras_config.items()
+            if config.get('status') == 'online' and len(config.get('areas', [])) > 0
         ]
-    for camera_id, config in config_items:
-        if config.get('status') == 'online' and len(config.get('areas', [])) > 0:
-            try:
-                logger.info(f"Auto-starting camera {camera_id} ({config.get('name')})")
-                video_url = config.get('url', '')
-
-                # Inicia captura
-                cap = VideoCapture(video_url, width=CAPTURE_WIDTH, height=CAPTURE_HEIGHT).start()
-                cameras_capture[camera_id] = cap
-                cameras_locks[camera_id] = threading.Lock()
-                cameras_frames[camera_id] = None
-
-                # Inicia thread de processamento
-                thread = threading.Thread(target=process_camera_stream, args=(camera_id,), daemon=True)
-                thread.start()
-
-                # Atualiza stream_url no Supabase
-                stream_url = f"{STREAM_BASE_URL}/api/cameras/{camera_id}/stream"
-                db.update_camera_stream_url(camera_id, stream_url)
-                db.log_event(camera_id, 'camera_online', f'Camera auto-started on server boot')
-
-                logger.info(f"Camera {camera_id} started successfully with stream URL: {stream_url}")
-            except Exception as e:
-                logger.error(f"Failed to auto-start camera {camera_id}: {e}")
-                cameras_config[camera_id]['status'] = 'offline'
-                db.update_camera_status(camera_id, 'offline')
-                db.log_event(camera_id, 'camera_error', f'Failed to auto-start: {str(e)}')
+    with ThreadPoolExecutor(max_workers=max(1, STARTUP_CONCURRENCY), thread_name_prefix="AutoStart") as executor:
+        for camera_id, config in config_items:
+            executor.submit(auto_start_camera, camera_id, config)
+    logger.info(f"Launched {len(config_items)} cameras in {time.time() - startup_started_at:.1f}s")
+
+
+@contextmanager
+def startup_phase(name: str):
+    """Registra início, duração e erro de uma fase do startup"""
+    phase = {'status': 'running', 'started_at': round(time.time() - process_started_at, 3)}
+    startup_phases[name] = phase
+    started = time.perf_counter()
+    try:
+        yield phase
+    except Exception as e:
+        phase['status'] = 'failed'
+        phase['error'] = str(e)
+        logger.error(f"Startup phase {name} failed: {e}")
+    else:
+        phase['status'] = 'done'
+    finally:
+        phase['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Startup phase {name}: {phase['status']} in {phase['seconds']:.2f}s")
 
 
-if __name__ == "__main__":
-    load_cameras_config()
-    sync_cameras_from_supabase(force=True)
+def skip_startup_phase(name: str, reason: str) -> None:
+    startup_phases[name] = {'status': 'skipped', 'reason': reason}
+
+
+def load_and_warm_model():
+    """Carrega o YOLO e roda inferências de aquecimento em cada imgsz configurado"""
+    with startup_phase('model_load'):
+        get_model()
+    if startup_phases['model_load']['status'] != 'done':
+        skip_startup_phase('warmup', 'model not loaded')
+        return
+    with startup_phase('warmup') as phase:
+        phase['imgsz'] = configured_imgsz_values() or [DEFAULT_IMGSZ]
+        for imgsz in phase['imgsz']:
+            warm_up_model(imgsz)
+
+
+def connect_and_start_cameras():
+    """Conecta ao Supabase, sincroniza as câmeras e inicia as que estão online"""
+    with startup_phase('supabase') as phase:
+        phase['connected'] = db.connect() is not None
+        sync_cameras_from_supabase(force=True)
+    threading.Thread(target=camera_sync_loop, name="CameraSync", daemon=True).start()
+    with startup_phase('cameras'):
+        auto_start_online_cameras()
+
+
+def background_startup():
+    """
+    Startup pesado fora do caminho das requisições: o Flask já atende
+    config/histórico enquanto o modelo carrega e as câmeras sobem.
+    """
+    if CAMERA_WORKERS == 0:
+        threading.Thread(target=load_and_warm_model, name="ModelStartup", daemon=True).start()
+    connect_and_start_cameras()
+
+
+def readiness_phases() -> Dict[str, Dict]:
+    """Fases do startup; em modo worker, carga e aquecimento vêm do estado publicado pelos workers"""
+    phases = {name: startup_phases.get(name, {'status': 'pending'}) for name in READINESS_PHASES}
+    if worker_pool is not None:
+        report = worker_pool.model_report()
+        phases['model_load'], phases['warmup'] = report['model_load'], report['warmup']
+    return phases
+
+
+def active_model() -> str:
+    if worker_pool is not None:
+        return worker_pool.model_report()['active'] or MODEL_PATH
+    return camera_pipeline.active_model_path
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: o processo está de pé e atendendo"""
+    return jsonify({
+        'status': 'ok',
+        'uptime': round(time.time() - process_started_at, 2),
+        'phases': {**startup_phases, **readiness_phases()},
+    })
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: Supabase, modelo, aquecimento e auto-start concluídos"""
+    phases = readiness_phases()
+    ready = all(phase.get('status') in ('done', 'skipped') for phase in phases.values())
+    body = {
+        'ready': ready,
+        'model': active_model(),
+        'uptime': round(time.time() - process_started_at, 2),
+        'phases': phases,
+    }
+    return jsonify(body), (200 if ready else 503)
+
+
+def poll_worker_occupancy() -> None:
+    """Modo worker: as estatísticas ficam na memória compartilhada; alimenta o feed de ocupação"""
+    while worker_pool is not None:
+        with config_lock:
+            camera_ids = list(cameras_config)
+        for camera_id in camera_ids:
+            if worker_pool.is_running(camera_id):
+                stats = worker_pool.read_stats(camera_id)
+                if stats is not None and occupancy_feed.update(camera_id, stats):
+                    mark_cameras_changed()
+        time.sleep(OCCUPANCY_POLL_INTERVAL)
+
+
+def start_backend() -> None:
+    """Carrega o config e sobe supervisor/workers; o resto do startup segue em background"""
+    global worker_pool, frame_pump
+    with startup_phase('config'):
+        load_cameras_config()
     logger.info(f"Starting API server with {len(cameras_config)} cameras")
 
-    # Inicia câmeras online em background
-    startup_thread = threading.Thread(target=auto_start_online_cameras, daemon=True)
+    if CAMERA_WORKERS > 0:
+        worker_pool = CameraWorkerPool(CAMERA_WORKERS).start()
+        frame_pump = FrameHubPump(frame_hub, worker_pool.read_frame).start()
+        threading.Thread(target=poll_worker_occupancy, name="OccupancyFeed", daemon=True).start()
+    else:
+        supervisor.start()
+
+    # Supabase, modelo e câmeras sobem em background; o servidor atende desde já
+    startup_thread = threading.Thread(target=background_startup, name="Startup", daemon=True)
     startup_thread.start()
 
+
+def stop_backend() -> None:
+    """Para as câmeras (usado pelo modo ASGI no encerramento)"""
+    if frame_pump is not None:
+        frame_pump.stop()
+    if worker_pool is not None:
+        worker_pool.shutdown()
+    else:
+        supervisor.shutdown()
+
+
+if __name__ == "__main__":
+    start_backend()
     app.run(host="0.0.0.0", port=5000, debug=False, threaded=True, ssl_context=('cert.pem', 'key.pem'))
@@ -0,0 +1,286 @@
+"""
+Modo de serviço ASGI/asyncio.
+
+Alternativa ao servidor Flask com `threaded=True`, que dedica um thread a
+cada conexão MJPEG. Aqui os streams são corrotinas que esperam o próximo
+frame no frame_hub (sem thread por visualizador), assim como o feed de
+ocupação (SSE e WebSocket em /api/occupancy/ws); os demais endpoints são
+os mesmos da API Flask, executados em um pool fixo de threads. Os pipelines
+das câmeras continuam nos seus threads/processos.
+
+    pip install uvicorn
+    python asgi_server.py
+    # ou: uvicorn asgi_server:app --host 0.0.0.0 --port 5000 --ssl-certfile cert.pem --ssl-keyfile key.pem
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote
+
+import api_server
+from api_server import STREAM_WAIT_TIMEOUT, app as flask_app, is_camera_running, mjpeg_part
+from frame_hub import frame_hub
+from occupancy_feed import FEED_KEEPALIVE_SECONDS, SSE_KEEPALIVE, occupancy_feed, parse_camera_filter, sse_message
+
+logger = logging.getLogger(__name__)
+
+API_PORT = int(os.getenv('API_PORT', '5000'))
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '32'))  # Requisições comuns (JSON) em paralelo
+SSL_CERT_FILE = 'cert.pem'
+SSL_KEY_FILE = 'key.pem'
+
+STREAM_PATH = re.compile(r'^/api/cameras/([^/]+)/stream$')
+OCCUPANCY_EVENTS_PATH = '/api/occupancy/events'
+OCCUPANCY_SOCKET_PATH = '/api/occupancy/ws'
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """Ambiente WSGI (PEP 3333) equivalente ao scope HTTP do ASGI"""
+    server_name, server_port = scope.get('server') or ('localhost', API_PORT)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # Upload chunked não traz Content-Length; sem ele o Flask leria corpo vazio
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))
+    return environ
+
+
+def run_wsgi(environ: Dict) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    """Executa a app Flask e devolve a resposta inteira (endpoints não-stream)"""
+    response: Dict = {}
+    chunks: List[bytes] = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+async def read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def serve_wsgi(scope: Dict, receive, send) -> None:
+    body = await read_body(receive)
+    loop = asyncio.get_running_loop()
+    status, headers, payload = await loop.run_in_executor(wsgi_executor, run_wsgi, build_environ(scope, body))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def serve_stream(camera_id: str, receive, send) -> None:
+    """Stream MJPEG como corrotina: acorda a cada frame novo da câmera"""
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = asyncio.create_task(watch_disconnect())
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+            (b'cache-control', b'no-cache'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    last_seq = -1
+    try:
+        with frame_hub.watch(camera_id):
+            while not disconnected.is_set() and is_camera_running(camera_id):
+                frame = await frame_hub.wait_async(camera_id, last_seq, STREAM_WAIT_TIMEOUT)
+                if frame is None or disconnected.is_set():
+                    continue
+                last_seq, frame_bytes, captured_at = frame
+                await send({'type': 'http.response.body', 'body': mjpeg_part(frame_bytes, captured_at), 'more_body': True})
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        pass  # Cliente caiu no meio do envio
+    finally:
+        watcher.cancel()
+
+
+def feed_position(scope: Dict) -> Tuple[Optional[int], Optional[Set[str]]]:
+    """Posição de retomada (Last-Event-ID ou ?since=) e filtro ?cameras= do feed"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    headers = dict(scope.get('headers', []))
+    last_event_id = headers.get(b'last-event-id', b'').decode('latin-1') or query.get('since', [''])[0]
+    return occupancy_feed.parse_event_id(last_event_id), parse_camera_filter(query.get('cameras', [''])[0])
+
+
+async def wait_for_feed(last_seq: int, watcher: asyncio.Task) -> None:
+    """Espera evento novo no feed, keepalive ou a desconexão do cliente"""
+    waiter = asyncio.ensure_future(occupancy_feed.wait_async(last_seq, FEED_KEEPALIVE_SECONDS))
+    await asyncio.wait({waiter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+
+
+async def until_message(receive, message_type: str) -> None:
+    while (await receive())['type'] != message_type:
+        pass  # Mensagens do cliente são ignoradas
+
+
+async def serve_occupancy_events(scope: Dict, receive, send) -> None:
+    """Feed de ocupação em SSE (mesmo formato de /api/occupancy/events no Flask)"""
+    last_seq, cameras = feed_position(scope)
+    watcher = asyncio.create_task(until_message(receive, 'http.disconnect'))
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    try:
+        while not watcher.done():
+            events, last_seq = occupancy_feed.read(last_seq, cameras)
+            if events:
+                body = b''.join(sse_message(event) for event in events)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                continue
+            await wait_for_feed(last_seq, watcher)
+            if occupancy_feed.seq == last_seq and not watcher.done():
+                await send({'type': 'http.response.body', 'body': SSE_KEEPALIVE, 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+
+
+async def serve_occupancy_socket(scope: Dict, receive, send) -> None:
+    """
+    Feed de ocupação por WebSocket: cada mensagem é um evento JSON (o
+    primeiro é o snapshot ou o replay a partir de ?since=).
+    """
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+    last_seq, cameras = feed_position(scope)
+    watcher = asyncio.create_task(until_message(receive, 'websocket.disconnect'))
+    try:
+        while not watcher.done():
+            events, last_seq = occupancy_feed.read(last_seq, cameras)
+            for event in events:
+                await send({'type': 'websocket.send', 'text': json.dumps(event)})
+            if not events:
+                await wait_for_feed(last_seq, watcher)
+                if occupancy_feed.seq == last_seq and not watcher.done():
+                    await send({'type': 'websocket.send', 'text': json.dumps({'type': 'ping', 'id': occupancy_feed.event_id(last_seq)})})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+
+
+async def lifespan(receive, send) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await loop.run_in_executor(None, api_server.start_backend)
+            except Exception as exc:
+                logger.exception("Backend startup failed")
+                await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await loop.run_in_executor(None, api_server.stop_backend)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: Dict, receive, send) -> None:
+    """Aplicação ASGI: streams nativos em asyncio, o resto pela API Flask"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'websocket':
+        if scope['path'] == OCCUPANCY_SOCKET_PATH:
+            await serve_occupancy_socket(scope, receive, send)
+        else:
+            await send({'type': 'websocket.close', 'code': 1000})
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['method'] == 'GET' and scope['path'] == OCCUPANCY_EVENTS_PATH:
+        await serve_occupancy_events(scope, receive, send)
+        return
+    match: Optional[re.Match] = STREAM_PATH.match(scope['path']) if scope['method'] == 'GET' else None
+    if match:
+        await serve_stream(unquote(match.group(1)), receive, send)
+        return
+    await serve_wsgi(scope, receive, send)
+
+
+def main() -> int:
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("ASGI mode needs an ASGI server: pip install uvicorn")
+        return 1
+    ssl_options = {}
+    if os.path.exists(SSL_CERT_FILE) and os.path.exists(SSL_KEY_FILE):
+        ssl_options = {'ssl_certfile': SSL_CERT_FILE, 'ssl_keyfile': SSL_KEY_FILE}
+    uvicorn.run(app, host='0.0.0.0', port=API_PORT, log_level='info', **ssl_options)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
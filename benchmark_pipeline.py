@@ -0,0 +1,438 @@
+"""
+Benchmark offline do pipeline das câmeras.
+
+Reproduz um vídeo gravado (ou frames sintéticos) pelo mesmo caminho do
+servidor (VideoCapture -> inferência -> compute_parking_status -> overlay ->
+JPEG, via CameraPipeline) com 1..N câmeras simuladas, e grava throughput,
+percentis de latência por etapa e memória em JSON para comparar versões.
+
+    python benchmark_pipeline.py --source gravacao.mp4 --cameras 1,2,4,8
+    python benchmark_pipeline.py --source synthetic --model yolo11s.pt --device cpu
+    python benchmark_pipeline.py --source-size 640x360    # substream (inferência na resolução nativa)
+    python benchmark_pipeline.py --compare antes.json depois.json
+
+Com `--model stub` (padrão) a inferência é simulada: caixas determinísticas
+sobre as vagas e um tempo fixo de "GPU" (`--stub-latency-ms`), para medir o
+resto do pipeline em qualquer máquina.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAMERA_COUNTS = '1,2,4'
+DEFAULT_DURATION = 20.0       # segundos medidos por passo
+DEFAULT_WARMUP = 3.0          # segundos descartados no início de cada passo
+DEFAULT_SPOTS = 40
+UNPACED_FPS = 1000.0          # target_fps que na prática desliga o controlador de taxa
+RESULTS_DIR = Path('benchmark_results')
+STUB_CLASS_ID = 2             # 'car' no COCO
+STUB_TOGGLE_PROBABILITY = 0.02
+
+
+def grid_areas(count: int) -> List[List[List[float]]]:
+    """Vagas sintéticas em grade, em coordenadas normalizadas"""
+    columns = max(int(np.ceil(np.sqrt(count * 16 / 9))), 1)
+    rows = max(int(np.ceil(count / columns)), 1)
+    width, height = 1.0 / columns, 1.0 / rows
+    areas = []
+    for idx in range(count):
+        x0, y0 = (idx % columns) * width, (idx // columns) * height
+        x1, y1 = x0 + width * 0.9, y0 + height * 0.9
+        areas.append([[round(x0, 6), round(y0, 6)], [round(x1, 6), round(y0, 6)],
+                      [round(x1, 6), round(y1, 6)], [round(x0, 6), round(y1, 6)]])
+    return areas
+
+
+def load_camera_areas(camera_id: str, config_file: Path = Path('cameras_config.json')) -> List:
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)[camera_id].get('areas', [])
+
+
+class _Tensor:
+    """Imita o pedaço da API de tensor usado por extract_detections"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+    def int(self):
+        return _Tensor(self.array.astype(np.int64))
+
+
+class _StubBoxes:
+    def __init__(self, xyxy: np.ndarray):
+        self.xyxy = _Tensor(xyxy.astype(np.float32))
+        self.conf = _Tensor(np.full(len(xyxy), 0.9, dtype=np.float32))
+        self.cls = _Tensor(np.full(len(xyxy), STUB_CLASS_ID, dtype=np.float32))
+
+
+class _StubResult:
+    def __init__(self, xyxy: np.ndarray):
+        self.boxes = _StubBoxes(xyxy)
+
+
+class StubDetector:
+    """
+    Detector simulado: uma caixa no centro de cada vaga "ocupada" e um tempo
+    fixo de inferência (sleep, que solta o GIL como a espera pela GPU). Cada
+    vaga troca de estado com probabilidade fixa por frame, com semente fixa.
+    """
+
+    names = {STUB_CLASS_ID: 'car'}
+
+    def __init__(self, areas, latency: float, seed: int = 0):
+        self.vehicle_class_ids = {STUB_CLASS_ID}
+        self.latency = latency
+        self.areas = areas
+        self.random = np.random.default_rng(seed)
+        self.occupied = self.random.random(len(areas)) < 0.5
+        self.lock = threading.Lock()
+
+    def _boxes(self, width: int, height: int) -> np.ndarray:
+        with self.lock:
+            self.occupied ^= self.random.random(len(self.areas)) < STUB_TOGGLE_PROBABILITY
+            occupied = self.occupied.copy()
+        boxes = []
+        for area, is_occupied in zip(self.areas, occupied):
+            if not is_occupied:
+                continue
+            xs = [point[0] * width for point in area]
+            ys = [point[1] * height for point in area]
+            cx, cy = sum(xs) / len(xs), sum(ys) / len(ys)
+            half_w, half_h = (max(xs) - min(xs)) / 3, (max(ys) - min(ys)) / 3
+            boxes.append((cx - half_w, cy - half_h, cx + half_w, cy + half_h))
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+    def predict(self, frame, **kwargs):
+        frames = frame if isinstance(frame, list) else [frame]
+        if self.latency > 0:
+            time.sleep(self.latency * len(frames))
+        return [_StubResult(self._boxes(item.shape[1], item.shape[0])) for item in frames]
+
+
+def summarize(samples: Sequence[float], duration: float) -> Dict:
+    """Percentis em ms e taxa (amostras/s) de uma lista de durações em segundos"""
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'count': int(len(values)),
+        'per_second': round(len(values) / duration, 2),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def rss_mb() -> Optional[float]:
+    """Memória residente atual do processo (Linux), em MB"""
+    try:
+        with open('/proc/self/status', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def make_recording_metrics(measure_from: float):
+    """PipelineMetrics que também guarda cada amostra (após o aquecimento)"""
+    from metrics import PipelineMetrics
+
+    class RecordingMetrics(PipelineMetrics):
+        def __init__(self):
+            super().__init__()
+            self.samples: Dict[str, List[float]] = defaultdict(list)
+
+        def observe(self, stage: str, seconds: float) -> None:
+            super().observe(stage, seconds)
+            if time.perf_counter() >= measure_from:
+                self.samples[stage].append(seconds)
+
+    return RecordingMetrics()
+
+
+def source_url(args, index: int) -> str:
+    """Fonte da câmera virtual `index`: sintética ou o arquivo com offset próprio"""
+    if args.source == 'synthetic':
+        url = f"synthetic://?fps={args.source_fps}&seed={index}&pace={args.pace}"
+        if args.source_size:
+            width, _, height = args.source_size.partition('x')
+            url += f"&width={int(width)}&height={int(height)}"
+        return url
+    if os.path.isfile(args.source):
+        path = Path(args.source).resolve().as_posix()
+        return f"replay://{path}?pace={args.pace}&offset={index * args.offset_step}"
+    return args.source
+
+
+def open_source(args, index: int):
+    import camera_pipeline
+    from capture import VideoCapture
+
+    capture = VideoCapture(
+        source_url(args, index), width=camera_pipeline.CAPTURE_WIDTH, height=camera_pipeline.CAPTURE_HEIGHT,
+    )
+    return capture.start()
+
+
+def run_step(args, cameras: int, areas) -> Dict:
+    """Roda `cameras` pipelines em paralelo e mede o intervalo após o aquecimento"""
+    from camera_pipeline import CameraPipeline
+
+    config = {
+        'areas': areas,
+        'imgsz': args.imgsz,
+        'target_fps': args.target_fps or UNPACED_FPS,
+        'priority': 'high',
+    }
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+    published: Dict[int, List[Dict]] = defaultdict(list)
+    repeated: Dict[int, int] = defaultdict(int)  # Publicações de um frame da câmera já publicado
+    pipelines = []
+    captures = []
+
+    def collector(index: int):
+        last_captured_at = [None]
+
+        def publish(frame_bytes, stats):
+            freshness = stats.get('freshness', {})
+            captured_at = freshness.get('display_captured_at')
+            is_new = captured_at is None or captured_at != last_captured_at[0]
+            last_captured_at[0] = captured_at
+            if time.perf_counter() < measure_from or frame_bytes is None:
+                return
+            if not is_new:
+                repeated[index] += 1
+                return
+            published[index].append({'bytes': len(frame_bytes), 'pipeline_ms': freshness.get('pipeline_ms')})
+        return publish
+
+    for index in range(cameras):
+        capture = open_source(args, index)
+        captures.append(capture)
+        pipeline = CameraPipeline(
+            f'bench-{index}', lambda capture=capture: capture, lambda: config, collector(index),
+        )
+        pipeline.metrics = make_recording_metrics(measure_from)
+        pipelines.append(pipeline)
+
+    rss_before = rss_mb()
+    threads = [
+        threading.Thread(target=pipeline.run, args=(lambda: time.perf_counter() < deadline,), daemon=True)
+        for pipeline in pipelines
+    ]
+    for thread in threads:
+        thread.start()
+    # Contadores de frames só do intervalo medido, como `frames`
+    time.sleep(max(measure_from - time.perf_counter(), 0.0))
+    for pipeline in pipelines:
+        pipeline.metrics.dropped_frames = 0
+        pipeline.metrics.duplicate_frames = 0
+        pipeline.metrics.stale_frames = 0
+    for thread in threads:
+        thread.join(timeout=args.warmup + args.duration + 30.0)
+    for capture in captures:
+        capture.stop(wait=False)
+
+    stage_samples: Dict[str, List[float]] = defaultdict(list)
+    for pipeline in pipelines:
+        for stage, samples in pipeline.metrics.samples.items():
+            stage_samples[stage].extend(samples)
+    frames = [item for items in published.values() for item in items]
+    latencies = [item['pipeline_ms'] / 1000.0 for item in frames if item['pipeline_ms'] is not None]
+    per_camera = [len(published[index]) / args.duration for index in range(cameras)]
+    rss_after = rss_mb()
+    return {
+        'cameras': cameras,
+        'duration_seconds': args.duration,
+        'frames': len(frames),
+        'repeated_publishes': sum(repeated.values()),
+        'throughput_fps': round(len(frames) / args.duration, 2),
+        'per_camera_fps': {
+            'min': round(min(per_camera), 2),
+            'mean': round(sum(per_camera) / cameras, 2),
+            'max': round(max(per_camera), 2),
+        },
+        'jpeg_bytes_mean': round(sum(item['bytes'] for item in frames) / len(frames)) if frames else 0,
+        'dropped_frames': sum(pipeline.metrics.dropped_frames for pipeline in pipelines),
+        'duplicate_frames': sum(pipeline.metrics.duplicate_frames for pipeline in pipelines),
+        'stale_frames': sum(pipeline.metrics.stale_frames for pipeline in pipelines),
+        'stages': {stage: summarize(samples, args.duration) for stage, samples in sorted(stage_samples.items())},
+        'capture_to_publish': summarize(latencies, args.duration),
+        'memory': {
+            'rss_mb': rss_after,
+            'rss_delta_mb': round(rss_after - rss_before, 1) if rss_after is not None and rss_before is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+    }
+
+
+def install_detector(args, areas) -> str:
+    """Coloca o stub ou o modelo YOLO pedido como modelo principal do pipeline"""
+    import camera_pipeline
+
+    if args.model == 'stub':
+        camera_pipeline.swap_model(StubDetector(areas, args.stub_latency_ms / 1000.0), 'stub')
+        return 'stub'
+    detector = camera_pipeline.load_yolo(args.model)
+    camera_pipeline.warm_up_model(args.imgsz, detector=detector)
+    camera_pipeline.swap_model(detector, args.model)
+    return args.model
+
+
+def run_benchmark(args) -> Dict:
+    # Estado de ocupação e clipes de evidência do benchmark não se misturam com os do servidor
+    os.environ.setdefault('OCCUPANCY_STATE_DIR', tempfile.mkdtemp(prefix='bench-occupancy-'))
+    os.environ.setdefault('EVIDENCE_DIR', tempfile.mkdtemp(prefix='bench-evidence-'))
+    os.environ['INFERENCE_DEVICE'] = args.device
+    import camera_pipeline
+    import rate_controller as rate_module
+
+    # Sem orçamento nem queda para 1 FPS em câmera "estática": mede a capacidade
+    rate_module.rate_controller.budget = float('inf')
+    rate_module.STATIC_AFTER_SECONDS = float('inf')
+
+    areas = load_camera_areas(args.camera_config) if args.camera_config else grid_areas(args.spots)
+    model_name = install_detector(args, areas)
+    steps = []
+    for cameras in [int(value) for value in args.cameras.split(',') if value.strip()]:
+        logger.info("Running %d camera(s) for %.0fs (+%.0fs warmup)", cameras, args.duration, args.warmup)
+        step = run_step(args, cameras, areas)
+        logger.info(
+            "%d camera(s): %.1f fps total, inference p95 %s ms",
+            cameras, step['throughput_fps'], step['stages'].get('inference', {}).get('p95_ms'),
+        )
+        steps.append(step)
+    return {
+        'benchmark': 'camera_pipeline',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'source': args.source,
+            'pace': args.pace,
+            'model': model_name,
+            'device': args.device,
+            'imgsz': args.imgsz,
+            'spots': len(areas),
+            'target_fps': args.target_fps or 'unpaced',
+            'stub_latency_ms': args.stub_latency_ms if args.model == 'stub' else None,
+            'capture_size': [camera_pipeline.CAPTURE_WIDTH, camera_pipeline.CAPTURE_HEIGHT],
+            'source_size': args.source_size,
+        },
+        'steps': steps,
+    }
+
+
+def compare(base_file: str, new_file: str) -> None:
+    """Tabela com a variação de throughput e p95 por etapa entre dois resultados"""
+    with open(base_file, 'r', encoding='utf-8') as f:
+        base = {step['cameras']: step for step in json.load(f)['steps']}
+    with open(new_file, 'r', encoding='utf-8') as f:
+        new = {step['cameras']: step for step in json.load(f)['steps']}
+
+    def change(before, after) -> str:
+        if not before or after is None:
+            return 'n/a'
+        return f"{(after - before) / before * 100:+.1f}%"
+
+    for cameras in sorted(set(base) & set(new)):
+        old_step, new_step = base[cameras], new[cameras]
+        print(f"{cameras} camera(s): throughput {old_step['throughput_fps']} -> {new_step['throughput_fps']} fps "
+              f"({change(old_step['throughput_fps'], new_step['throughput_fps'])})")
+        for stage in sorted(set(old_step['stages']) | set(new_step['stages'])):
+            before = old_step['stages'].get(stage, {}).get('p95_ms')
+            after = new_step['stages'].get(stage, {}).get('p95_ms')
+            print(f"  {stage:<14} p95 {before} -> {after} ms ({change(before, after)})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the camera pipeline")
+    parser.add_argument('--source', default='synthetic', help="video file/URL or 'synthetic'")
+    parser.add_argument('--source-fps', type=float, default=25.0, help="frame rate of the synthetic source")
+    parser.add_argument('--source-size', help="WxH of the synthetic source, e.g. 640x360 (default: capture size)")
+    parser.add_argument('--pace', default='native', help="'native', 'unpaced' or a frame rate for the source")
+    parser.add_argument('--offset-step', type=float, default=7.0, help="start offset (s) between virtual cameras")
+    parser.add_argument('--cameras', default=DEFAULT_CAMERA_COUNTS, help="comma-separated camera counts, e.g. 1,2,4,8")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="measured seconds per step")
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP, help="discarded seconds per step")
+    parser.add_argument('--model', default='stub', help="'stub' or a YOLO weights file")
+    parser.add_argument('--device', default='cuda', help="inference device for real models (cuda, cpu)")
+    parser.add_argument('--stub-latency-ms', type=float, default=8.0, help="simulated inference time of the stub")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--spots', type=int, default=DEFAULT_SPOTS, help="synthetic spot grid size")
+    parser.add_argument('--camera-config', help="use the spots of this camera id from cameras_config.json")
+    parser.add_argument('--target-fps', type=float, help="per-camera target fps (default: unpaced)")
+    parser.add_argument('--output', help="result JSON (default: benchmark_results/pipeline-<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    result = run_benchmark(args)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    logger.info("Results saved to %s", output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+Gerador de carga MJPEG e curva de escalabilidade do servidor de streams.
+
+Abre M clientes simultâneos em /api/cameras/<id>/stream (uma fração deles
+lendo devagar de propósito) e clientes que consultam /status, mede por
+cliente fps entregue, bytes, atraso desde a captura (cabeçalho
+X-Captured-At) e o CPU do processo do servidor, e repete para cada M:
+
+    python benchmark_streaming.py --url https://localhost:5000 --camera cam1 --clients 1,10,50,100
+    python benchmark_streaming.py --camera cam1 --clients 200 --slow-fraction 0.3 --server-pid 1234
+
+O resultado (um passo por M) vai para benchmark_results/streaming-<timestamp>.json.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import ssl
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from benchmark_pipeline import RESULTS_DIR, git_revision, summarize
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b'--frame\r\n'
+CHUNK_SIZE = 64 * 1024
+SLOW_CHUNK_SIZE = 4 * 1024
+DEFAULT_CLIENT_COUNTS = '1,10,50'
+DEFAULT_DURATION = 20.0
+DEFAULT_WARMUP = 3.0
+CONNECT_TIMEOUT = 10.0
+
+
+def open_connection(base_url: str, insecure: bool) -> http.client.HTTPConnection:
+    parsed = urlparse(base_url)
+    if parsed.scheme == 'https':
+        context = ssl._create_unverified_context() if insecure else ssl.create_default_context()
+        return http.client.HTTPSConnection(parsed.hostname, parsed.port or 443, timeout=CONNECT_TIMEOUT, context=context)
+    return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=CONNECT_TIMEOUT)
+
+
+class StreamClient(threading.Thread):
+    """
+    Um visualizador MJPEG. Com `slow_rate` (bytes/s) lê em pedaços pequenos
+    e dorme entre eles, simulando um cliente em rede lenta.
+    """
+
+    def __init__(self, base_url: str, camera_id: str, measure_from: float, deadline: float,
+                 insecure: bool, slow_rate: Optional[float] = None):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.path = f"/api/cameras/{camera_id}/stream"
+        self.measure_from = measure_from
+        self.deadline = deadline
+        self.insecure = insecure
+        self.slow_rate = slow_rate
+        self.frames = 0
+        self.bytes = 0
+        self.ages: List[float] = []        # now - X-Captured-At de cada frame
+        self.first_frame: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def run(self) -> None:
+        started = time.time()
+        try:
+            conn = open_connection(self.base_url, self.insecure)
+            conn.request('GET', self.path)
+            response = conn.getresponse()
+            if response.status != 200:
+                self.error = f"HTTP {response.status}"
+                return
+            self._consume(response, started)
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+
+    def _consume(self, response, started: float) -> None:
+        buffer = b''
+        chunk_size = SLOW_CHUNK_SIZE if self.slow_rate else CHUNK_SIZE
+        while time.time() < self.deadline:
+            chunk = response.read1(chunk_size)
+            if not chunk:
+                self.error = 'stream closed'
+                return
+            if self.slow_rate:
+                time.sleep(len(chunk) / self.slow_rate)
+            if time.time() >= self.measure_from:
+                self.bytes += len(chunk)
+            buffer += chunk
+            while True:
+                start = buffer.find(BOUNDARY)
+                end = buffer.find(BOUNDARY, start + len(BOUNDARY)) if start >= 0 else -1
+                if end < 0:
+                    break
+                self._on_part(buffer[start + len(BOUNDARY):end], started)
+                buffer = buffer[end:]
+
+    def _on_part(self, part: bytes, started: float) -> None:
+        now = time.time()
+        if self.first_frame is None:
+            self.first_frame = now - started
+        if now < self.measure_from:
+            return
+        self.frames += 1
+        headers, _, _ = part.partition(b'\r\n\r\n')
+        for line in headers.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'x-captured-at':
+                self.ages.append(now - float(value))
+
+
+class StatusClient(threading.Thread):
+    """Consulta /status em intervalo fixo (conexão keep-alive), como o dashboard"""
+
+    def __init__(self, base_url: str, camera_id: str, measure_from: float, deadline: float,
+                 insecure: bool, interval: float):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.path = f"/api/cameras/{camera_id}/status"
+        self.measure_from = measure_from
+        self.deadline = deadline
+        self.insecure = insecure
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    def run(self) -> None:
+        conn = open_connection(self.base_url, self.insecure)
+        while time.time() < self.deadline:
+            started = time.time()
+            try:
+                conn.request('GET', self.path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except Exception:
+                ok = False
+                conn.close()
+                conn = open_connection(self.base_url, self.insecure)
+            elapsed = time.time() - started
+            if started >= self.measure_from:
+                if ok:
+                    self.latencies.append(elapsed)
+                else:
+                    self.errors += 1
+            time.sleep(max(self.interval - elapsed, 0.0))
+        conn.close()
+
+
+def process_cpu_seconds(pid: Optional[int]) -> Optional[float]:
+    """utime + stime do processo (Linux /proc), em segundos"""
+    if pid is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/stat', 'r', encoding='utf-8') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def run_step(args, clients: int) -> Dict:
+    """M clientes de stream (+ clientes de /status) por args.duration segundos"""
+    measure_from = time.time() + args.warmup
+    deadline = measure_from + args.duration
+    slow_count = int(round(clients * args.slow_fraction))
+    streams = [
+        StreamClient(
+            args.url, args.camera, measure_from, deadline, args.insecure,
+            slow_rate=args.slow_rate * 1024 if idx < slow_count else None,
+        )
+        for idx in range(clients)
+    ]
+    pollers = [
+        StatusClient(args.url, args.camera, measure_from, deadline, args.insecure, args.status_interval)
+        for _ in range(args.status_clients)
+    ]
+    for client in streams + pollers:
+        client.start()
+
+    time.sleep(max(measure_from - time.time(), 0.0))
+    cpu_before = process_cpu_seconds(args.server_pid)
+    time.sleep(max(deadline - time.time(), 0.0))
+    cpu_after = process_cpu_seconds(args.server_pid)
+    for client in streams + pollers:
+        client.join(timeout=CONNECT_TIMEOUT)
+
+    def client_summary(group: List[StreamClient]) -> Dict:
+        if not group:
+            return {'clients': 0}
+        fps = np.array([client.frames / args.duration for client in group])
+        ages = [age for client in group for age in client.ages]
+        first_frames = [client.first_frame for client in group if client.first_frame is not None]
+        return {
+            'clients': len(group),
+            'failed': sum(1 for client in group if client.error and not client.frames),
+            'fps': {
+                'mean': round(float(fps.mean()), 2),
+                'min': round(float(fps.min()), 2),
+                'p5': round(float(np.percentile(fps, 5)), 2),
+            },
+            'bytes_per_second': round(sum(client.bytes for client in group) / args.duration),
+            'capture_to_client': summarize(ages, args.duration),
+            'time_to_first_frame': summarize(first_frames, args.duration),
+        }
+
+    errors = sorted({client.error for client in streams if client.error and client.error != 'stream closed'})
+    return {
+        'clients': clients,
+        'duration_seconds': args.duration,
+        'normal': client_summary(streams[slow_count:]),
+        'slow': client_summary(streams[:slow_count]),
+        'status': {
+            'clients': len(pollers),
+            'errors': sum(poller.errors for poller in pollers),
+            'latency': summarize([lat for poller in pollers for lat in poller.latencies], args.duration),
+        },
+        'server_cpu_percent': (
+            round((cpu_after - cpu_before) / args.duration * 100.0, 1)
+            if cpu_before is not None and cpu_after is not None else None
+        ),
+        'errors': errors[:10],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MJPEG streaming load generator")
+    parser.add_argument('--url', default='https://localhost:5000', help="API base URL")
+    parser.add_argument('--camera', required=True, help="camera id to stream")
+    parser.add_argument('--clients', default=DEFAULT_CLIENT_COUNTS, help="comma-separated client counts")
+    parser.add_argument('--slow-fraction', type=float, default=0.1, help="fraction of deliberately slow readers")
+    parser.add_argument('--slow-rate', type=float, default=64.0, help="slow reader bandwidth in KB/s")
+    parser.add_argument('--status-clients', type=int, default=5, help="concurrent /status pollers")
+    parser.add_argument('--status-interval', type=float, default=1.0, help="seconds between /status polls")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="measured seconds per step")
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP, help="discarded seconds per step")
+    parser.add_argument('--server-pid', type=int, help="server process id for CPU measurement (Linux)")
+    parser.add_argument('--verify-tls', dest='insecure', action='store_false',
+                        help="verify the server certificate (self-signed by default)")
+    parser.add_argument('--output', help="result JSON (default: benchmark_results/streaming-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    args = parse_args(argv)
+    steps = []
+    for clients in [int(value) for value in args.clients.split(',') if value.strip()]:
+        logger.info("Streaming to %d client(s) for %.0fs (+%.0fs warmup)", clients, args.duration, args.warmup)
+        step = run_step(args, clients)
+        logger.info(
+            "%d client(s): %.1f fps/client (p5 %.1f), capture->client p95 %s ms, server CPU %s%%",
+            clients, step['normal'].get('fps', {}).get('mean', 0.0), step['normal'].get('fps', {}).get('p5', 0.0),
+            step['normal'].get('capture_to_client', {}).get('p95_ms'), step['server_cpu_percent'],
+        )
+        steps.append(step)
+
+    result = {
+        'benchmark': 'streaming',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'config': {
+            'url': args.url,
+            'camera': args.camera,
+            'slow_fraction': args.slow_fraction,
+            'slow_rate_kbps': args.slow_rate,
+            'status_clients': args.status_clients,
+        },
+        'steps': steps,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"streaming-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    logger.info("Results saved to %s", output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Calibração automática do tamanho de entrada do modelo (imgsz) por câmera.
+
+Para cada câmera, roda o detector em alguns frames reais no maior tamanho
+candidato (referência) e em tamanhos menores, e escolhe o menor imgsz cujo
+recall contra a referência, restrito às detecções dentro das vagas, fica
+acima do limiar. Tamanhos em que as vagas ou os veículos observados ficariam
+menores que MIN_OBJECT_PIXELS na entrada do modelo são descartados sem rodar.
+Com menos de MIN_REFERENCE_DETECTIONS veículos nas vagas (ex.: pátio vazio)
+não há evidência para medir recall: o resultado é inconclusivo e o tamanho
+de referência é mantido.
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+IMGSZ_CANDIDATES = (320, 416, 512, 640)
+RECALL_THRESHOLD = 0.95
+IOU_MATCH_THRESHOLD = 0.5
+MIN_OBJECT_PIXELS = 20  # Menor lado (na entrada do modelo) ainda detectável com folga
+MIN_REFERENCE_DETECTIONS = 10  # Detecções de referência (somadas nos frames) para o recall valer algo
+IMGSZ_STRIDE = 32  # imgsz do YOLO é múltiplo do stride máximo
+
+
+def parse_imgsz(value) -> Optional[int]:
+    """
+    imgsz vindo de JSON: inteiro positivo múltiplo de IMGSZ_STRIDE; None se
+    inválido. Não converte: 320.5, "320" e true são rejeitados.
+    """
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0 or value % IMGSZ_STRIDE:
+        return None
+    return value
+
+
+def parse_imgsz_candidates(value) -> Optional[List[int]]:
+    """Lista não vazia de imgsz válidos (ver parse_imgsz); None se inválida"""
+    if not isinstance(value, (list, tuple)) or not value:
+        return None
+    sizes = [parse_imgsz(size) for size in value]
+    return None if None in sizes else sizes
+
+
+def box_iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU entre todas as caixas xyxy de A (N) e B (M) -> matriz NxM"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def boxes_in_spots(boxes: np.ndarray, polygons: Sequence[Sequence[Sequence[int]]]) -> np.ndarray:
+    """Filtra as caixas cujo centro cai dentro de alguma vaga (sem vagas, retorna todas)"""
+    if not len(boxes) or not polygons:
+        return boxes
+    contours = [np.array(pts, dtype=np.int32) for pts in polygons]
+    keep = []
+    for xyxy in boxes:
+        center = (float((xyxy[0] + xyxy[2]) / 2), float((xyxy[1] + xyxy[3]) / 2))
+        keep.append(any(cv2.pointPolygonTest(pts, center, False) >= 0 for pts in contours))
+    return boxes[np.array(keep, dtype=bool)]
+
+
+def detection_recall(reference: np.ndarray, candidate: np.ndarray,
+                     iou_threshold: float = IOU_MATCH_THRESHOLD) -> float:
+    """Fração das caixas de referência com correspondência (IoU) no candidato"""
+    if len(reference) == 0:
+        return 1.0
+    if len(candidate) == 0:
+        return 0.0
+    iou = box_iou_matrix(reference, candidate)
+    return float(np.count_nonzero(iou.max(axis=1) >= iou_threshold)) / len(reference)
+
+
+def min_spot_extent(polygons: Sequence[Sequence[Sequence[int]]]) -> float:
+    """Menor lado (em pixels do frame) do retângulo envolvente das vagas"""
+    extents = []
+    for pts in polygons:
+        arr = np.asarray(pts, dtype=np.float32)
+        extents.append(float(min(np.ptp(arr[:, 0]), np.ptp(arr[:, 1]))))
+    return min(extents) if extents else 0.0
+
+
+def min_box_extent(boxes: np.ndarray, percentile: float = 10.0) -> float:
+    """Lado menor típico das caixas observadas (percentil, robusto a outliers)"""
+    if not len(boxes):
+        return 0.0
+    sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    return float(np.percentile(sides, percentile))
+
+
+def input_scale(frame_shape, imgsz: int) -> float:
+    """Escala aplicada pelo letterbox do YOLO (lado maior -> imgsz)"""
+    height, width = frame_shape[:2]
+    return imgsz / float(max(width, height))
+
+
+def calibrate_imgsz(
+    frames: Sequence[np.ndarray],
+    detect: Callable[[np.ndarray, int], np.ndarray],
+    polygons: Sequence[Sequence[Sequence[int]]],
+    candidates: Sequence[int] = IMGSZ_CANDIDATES,
+    recall_threshold: float = RECALL_THRESHOLD,
+    min_object_pixels: float = MIN_OBJECT_PIXELS,
+    min_reference_detections: int = MIN_REFERENCE_DETECTIONS,
+) -> Dict:
+    """
+    Escolhe o menor imgsz que mantém o recall acima do limiar.
+
+    `detect(frame, imgsz)` deve retornar as caixas xyxy (N, 4) em pixels do
+    frame. Retorna um relatório com o imgsz escolhido e as métricas de cada
+    candidato; `inconclusive` indica que faltaram detecções de referência
+    e o imgsz ficou no tamanho de referência.
+    """
+    candidates = sorted({int(size) for size in candidates})
+    reference_size = candidates[-1]
+    if not frames:
+        return {'imgsz': reference_size, 'reference_imgsz': reference_size, 'frames': 0,
+                'inconclusive': True, 'candidates': []}
+
+    reference_boxes = [boxes_in_spots(detect(frame, reference_size), polygons) for frame in frames]
+    observed = np.concatenate(reference_boxes) if any(len(b) for b in reference_boxes) else np.empty((0, 4))
+    spot_extent = min_spot_extent(polygons)
+    box_extent = min_box_extent(observed)
+    object_extent = min(v for v in (spot_extent, box_extent) if v > 0) if (spot_extent or box_extent) else 0.0
+    inconclusive = len(observed) < min_reference_detections
+
+    report: List[Dict] = []
+    chosen = reference_size
+    for size in ([] if inconclusive else candidates[:-1]):
+        scaled = object_extent * input_scale(frames[0].shape, size)
+        entry = {'imgsz': size, 'min_object_pixels': round(scaled, 1), 'recall': None}
+        report.append(entry)
+        if object_extent and scaled < min_object_pixels:
+            entry['skipped'] = 'objects too small'
+            continue
+
+        matched = 0.0
+        total = 0
+        for frame, ref in zip(frames, reference_boxes):
+            if not len(ref):
+                continue
+            candidate_boxes = boxes_in_spots(detect(frame, size), polygons)
+            matched += detection_recall(ref, candidate_boxes) * len(ref)
+            total += len(ref)
+        entry['recall'] = round(matched / total, 4)
+        if entry['recall'] >= recall_threshold and size < chosen:
+            chosen = size
+            break  # Candidatos em ordem crescente: o primeiro aprovado é o menor
+
+    report.append({'imgsz': reference_size, 'recall': 1.0, 'reference': True})
+    return {
+        'imgsz': chosen,
+        'reference_imgsz': reference_size,
+        'recall_threshold': recall_threshold,
+        'frames': len(frames),
+        'reference_detections': int(len(observed)),
+        'min_reference_detections': min_reference_detections,
+        'inconclusive': inconclusive,
+        'min_spot_extent': round(spot_extent, 1),
+        'min_box_extent': round(box_extent, 1),
+        'candidates': report,
+    }
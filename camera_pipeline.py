@@ -0,0 +1,913 @@
+"""
+Pipeline de processamento por câmera.
+
+Captura -> inferência (detector, cascata ou classificador de vagas) ->
+ocupação -> overlay -> JPEG. Não depende do Flask: o servidor roda um
+CameraPipeline por câmera em um thread, e os workers multiprocesso
+(camera_workers.py) rodam os seus publicando em memória compartilhada.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from cascade import (
+    CascadeStats,
+    empty_detections,
+    find_ambiguous_spots,
+    merge_crop_detections,
+    spot_crop_rect,
+)
+from evidence_clips import EVIDENCE_MIN_INTERVAL, evidence_store
+from metrics import PipelineMetrics, StageTimer
+from occupancy_state import EventCoalescer, SpotHysteresis, load_stable_state, save_stable_state
+from patch_classifier import load_patch_batcher, spot_confidence, warp_spot_patches
+from rate_controller import rate_controller
+from spot_geometry import scale_areas
+from stream_sources import MainStream, display_source
+from tracking import DailyStatistics, IoUTracker, SpotDwellTracker, spot_occupants
+from supabase_client import db
+
+logger = logging.getLogger(__name__)
+
+os.environ.setdefault(
+    "OPENCV_FFMPEG_CAPTURE_OPTIONS",
+    "rtsp_transport;tcp|stimeout;15000000|max_delay;5000000|reorder_queue_size;2",
+)
+
+MODEL_PATH = os.getenv('YOLO_MODEL', 'yolo11s.pt')
+WARMUP_FRAMES = 3  # Inferências com frames pretos antes de servir (cuDNN autotune, alocação)
+INFERENCE_DEVICE = os.getenv('INFERENCE_DEVICE', 'cuda')  # 'cpu' para máquinas sem GPU (FP16 desligado)
+
+CAPTURE_WIDTH = 1280
+CAPTURE_HEIGHT = 720
+MAX_DISPLAY_WIDTH = 1280
+MAX_DISPLAY_HEIGHT = 720
+FPS_SMOOTHING_ALPHA = 0.15
+FRAME_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 80]
+PARKING_DETAILS_VERSION = 1
+OCCUPANCY_SAVE_INTERVAL = 60  # Salva ocupação a cada 60 segundos
+DEFAULT_IMGSZ = 640  # Tamanho de entrada padrão do modelo
+
+# Motor de ocupação: 'detector' (YOLO no frame inteiro) ou 'patch' (classificador por vaga)
+OCCUPANCY_ENGINE = os.getenv('OCCUPANCY_ENGINE', 'detector')
+PATCH_CLASSIFIER_MODEL = os.getenv('PATCH_CLASSIFIER_MODEL', 'spot_classifier.onnx')
+PATCH_MIN_CONFIDENCE = float(os.getenv('PATCH_MIN_CONFIDENCE', '0.8'))
+PATCH_FALLBACK_TO_DETECTOR = os.getenv('PATCH_FALLBACK_TO_DETECTOR', '1') == '1'
+
+# Cascata de detectores: 'off', 'frame' (pesado no frame inteiro) ou 'crop' (só nas vagas ambíguas)
+CASCADE_MODE = os.getenv('CASCADE_MODE', 'off')
+CASCADE_LIGHT_MODEL = os.getenv('CASCADE_LIGHT_MODEL', 'yolo11n.pt')
+CASCADE_CROP_IMGSZ = 320
+
+# Interpolação de exibição: entre inferências, o stream segue na taxa de captura
+# com as caixas projetadas pelo tracker (velocidade constante)
+DISPLAY_INTERPOLATION = os.getenv('DISPLAY_INTERPOLATION', '0') == '1'
+MAX_DISPLAY_FPS = float(os.getenv('MAX_DISPLAY_FPS', '25'))
+
+# Prazo de frescor: frames mais velhos que isto (desde a captura) são descartados
+# em vez de inferidos, para a ocupação publicada não acumular atraso
+MAX_FRAME_AGE_SECONDS = float(os.getenv('MAX_FRAME_AGE_SECONDS', '2.0'))
+MAX_FRAME_AGE_LIMIT = 60.0
+
+# Classes de veículos para detecção
+VEHICLE_CLASSES = {
+    "car", "truck", "bus", "motorbike", "motorcycle",
+    "vehicle", "bicycle", "van"
+}
+
+
+def resolve_class_ids(names_map, target_names):
+    """Resolve IDs das classes de interesse"""
+    resolved = set()
+    if isinstance(names_map, dict):
+        iterable = names_map.items()
+    else:
+        iterable = enumerate(names_map)
+    for idx, name in iterable:
+        if str(name).lower() in target_names:
+            resolved.add(int(idx))
+    return resolved
+
+
+def load_yolo(path: str):
+    """Carrega um modelo YOLO na GPU com camadas fundidas (importa ultralytics/torch)"""
+    from ultralytics import YOLO
+
+    detector = YOLO(path, verbose=False)
+    detector.to(INFERENCE_DEVICE)
+    detector.fuse()  # Fuse layers para melhor performance
+    detector.vehicle_class_ids = resolve_class_ids(detector.names, VEHICLE_CLASSES)
+    return detector
+
+
+# Modelo YOLO principal: carregado na primeira utilização (o servidor antecipa no startup)
+model = None
+active_model_path = MODEL_PATH
+target_class_ids: set = set()
+_model_lock = threading.Lock()
+# Avaliação sombra (model_manager.ShadowEvaluator): recebe uma amostra dos frames
+shadow_evaluator = None
+
+
+def get_model():
+    """Retorna o modelo principal, carregando-o se necessário"""
+    global model, target_class_ids
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                detector = load_yolo(active_model_path)
+                target_class_ids = detector.vehicle_class_ids
+                model = detector
+                logger.info("YOLO model %s loaded in %.1fs", active_model_path, time.perf_counter() - started)
+    return model
+
+
+def swap_model(detector, path: str) -> None:
+    """Troca atomicamente o modelo principal por outro já carregado e aquecido"""
+    global model, target_class_ids, active_model_path
+    with _model_lock:
+        target_class_ids = detector.vehicle_class_ids
+        model = detector
+        active_model_path = path
+    logger.info("YOLO model swapped to %s", path)
+
+
+def set_shadow_evaluator(evaluator) -> None:
+    global shadow_evaluator
+    shadow_evaluator = evaluator
+
+
+def queue_depths() -> Dict[str, int]:
+    """Filas compartilhadas pelas câmeras do processo (lote de patches, modo sombra)"""
+    depths = {}
+    if _patch_batcher is not None:
+        depths['patch_batcher'] = _patch_batcher.requests.qsize()
+    if shadow_evaluator is not None:
+        depths['shadow'] = shadow_evaluator.pending.qsize()
+    return depths
+
+
+def parse_max_frame_age(value) -> Optional[float]:
+    seconds = float(value)
+    return seconds if 0.0 < seconds <= MAX_FRAME_AGE_LIMIT else None
+
+
+def read_capture(cap) -> Tuple[bool, Optional[np.ndarray], Optional[float], Optional[int]]:
+    """(grabbed, frame, momento de captura, contador de frames) do VideoCapture"""
+    if hasattr(cap, 'read_timed'):
+        grabbed, frame, _, captured_at, frame_count = cap.read_timed()
+        return grabbed, frame, captured_at, frame_count
+    grabbed, frame, _ = cap.read()
+    return grabbed, frame, getattr(cap, 'last_frame_time', None), getattr(cap, 'frame_count', None)
+
+
+def warm_up_model(imgsz: int = DEFAULT_IMGSZ, frames: int = WARMUP_FRAMES, detector=None) -> None:
+    """Roda algumas inferências com frames pretos no tamanho de captura"""
+    dummy = np.zeros((CAPTURE_HEIGHT, CAPTURE_WIDTH, 3), dtype=np.uint8)
+    for _ in range(frames):
+        run_detection(dummy, imgsz, detector=detector)
+
+
+def run_detection(frame, imgsz=DEFAULT_IMGSZ, detector=None):
+    """Roda o detector YOLO (GPU, FP16) em um frame (ou lista de frames, em lote)"""
+    active = detector or get_model()
+    class_ids = active.vehicle_class_ids
+    results = active.predict(
+        frame,
+        device=INFERENCE_DEVICE,
+        half=INFERENCE_DEVICE != 'cpu',
+        verbose=False,
+        imgsz=imgsz,
+        conf=0.25,
+        iou=0.45,
+        max_det=100,
+        classes=list(class_ids) if class_ids else None,
+    )
+    return results if isinstance(frame, list) else results[0]
+
+
+def extract_detections(result, class_ids=None):
+    """Converte o resultado do YOLO em (xyxy, conf, cls) filtrados para veículos"""
+    if result is None or result.boxes is None or result.boxes.cls is None:
+        return empty_detections()
+    class_ids = target_class_ids if class_ids is None else class_ids
+    boxes = result.boxes.xyxy.cpu().numpy().astype(np.float32)
+    confs = result.boxes.conf.cpu().numpy().astype(np.float32)
+    classes = result.boxes.cls.int().cpu().numpy().astype(np.int64)
+    if class_ids:
+        keep = np.isin(classes, list(class_ids))
+        boxes, confs, classes = boxes[keep], confs[keep], classes[keep]
+    return boxes, confs, classes
+
+
+_light_model = None
+_light_model_loaded = False
+_light_model_lock = threading.Lock()
+
+
+def get_light_model():
+    """Carrega o modelo nano da cascata na primeira utilização"""
+    global _light_model, _light_model_loaded
+    with _light_model_lock:
+        if not _light_model_loaded:
+            _light_model_loaded = True
+            try:
+                _light_model = load_yolo(CASCADE_LIGHT_MODEL)
+                logger.info("Cascade light model %s loaded", CASCADE_LIGHT_MODEL)
+            except Exception as exc:
+                logger.error(f"Failed to load cascade light model {CASCADE_LIGHT_MODEL}: {exc}")
+                _light_model = None
+    return _light_model
+
+
+def run_cascade(frame, imgsz, areas, previous_status, mode, stats: CascadeStats):
+    """
+    Detecção em cascata: nano em todo frame, modelo pesado só nas vagas ambíguas.
+
+    Em modo 'crop' o modelo pesado roda em lote apenas nos recortes das vagas
+    ambíguas; em modo 'frame', no frame inteiro.
+    """
+    light = get_light_model()
+    if light is None:
+        return extract_detections(run_detection(frame, imgsz))
+
+    detections = extract_detections(run_detection(frame, imgsz, detector=light))
+    status = compute_parking_status(areas, detection_centers(detections))
+    ambiguous = find_ambiguous_spots(areas, detections, status, previous_status)
+    stats.record(ambiguous)
+    if not ambiguous:
+        return detections
+
+    if mode == 'frame':
+        return extract_detections(run_detection(frame, imgsz))
+
+    rects = [spot_crop_rect(areas[idx], frame.shape) for idx in sorted(ambiguous)]
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rects]
+    results = run_detection(crops, min(imgsz, CASCADE_CROP_IMGSZ))
+    return merge_crop_detections(
+        detections,
+        [(rect, extract_detections(result)) for rect, result in zip(rects, results)],
+    )
+
+
+def detection_centers(detections) -> List[tuple[int, int]]:
+    """Centros (cx, cy) das caixas detectadas"""
+    boxes = detections[0]
+    return [
+        (int((xyxy[0] + xyxy[2]) / 2), int((xyxy[1] + xyxy[3]) / 2))
+        for xyxy in boxes
+    ]
+
+
+def scale_detections(detections, scale_x: float, scale_y: float):
+    """Detecções do frame da inferência nas coordenadas do frame de exibição"""
+    boxes, confs, classes = detections
+    if not len(boxes) or (scale_x == 1.0 and scale_y == 1.0):
+        return detections
+    return boxes * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32), confs, classes
+
+
+def annotate_detections(frame, detections, track_ids=None):
+    """Desenha as caixas detectadas (com o id do track, se houver); retorna o frame anotado"""
+    boxes, _, classes = detections
+    if not len(boxes):
+        return frame
+    try:
+        from ultralytics.utils.plotting import Annotator, colors
+    except ImportError:
+        Annotator = None  # Sem ultralytics (ex.: benchmark com detector simulado): desenha com OpenCV
+
+    names = get_model().names
+    annotator = Annotator(frame, line_width=2) if Annotator is not None else None
+    for idx, (xyxy, cls_idx) in enumerate(zip(boxes, classes)):
+        cls_idx = int(cls_idx)
+        class_name = names.get(cls_idx, "obj") if isinstance(names, dict) else names[cls_idx]
+        if track_ids is not None:
+            class_name = f"{class_name} #{int(track_ids[idx])}"
+        if annotator is not None:
+            annotator.box_label(xyxy, class_name, color=colors(cls_idx, True))
+            continue
+        x1, y1, x2, y2 = (int(value) for value in xyxy[:4])
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 144, 30), 2)
+        cv2.putText(frame, class_name, (x1, max(y1 - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 144, 30), 1, cv2.LINE_AA)
+    return annotator.result() if annotator is not None else frame
+
+
+def detect_vehicles(camera_id, frame, imgsz, areas=None, previous_status=None, cascade_mode='off',
+                    cascade_stats: Optional[CascadeStats] = None):
+    """Roda o detector (ou a cascata); retorna as detecções (xyxy, conf, cls)"""
+    try:
+        if cascade_mode in ('frame', 'crop') and areas:
+            return run_cascade(
+                frame, imgsz, areas, previous_status, cascade_mode, cascade_stats or CascadeStats()
+            )
+        return extract_detections(run_detection(frame, imgsz))
+    except Exception as exc:
+        logger.error(f"YOLO error on camera {camera_id}: {exc}")
+        return empty_detections()
+
+
+_patch_batcher = None
+_patch_batcher_loaded = False
+_patch_batcher_lock = threading.Lock()
+
+
+def get_patch_batcher():
+    """Carrega o classificador de vagas na primeira utilização"""
+    global _patch_batcher, _patch_batcher_loaded
+    with _patch_batcher_lock:
+        if not _patch_batcher_loaded:
+            _patch_batcher = load_patch_batcher(PATCH_CLASSIFIER_MODEL)
+            _patch_batcher_loaded = True
+    return _patch_batcher
+
+
+def classify_spots(camera_id, frame, areas):
+    """
+    Classifica as vagas pelo motor de patches.
+
+    Retorna (status, confianças) ou None quando o motor não está disponível
+    ou alguma vaga ficou abaixo de PATCH_MIN_CONFIDENCE (com fallback ativo).
+    """
+    batcher = get_patch_batcher()
+    if batcher is None or not areas:
+        return None
+    try:
+        probs = batcher.classify(warp_spot_patches(frame, areas))
+    except Exception as exc:
+        logger.error(f"Patch classifier error on camera {camera_id}: {exc}")
+        return None
+    confidence = spot_confidence(probs)
+    if PATCH_FALLBACK_TO_DETECTOR and len(confidence) and confidence.min() < PATCH_MIN_CONFIDENCE:
+        return None
+    return (probs >= 0.5).tolist(), confidence.tolist()
+
+
+def detect_boxes(frame, imgsz=DEFAULT_IMGSZ) -> np.ndarray:
+    """Retorna apenas as caixas xyxy das detecções (usado na calibração)"""
+    return extract_detections(run_detection(frame, imgsz))[0]
+
+
+def compute_parking_status(polygons, detections):
+    """Calcula status de ocupação das vagas"""
+    if not polygons:
+        return []
+    status = []
+    for pts in polygons:
+        pts_array = np.array(pts, dtype=np.int32)
+        occupied = False
+        for cx, cy in detections:
+            if cv2.pointPolygonTest(pts_array, (float(cx), float(cy)), False) >= 0:
+                occupied = True
+                break
+        status.append(occupied)
+    return status
+
+
+def draw_parking_overlay(frame, polygons, status):
+    """Desenha overlay das vagas no frame"""
+    if not polygons:
+        return
+
+    overlay = frame.copy()
+    for idx, (pts, occupied) in enumerate(zip(polygons, status), start=1):
+        pts_array = np.array(pts, dtype=np.int32)
+        color = (0, 0, 255) if occupied else (0, 255, 0)
+        cv2.fillPoly(overlay, [pts_array], color)
+    cv2.addWeighted(overlay, 0.35, frame, 0.65, 0, dst=frame)
+
+    for idx, (pts, occupied) in enumerate(zip(polygons, status), start=1):
+        pts_array = np.array(pts, dtype=np.int32)
+        color = (0, 0, 255) if occupied else (0, 255, 0)
+        cv2.polylines(frame, [pts_array], True, color, 2, cv2.LINE_AA)
+        center = tuple(np.mean(pts_array, axis=0).astype(int))
+        label = f"#{idx} {'Ocupada' if occupied else 'Livre'}"
+        cv2.putText(frame, label, center, cv2.FONT_HERSHEY_SIMPLEX,
+                   0.6, (0, 0, 0), 3, cv2.LINE_AA)
+        cv2.putText(frame, label, center, cv2.FONT_HERSHEY_SIMPLEX,
+                   0.6, (255, 255, 255), 2, cv2.LINE_AA)
+
+
+def resize_to_fit(frame, max_width=MAX_DISPLAY_WIDTH, max_height=MAX_DISPLAY_HEIGHT):
+    """Redimensiona frame mantendo aspect ratio"""
+    height, width = frame.shape[:2]
+    if width == 0 or height == 0:
+        return frame
+    scale = min(max_width / width, max_height / height, 1.0)
+    if scale < 1.0:
+        new_size = (int(width * scale), int(height * scale))
+        frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+class DisplayStats:
+    """Frames exibidos com e sem inferência, e a inferência economizada"""
+
+    def __init__(self):
+        self.inference_frames = 0
+        self.interpolated_frames = 0
+        self.inference_cost = 0.0  # EMA de segundos de inferência por frame
+        self.display_fps = 0.0
+        self.last_display: Optional[float] = None
+
+    def record(self, now: float, inference_seconds: Optional[float] = None) -> None:
+        if inference_seconds is None:
+            self.interpolated_frames += 1
+        else:
+            self.inference_frames += 1
+            self.inference_cost = inference_seconds if not self.inference_cost else (
+                self.inference_cost * (1 - FPS_SMOOTHING_ALPHA) + FPS_SMOOTHING_ALPHA * inference_seconds
+            )
+        if self.last_display is not None and now > self.last_display:
+            instant = 1.0 / (now - self.last_display)
+            self.display_fps = instant if not self.display_fps else (
+                self.display_fps * (1 - FPS_SMOOTHING_ALPHA) + FPS_SMOOTHING_ALPHA * instant
+            )
+        self.last_display = now
+
+    def as_dict(self) -> Dict:
+        total = self.inference_frames + self.interpolated_frames
+        return {
+            'inference_frames': self.inference_frames,
+            'interpolated_frames': self.interpolated_frames,
+            'display_fps': round(self.display_fps, 2),
+            'compute_saved_ratio': round(self.interpolated_frames / total, 4) if total else 0.0,
+            'inference_seconds_saved': round(self.interpolated_frames * self.inference_cost, 2),
+        }
+
+
+class CameraPipeline:
+    """
+    Processa o stream de uma câmera.
+
+    `get_capture()` devolve o VideoCapture atual (fonte da inferência),
+    `get_config()` o config atual da câmera e `publish(frame_bytes, stats)`
+    recebe cada frame processado. `before_frame()` (opcional) roda no início
+    de cada iteração. Com `open_capture(url)` (opcional) o pipeline abre o
+    stream principal de exibição sob demanda (ver stream_sources.py).
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        get_capture: Callable,
+        get_config: Callable[[], Dict],
+        publish: Callable[[Optional[bytes], Dict], None],
+        before_frame: Optional[Callable[[], None]] = None,
+        open_capture: Optional[Callable] = None,
+    ):
+        self.camera_id = camera_id
+        self.get_capture = get_capture
+        self.get_config = get_config
+        self.publish = publish
+        self.before_frame = before_frame
+        self.main_stream = MainStream(camera_id, open_capture) if open_capture is not None else None
+        self.fps_smooth = 0.0
+        self.prev_frame_time: Optional[float] = None
+        self.last_save = 0.0
+        self.stats: Dict = {}
+        self.cascade_stats = CascadeStats()
+        self.tracker = IoUTracker()
+        self.dwell = SpotDwellTracker()
+        self.daily = DailyStatistics(camera_id)
+        # (dia, linha gravada) buscada em background; aplicada no thread do pipeline
+        self.pending_daily_seed: Optional[Tuple] = None
+        self.persisted_status = load_stable_state(camera_id)
+        self.hysteresis = SpotHysteresis(initial=self.persisted_status)
+        self.last_raw_status: Optional[List[bool]] = None  # Status bruto do último frame (base da cascata)
+        self.coalescer = EventCoalescer()
+        self.pending_clips: List[Dict] = []  # Clipes de evidência do evento em agrupamento
+        self.display = DisplayStats()
+        self.metrics = PipelineMetrics()
+        self.last_render: Optional[Dict] = None  # Detecções/vagas da última inferência (para interpolar)
+        self.last_capture_frame = -1
+        self.last_stale_frame: Optional[int] = None
+        self.last_heartbeat = time.time()  # Última iteração do loop (para o supervisor)
+        self.last_frame_at: Optional[float] = None  # Último frame processado
+
+    def run(self, is_running: Callable[[], bool]) -> None:
+        """Loop de processamento enquanto is_running() for verdadeiro"""
+        camera_id = self.camera_id
+        logger.info(f"Starting stream processing for camera {camera_id}")
+
+        wait_started: Optional[float] = None
+        try:
+            while is_running():
+                self.last_heartbeat = time.time()
+                if wait_started is None:
+                    wait_started = time.perf_counter()
+                if self.before_frame is not None:
+                    self.before_frame()
+
+                cap = self.get_capture()
+                if not cap:
+                    time.sleep(0.1)
+                    continue
+
+                grabbed, frame, captured_at, capture_frame = read_capture(cap)
+                if not grabbed or frame is None:
+                    time.sleep(0.1)
+                    continue
+
+                cam_config = self.get_config()
+                interpolate = self.last_render is not None and cam_config.get('interpolate', DISPLAY_INTERPOLATION)
+                if interpolate and rate_controller.next_delay(camera_id) > 0:
+                    if capture_frame is not None and capture_frame == self.last_capture_frame:
+                        time.sleep(0.005)  # Ainda não chegou frame novo da câmera
+                        continue
+                    self.metrics.observe('capture_wait', time.perf_counter() - wait_started)
+                    wait_started = None
+                    self.metrics.record_capture_frame(capture_frame, self.last_capture_frame)
+                    self.last_capture_frame = capture_frame
+                    frame_bytes = self.render_interpolated(frame)
+                    self.stats['display'] = self.display.as_dict()
+                    self.publish_timed(frame_bytes, self.stats, cap, capture_frame, captured_at, inferred=False)
+                    self.wait_for_display_slot(is_running)
+                    continue
+
+                max_age = cam_config.get('max_frame_age') or MAX_FRAME_AGE_SECONDS
+                if captured_at is not None and time.time() - captured_at > max_age:
+                    # Frame vencido: descarta em vez de inferir e espera um mais novo
+                    if capture_frame != self.last_stale_frame:
+                        self.metrics.stale_frames += 1
+                        self.last_stale_frame = capture_frame
+                    time.sleep(0.005)
+                    continue
+
+                self.metrics.observe('capture_wait', time.perf_counter() - wait_started)
+                wait_started = None
+                self.metrics.record_capture_frame(capture_frame, self.last_capture_frame)
+                self.last_capture_frame = capture_frame
+                rate_controller.frame_started(camera_id)
+                frame_bytes, stats = self.process_frame(frame, captured_at)
+                self.publish_timed(frame_bytes, stats, cap, capture_frame, captured_at)
+                self.last_frame_at = time.time()
+                if interpolate:
+                    self.wait_for_display_slot(is_running)
+                else:
+                    self.wait_for_next_slot(is_running)
+        finally:
+            # Evento ainda na janela de agrupamento não pode se perder na parada
+            self.flush_events()
+            rate_controller.remove(camera_id)
+            evidence_store.remove(camera_id)
+            if self.main_stream is not None:
+                self.main_stream.close()
+        logger.info(f"Stopped stream processing for camera {camera_id}")
+
+    def log_occupancy_event(self, event: Dict, total: int, background: bool = True) -> None:
+        """Grava o evento agrupado (com os clipes de evidência pendentes) no Supabase"""
+        if self.pending_clips:
+            event['clips'] = [
+                {'id': clip['id'], 'path': clip['path'], 'frames': clip['frames']} for clip in self.pending_clips
+            ]
+            self.pending_clips = []
+        if not db.is_connected():
+            return
+        kwargs = {
+            'camera_id': self.camera_id,
+            'event_type': 'occupancy_change',
+            'description': f"{event['previous']} -> {event['current']}",
+            'metadata': {**event, 'total': total},
+        }
+        if background:
+            threading.Thread(target=db.log_event, kwargs=kwargs, daemon=True).start()
+        else:
+            db.log_event(**kwargs)
+
+    def flush_events(self) -> None:
+        """Fecha a janela do agrupador na parada; grava direto (o processo pode estar saindo)"""
+        try:
+            event = self.coalescer.flush(time.time(), self.stats.get('occupied', 0), force=True)
+            if event is not None:
+                self.log_occupancy_event(event, self.stats.get('total', 0), background=False)
+        except Exception as e:
+            logger.error(f"Failed to flush occupancy events for camera {self.camera_id}: {e}")
+
+    def publish_timed(self, frame_bytes: Optional[bytes], stats: Dict, cap, capture_frame: Optional[int],
+                      captured_at: Optional[float], inferred: bool = True) -> None:
+        """
+        Publica o frame com o snapshot das métricas, medindo a própria
+        publicação. `stats['freshness']` leva o momento de captura do frame
+        que gerou a ocupação (`captured_at`) e do último JPEG publicado
+        (`display_captured_at`), que também vai no cabeçalho do MJPEG.
+        """
+        if captured_at is not None:
+            now = time.time()
+            freshness = stats.setdefault('freshness', {})
+            if inferred:
+                freshness['captured_at'] = captured_at
+                freshness['pipeline_ms'] = round((now - captured_at) * 1000.0, 1)
+            freshness['display_captured_at'] = captured_at
+            self.metrics.frame_age.observe(now - captured_at)
+        if capture_frame is not None:
+            # Frames que chegaram da câmera enquanto este era processado
+            self.metrics.queues['frames_behind'] = max(getattr(cap, 'frame_count', capture_frame) - capture_frame, 0)
+        stats['metrics'] = self.metrics.as_dict(cap)
+        started = time.perf_counter()
+        self.publish(frame_bytes, stats)
+        evidence_store.record(self.camera_id, captured_at, frame_bytes)
+        self.metrics.observe('publish', time.perf_counter() - started)
+
+    def wait_for_next_slot(self, is_running: Callable[[], bool]) -> None:
+        """Espera até a taxa permitida pelo controlador liberar o próximo frame"""
+        delay = rate_controller.next_delay(self.camera_id)
+        deadline = time.time() + delay
+        while delay > 0 and is_running():
+            time.sleep(min(delay, 0.1))
+            self.last_heartbeat = time.time()
+            delay = deadline - self.last_heartbeat
+
+    def wait_for_display_slot(self, is_running: Callable[[], bool]) -> None:
+        """Limita a exibição interpolada a MAX_DISPLAY_FPS"""
+        last = self.display.last_display
+        if last is None:
+            return
+        delay = last + 1.0 / MAX_DISPLAY_FPS - time.time()
+        if delay > 0 and is_running():
+            time.sleep(delay)
+
+    def display_frame(self, frame, cam_config: Dict) -> Tuple[np.ndarray, float, float]:
+        """
+        Frame em que o overlay é desenhado: o do stream principal, se houver
+        visualizador e ele já estiver entregando frames, senão o próprio
+        frame da inferência. Retorna (cópia do frame, escala x, escala y) da
+        inferência para a exibição.
+        """
+        main_frame = self.main_stream.read(display_source(cam_config)) if self.main_stream is not None else None
+        if main_frame is None:
+            return frame.copy(), 1.0, 1.0
+        if main_frame.shape[1] > CAPTURE_WIDTH or main_frame.shape[0] > CAPTURE_HEIGHT:
+            main_frame = cv2.resize(main_frame, (CAPTURE_WIDTH, CAPTURE_HEIGHT), interpolation=cv2.INTER_AREA)
+        return main_frame, main_frame.shape[1] / frame.shape[1], main_frame.shape[0] / frame.shape[0]
+
+    def render_interpolated(self, frame) -> Optional[bytes]:
+        """Frame de exibição sem inferência: caixas projetadas + vagas da última inferência"""
+        now = time.time()
+        if frame.shape[1] > CAPTURE_WIDTH or frame.shape[0] > CAPTURE_HEIGHT:
+            frame = cv2.resize(frame, (CAPTURE_WIDTH, CAPTURE_HEIGHT), interpolation=cv2.INTER_AREA)
+        render = self.last_render
+        annotated_frame, scale_x, scale_y = self.display_frame(frame, self.get_config())
+        track_ids = render['track_ids']
+        if track_ids is not None and len(track_ids):
+            boxes = self.tracker.predict(track_ids, now)
+            alive = ~np.isnan(boxes).any(axis=1)
+            _, confs, classes = render['detections']
+            annotated_frame = annotate_detections(
+                annotated_frame,
+                scale_detections((boxes[alive], confs[alive], classes[alive]), scale_x, scale_y),
+                track_ids[alive],
+            )
+        if render['areas']:
+            display_areas = scale_areas(render['areas'], annotated_frame.shape[1], annotated_frame.shape[0])
+            draw_parking_overlay(annotated_frame, display_areas, render['status'])
+        self.display.record(now)
+        return self.encode_frame(annotated_frame)
+
+    def encode_frame(self, annotated_frame) -> Optional[bytes]:
+        """Overlay de FPS, redimensionamento para exibição e JPEG"""
+        cv2.putText(
+            annotated_frame,
+            f"FPS: {self.fps_smooth:.1f}",
+            (20, 40),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.8,
+            (0, 255, 0),
+            2,
+            cv2.LINE_AA,
+        )
+
+        started = time.perf_counter()
+        annotated_frame = resize_to_fit(annotated_frame)
+        success, buffer = cv2.imencode('.jpg', annotated_frame, FRAME_JPEG_PARAMS)
+        self.metrics.observe('encode', time.perf_counter() - started)
+        if not success:
+            logger.warning("Failed to encode frame for camera %s", self.camera_id)
+            return None
+        return buffer.tobytes()
+
+    def save_daily_statistics(self) -> None:
+        """
+        Grava o agregado do dia (roda em background). Na primeira vez do dia só
+        busca a linha já gravada: quem altera DailyStatistics é o thread do
+        pipeline (apply_daily_seed), e a gravação fica para a próxima janela,
+        para não sobrescrever o dia com a contagem desde o boot.
+        """
+        day = self.daily.day
+        if self.daily.seeded_day != day:
+            if self.pending_daily_seed is None:
+                self.pending_daily_seed = (day, db.get_daily_statistics_for_date(self.camera_id, day))
+            return
+        db.save_daily_statistics(**self.daily.as_row())
+
+    def apply_daily_seed(self) -> None:
+        """Incorpora a linha buscada por save_daily_statistics (thread do pipeline)"""
+        pending, self.pending_daily_seed = self.pending_daily_seed, None
+        if pending is not None and pending[0] == self.daily.day:
+            self.daily.seed(pending[1])
+
+    def process_frame(self, frame, captured_at: Optional[float] = None) -> Tuple[Optional[bytes], Dict]:
+        """
+        Processa um frame; retorna (JPEG anotado, estatísticas de ocupação).
+        Histerese, permanência e eventos usam o momento de captura do frame
+        (`captured_at`, se conhecido), para frames atrasados não distorcerem
+        as janelas de confirmação.
+        """
+        camera_id = self.camera_id
+        timer = StageTimer(self.metrics)
+
+        # Stream principal reduzido para a resolução de captura; substreams menores
+        # são inferidos na resolução nativa (ampliar só gastaria CPU)
+        if frame.shape[1] > CAPTURE_WIDTH or frame.shape[0] > CAPTURE_HEIGHT:
+            frame = cv2.resize(frame, (CAPTURE_WIDTH, CAPTURE_HEIGHT), interpolation=cv2.INTER_AREA)
+        timer.lap('resize')
+
+        cam_config = self.get_config()
+        raw_areas = cam_config.get('areas', [])
+        imgsz = cam_config.get('imgsz') or DEFAULT_IMGSZ
+        engine = cam_config.get('occupancy_engine') or OCCUPANCY_ENGINE
+        cascade_mode = cam_config.get('cascade_mode') or CASCADE_MODE
+
+        rate_controller.configure(camera_id, cam_config.get('target_fps'), cam_config.get('priority'))
+
+        # Áreas normalizadas -> pixels na resolução do frame processado
+        areas: List[List[List[int]]] = scale_areas(raw_areas, frame.shape[1], frame.shape[0])
+        parking_status: List[bool] = []
+        spot_confidences: Optional[List[float]] = None
+        # A cascata compara com o status bruto anterior: o estável diverge durante toda janela de confirmação
+        previous_status = self.last_raw_status
+        detections = empty_detections()
+        track_ids = None
+        occupancy_started = time.perf_counter()
+
+        # Motor de patches (barato, CPU); cai para o detector se incerto
+        patch_result = classify_spots(camera_id, frame, areas) if engine == 'patch' else None
+        if patch_result is not None:
+            timer.lap('inference')
+            parking_status, spot_confidences = patch_result
+            timer.lap('postprocess')
+            occupants = [True if occupied else None for occupied in parking_status]
+            engine_used = 'patch'
+        else:
+            inference_started = time.perf_counter()
+            detections = detect_vehicles(
+                camera_id, frame, imgsz, areas, previous_status or None, cascade_mode, self.cascade_stats
+            )
+            inference_seconds = time.perf_counter() - inference_started
+            timer.lap('inference')
+            track_ids = self.tracker.update(detections[0])
+            timer.lap('postprocess')
+            occupants = []
+            if areas:
+                parking_status = compute_parking_status(areas, detection_centers(detections))
+                # Vaga ocupada sem track no centro (borda do polígono): ocupante sem id
+                spot_tracks = spot_occupants(track_ids, detections[0], areas, self.dwell.occupants())
+                occupants = [
+                    (track_id if track_id is not None else True) if occupied else None
+                    for occupied, track_id in zip(parking_status, spot_tracks)
+                ]
+            engine_used = 'detector'
+            evaluator = shadow_evaluator
+            if evaluator is not None and areas:
+                evaluator.offer(camera_id, frame, imgsz, areas, parking_status, inference_seconds)
+        occupancy_seconds = time.perf_counter() - occupancy_started
+
+        # FPS suavizado
+        frame_time = time.time()
+        if self.prev_frame_time is not None:
+            delta = frame_time - self.prev_frame_time
+            if delta > 0:
+                fps_instant = 1.0 / delta
+                self.fps_smooth = (
+                    fps_instant
+                    if self.fps_smooth == 0.0
+                    else self.fps_smooth * (1 - FPS_SMOOTHING_ALPHA) + FPS_SMOOTHING_ALPHA * fps_instant
+                )
+        self.prev_frame_time = frame_time
+        fps_smooth = self.fps_smooth
+
+        # Histerese: o status bruto do frame só muda a vaga depois de confirmado
+        state_time = captured_at if captured_at is not None else frame_time
+        raw_status = parking_status
+        self.last_raw_status = list(raw_status)
+        self.hysteresis.configure(cam_config.get('confirm_on_seconds'), cam_config.get('confirm_off_seconds'))
+        parking_status, confirmed_changes = self.hysteresis.update(state_time, raw_status)
+        rate_controller.record(camera_id, occupancy_seconds, bool(confirmed_changes))
+        if parking_status != self.persisted_status:
+            save_stable_state(camera_id, parking_status)
+            self.persisted_status = list(parking_status)
+        if confirmed_changes:
+            clip = evidence_store.capture(camera_id, 'occupancy_change', min_interval=EVIDENCE_MIN_INTERVAL)
+            if clip is not None and clip not in self.pending_clips:
+                self.pending_clips.append(clip)
+
+        occupied_count = 0
+        spot_details: List[Dict] = []
+        # Permanência só sobre o estado confirmado: um frame falso-positivo não vira chegada
+        confirmed_occupants = [
+            (occupant if occupant is not None else True) if occupied else None
+            for occupant, occupied in zip(occupants, parking_status)
+        ]
+        arrivals = self.dwell.update(state_time, confirmed_occupants)
+
+        if areas:
+            occupied_count = sum(parking_status)
+            # Pontos publicados na resolução de referência (CAPTURE_*), qualquer que seja a fonte
+            reference_areas = scale_areas(raw_areas, CAPTURE_WIDTH, CAPTURE_HEIGHT)
+            spot_details = [
+                {
+                    'index': idx,
+                    'occupied': bool(occupied),
+                    'points': area,
+                    **self.dwell.spot_info(idx, state_time),
+                }
+                for idx, (area, occupied) in enumerate(zip(reference_areas, parking_status))
+            ]
+            for spot, raw in zip(spot_details, raw_status):
+                if raw != spot['occupied']:
+                    spot['pending'] = True  # Mudança ainda não confirmada pela histerese
+            self.apply_daily_seed()
+            finished_day = self.daily.record(state_time, occupied_count / len(areas) * 100, arrivals)
+            if finished_day and db.is_connected():
+                threading.Thread(target=db.save_daily_statistics, kwargs=finished_day, daemon=True).start()
+            if spot_confidences is not None:
+                for spot, confidence in zip(spot_details, spot_confidences):
+                    spot['confidence'] = round(float(confidence), 3)
+        timer.lap('occupancy')
+
+        annotated_frame, scale_x, scale_y = self.display_frame(frame, cam_config)
+        annotated_frame = annotate_detections(annotated_frame, scale_detections(detections, scale_x, scale_y), track_ids)
+        if areas:
+            display_areas = scale_areas(raw_areas, annotated_frame.shape[1], annotated_frame.shape[0])
+            draw_parking_overlay(annotated_frame, display_areas, parking_status)
+        timer.lap('overlay')
+
+        stats = {
+            'occupied': occupied_count,
+            'free': max(len(areas) - occupied_count, 0),
+            'total': len(areas),
+            'fps': fps_smooth,
+            'engine': engine_used,
+            'spots': spot_details,
+            'entries_today': self.daily.entries,
+            'avg_dwell_seconds': self.dwell.average_dwell(),
+        }
+        if self.cascade_stats.frames:
+            stats['cascade'] = self.cascade_stats.as_dict()
+        stats['rate'] = rate_controller.snapshot(camera_id)
+        self.stats = stats
+
+        # Mudanças confirmadas viram um único evento por janela, com o delta por vaga
+        occupied_before = occupied_count - sum(1 if after else -1 for _, _, after, _ in confirmed_changes)
+        self.coalescer.add(confirmed_changes, occupied_before)
+        event = self.coalescer.flush(state_time, occupied_count)
+        if event is not None:
+            self.log_occupancy_event(event, len(areas))
+
+        if areas and db.is_connected():
+            current_time = time.time()
+            if current_time - self.last_save >= OCCUPANCY_SAVE_INTERVAL:
+                self.last_save = current_time
+                free_count = len(areas) - occupied_count
+                occupancy_pct = (occupied_count / len(areas) * 100) if len(areas) else 0
+                details_payload = {
+                    'version': PARKING_DETAILS_VERSION,
+                    'spots': spot_details,
+                }
+                threading.Thread(
+                    target=db.save_occupancy,
+                    kwargs={
+                        'camera_id': camera_id,
+                        'total_spots': len(areas),
+                        'occupied_spots': occupied_count,
+                        'free_spots': free_count,
+                        'occupancy_percentage': occupancy_pct,
+                        'fps': fps_smooth,
+                        'details': details_payload,
+                    },
+                    daemon=True,
+                ).start()
+                threading.Thread(target=self.save_daily_statistics, daemon=True).start()
+
+        self.display.record(frame_time, occupancy_seconds)
+        stats['display'] = self.display.as_dict()
+        stats['source'] = {
+            'inference_size': [frame.shape[1], frame.shape[0]],
+            'display_size': [annotated_frame.shape[1], annotated_frame.shape[0]],
+            'main_stream_open': self.main_stream is not None and self.main_stream.is_open,
+            'main_stream_opens': self.main_stream.opens if self.main_stream is not None else 0,
+        }
+        self.last_render = {
+            'detections': detections,
+            'track_ids': track_ids,
+            'areas': raw_areas,
+            'status': parking_status,
+        }
+        return self.encode_frame(annotated_frame), stats
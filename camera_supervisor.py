@@ -0,0 +1,297 @@
+"""
+Supervisor dos pipelines de câmera.
+
+Dono de todas as câmeras em execução (captura + thread de processamento).
+Um watchdog acompanha o heartbeat de cada pipeline e a idade do último
+frame da captura, e reinicia câmeras que travaram (sem frames novos por
+RESTART_AFTER_STALL_SECONDS) ou cujo thread morreu por exceção, com
+backoff exponencial com jitter. As conexões RTSP passam por um semáforo
+compartilhado (MAX_CONCURRENT_CONNECTS), então uma queda geral da rede não
+vira uma avalanche de reconexões simultâneas.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from camera_pipeline import CAPTURE_HEIGHT, CAPTURE_WIDTH, CameraPipeline
+from capture import VideoCapture
+from stream_sources import inference_source
+
+logger = logging.getLogger(__name__)
+
+RESTART_AFTER_STALL_SECONDS = 30
+WATCHDOG_INTERVAL = 2.0
+RESTART_BACKOFF_BASE = 2.0      # seconds
+RESTART_BACKOFF_MAX = 60.0      # seconds
+RESTART_JITTER = 0.5            # delay * uniform(1 - j, 1 + j)
+RESTART_RESET_AFTER = 120.0     # seconds estável para zerar o contador de reinícios
+MAX_CONCURRENT_CONNECTS = int(os.getenv('MAX_CONCURRENT_CONNECTS', '4'))
+
+
+def restart_delay(attempt: int, base: float = RESTART_BACKOFF_BASE,
+                  maximum: float = RESTART_BACKOFF_MAX, jitter: float = RESTART_JITTER) -> float:
+    """Backoff exponencial com jitter para a tentativa `attempt` (1, 2, ...)"""
+    delay = min(base * (2 ** max(attempt - 1, 0)), maximum)
+    return delay * random.uniform(1.0 - jitter, 1.0 + jitter)
+
+
+def stop_capture_async(capture: Optional[VideoCapture]) -> None:
+    """Para a captura sem bloquear o chamador (stop() esperaria o thread por até 65 s)"""
+    if capture is not None:
+        capture.stop(wait=False)
+
+
+class CameraHandle:
+    """Estado supervisionado de uma câmera"""
+
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        self.state = 'starting'  # starting, running, stalled, crashed, restarting, stopped
+        self.generation = 0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.capture: Optional[VideoCapture] = None
+        self.lock = threading.Lock()  # Ordena a publicação da captura com o stop (ver _run_camera)
+        self.pipeline: Optional[CameraPipeline] = None
+        self.requested_at = time.time()
+        self.started_at = self.requested_at
+        self.ready_at: Optional[float] = None  # Primeiro frame publicado (uma vez por start_camera)
+        self.restarts = 0
+        self.total_restarts = 0
+        self.next_restart_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def last_frame_age(self, now: float) -> float:
+        """Segundos desde o último frame novo da captura (ou desde o início)"""
+        capture = self.capture
+        last_frame = capture.last_frame_time if capture is not None else None
+        return now - max(last_frame or 0.0, self.started_at)
+
+    @property
+    def ready(self) -> bool:
+        pipeline = self.pipeline
+        return self.state == 'running' and pipeline is not None and pipeline.last_frame_at is not None
+
+    def health(self, now: float) -> Dict:
+        capture = self.capture
+        pipeline = self.pipeline
+        return {
+            'state': self.state,
+            'ready': self.ready,
+            'startup_seconds': round(self.ready_at - self.requested_at, 2) if self.ready_at else None,
+            'capture_status': capture.status if capture is not None else None,
+            'heartbeat_age': round(now - pipeline.last_heartbeat, 2) if pipeline else None,
+            'last_frame_age': round(self.last_frame_age(now), 2),
+            'restarts': self.total_restarts,
+            'next_restart_in': round(max(self.next_restart_at - now, 0.0), 1) if self.next_restart_at else None,
+            'last_error': self.last_error,
+        }
+
+
+class CameraSupervisor:
+    """
+    Inicia, para e vigia os pipelines de câmera.
+
+    `get_config(camera_id)` devolve o config atual da câmera,
+    `make_publisher(camera_id)` a função publish(frame_bytes, stats) do
+    pipeline e `before_frame` (opcional) roda a cada iteração.
+    """
+
+    def __init__(
+        self,
+        get_config: Callable[[str], Dict],
+        make_publisher: Callable[[str], Callable],
+        before_frame: Optional[Callable[[], None]] = None,
+        stall_seconds: float = RESTART_AFTER_STALL_SECONDS,
+        max_concurrent_connects: int = MAX_CONCURRENT_CONNECTS,
+    ):
+        self.get_config = get_config
+        self.make_publisher = make_publisher
+        self.before_frame = before_frame
+        self.stall_seconds = stall_seconds
+        self.connect_slots = threading.BoundedSemaphore(max(1, max_concurrent_connects))
+        self.handles: Dict[str, CameraHandle] = {}
+        self.lock = threading.Lock()
+        self.watchdog: Optional[threading.Thread] = None
+        self.running = False
+
+    # ---- ciclo de vida ----
+
+    def start(self) -> 'CameraSupervisor':
+        self.running = True
+        self.watchdog = threading.Thread(target=self._watchdog_loop, name="CameraWatchdog", daemon=True)
+        self.watchdog.start()
+        return self
+
+    def shutdown(self) -> None:
+        self.running = False
+        for camera_id in list(self.handles):
+            self.stop_camera(camera_id)
+
+    def start_camera(self, camera_id: str) -> bool:
+        """Inicia a câmera em background; False se já estava rodando"""
+        with self.lock:
+            if camera_id in self.handles:
+                return False
+            handle = CameraHandle(camera_id)
+            self.handles[camera_id] = handle
+        self._spawn(handle)
+        return True
+
+    def stop_camera(self, camera_id: str) -> bool:
+        """Para a câmera sem bloquear; False se não estava rodando"""
+        with self.lock:
+            handle = self.handles.pop(camera_id, None)
+        if handle is None:
+            return False
+        handle.state = 'stopped'
+        self._stop_generation(handle)
+        return True
+
+    def is_running(self, camera_id: str) -> bool:
+        return camera_id in self.handles
+
+    def camera_ids(self) -> List[str]:
+        return list(self.handles)
+
+    def get_capture(self, camera_id: str) -> Optional[VideoCapture]:
+        handle = self.handles.get(camera_id)
+        return handle.capture if handle else None
+
+    def health(self) -> Dict[str, Dict]:
+        now = time.time()
+        return {camera_id: handle.health(now) for camera_id, handle in list(self.handles.items())}
+
+    # ---- internos ----
+
+    def _spawn(self, handle: CameraHandle) -> None:
+        handle.generation += 1
+        with handle.lock:
+            handle.stop_event = threading.Event()
+            handle.capture = None
+        handle.started_at = time.time()
+        handle.next_restart_at = None
+        handle.pipeline = None
+        handle.state = 'starting'
+        handle.thread = threading.Thread(
+            target=self._run_camera,
+            args=(handle, handle.stop_event),
+            name=f"Camera-{handle.camera_id}-{handle.generation}",
+            daemon=True,
+        )
+        handle.thread.start()
+
+    def _stop_generation(self, handle: CameraHandle) -> None:
+        """
+        Sinaliza a parada da geração atual e libera a captura já publicada.
+        Com o lock, ou _run_camera vê o stop_event antes de publicar a
+        captura, ou a captura publicada é vista (e parada) aqui.
+        """
+        with handle.lock:
+            handle.stop_event.set()
+            capture = handle.capture
+        stop_capture_async(capture)
+
+    def _open_capture(self, url: str) -> VideoCapture:
+        return VideoCapture(
+            url,
+            width=CAPTURE_WIDTH,
+            height=CAPTURE_HEIGHT,
+            connect_semaphore=self.connect_slots,
+        )
+
+    def _run_camera(self, handle: CameraHandle, stop_event: threading.Event) -> None:
+        camera_id = handle.camera_id
+        try:
+            config = self.get_config(camera_id)
+            capture = self._open_capture(inference_source(config))
+            with handle.lock:
+                if stop_event.is_set():
+                    return
+                handle.capture = capture
+            capture.start()
+            if stop_event.is_set():
+                # Parado enquanto conectava: quem parou pode ter visto a captura antes do start
+                capture.stop(wait=False)
+                return
+            publish = self.make_publisher(camera_id)
+
+            def publish_and_mark_ready(frame_bytes, stats):
+                if handle.ready_at is None:
+                    handle.ready_at = time.time()
+                    logger.info("Camera %s ready in %.1fs", camera_id, handle.ready_at - handle.requested_at)
+                publish(frame_bytes, stats)
+
+            pipeline = CameraPipeline(
+                camera_id,
+                get_capture=lambda: capture,
+                get_config=lambda: self.get_config(camera_id),
+                publish=publish_and_mark_ready,
+                before_frame=self.before_frame,
+                open_capture=self._open_capture,
+            )
+            handle.pipeline = pipeline
+            handle.state = 'running'
+            pipeline.run(lambda: not stop_event.is_set())
+        except Exception as exc:
+            handle.last_error = f"{type(exc).__name__}: {exc}"
+            logger.exception("Camera %s pipeline crashed", camera_id)
+            if handle.pipeline is not None and handle.pipeline.main_stream is not None:
+                handle.pipeline.main_stream.close()  # O loop não chegou a fechar o principal
+
+    def _schedule_restart(self, handle: CameraHandle, reason: str, now: float) -> None:
+        handle.restarts += 1
+        handle.total_restarts += 1
+        delay = restart_delay(handle.restarts)
+        handle.state = reason
+        handle.next_restart_at = now + delay
+        # Derruba a geração atual; o thread antigo sai sozinho ao ver o stop_event
+        self._stop_generation(handle)
+        logger.warning(
+            "Camera %s %s; restarting in %.1fs (attempt %d)",
+            handle.camera_id, reason, delay, handle.restarts,
+        )
+
+    def _check(self, handle: CameraHandle, now: float) -> None:
+        if handle.next_restart_at is not None:
+            if now >= handle.next_restart_at:
+                handle.state = 'restarting'
+                self._spawn(handle)
+            return
+
+        thread_alive = handle.thread is not None and handle.thread.is_alive()
+        if not thread_alive:
+            self._schedule_restart(handle, 'crashed', now)
+            return
+
+        capture = handle.capture
+        if capture is not None and capture.status == 'reconnecting':
+            return  # A própria captura está reconectando com backoff
+
+        if handle.last_frame_age(now) > self.stall_seconds:
+            self._schedule_restart(handle, 'stalled', now)
+            return
+
+        pipeline = handle.pipeline
+        if pipeline is not None and now - pipeline.last_heartbeat > self.stall_seconds:
+            self._schedule_restart(handle, 'stalled', now)
+            return
+
+        if handle.restarts and now - handle.started_at > RESTART_RESET_AFTER:
+            handle.restarts = 0
+
+    def _watchdog_loop(self) -> None:
+        while self.running:
+            now = time.time()
+            for handle in list(self.handles.values()):
+                if handle.state == 'stopped':
+                    continue
+                try:
+                    self._check(handle, now)
+                except Exception as exc:
+                    logger.error("Watchdog error on camera %s: %s", handle.camera_id, exc)
+            time.sleep(WATCHDOG_INTERVAL)
@@ -0,0 +1,593 @@
+"""
+Pool de processos worker para os pipelines de câmera.
+
+Em modo multiprocesso (CAMERA_WORKERS > 0) as câmeras são distribuídas
+entre N processos worker, cada um com seu próprio interpretador (sem
+disputar o GIL com o Flask) e sua cópia do modelo. Cada câmera tem um
+segmento de memória compartilhada com dois slots — último frame JPEG e
+estatísticas (JSON) — escritos pelo worker e lidos diretamente pelo
+processo da API, sem pickling nem filas.
+
+Os slots usam um seqlock: o escritor incrementa a sequência para ímpar,
+copia os dados e incrementa para par; o leitor repete a leitura se a
+sequência mudou no meio.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAME_SLOT_CAPACITY = 2 * 1024 * 1024   # JPEG 1280x720 fica bem abaixo disso
+STATS_SLOT_CAPACITY = 256 * 1024
+WORKER_STATUS_CAPACITY = 16 * 1024
+WORKER_STATUS_INTERVAL = 1.0             # s entre publicações do estado do modelo de cada worker
+SLOT_HEADER = struct.Struct('<QId')      # seq, tamanho, timestamp
+READ_RETRIES = 5
+
+
+class SharedSlot:
+    """Slot de tamanho variável protegido por seqlock dentro de um buffer compartilhado"""
+
+    def __init__(self, buffer: memoryview, offset: int, capacity: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.capacity = capacity
+        self.data_offset = offset + SLOT_HEADER.size
+
+    @staticmethod
+    def size_for(capacity: int) -> int:
+        return SLOT_HEADER.size + capacity
+
+    def _header(self) -> Tuple[int, int, float]:
+        return SLOT_HEADER.unpack_from(self.buffer, self.offset)
+
+    def write(self, data: bytes, timestamp: Optional[float] = None) -> bool:
+        """Escreve o conteúdo (apenas um escritor por slot)"""
+        if len(data) > self.capacity:
+            return False
+        seq, _, _ = self._header()
+        SLOT_HEADER.pack_into(self.buffer, self.offset, seq + 1, 0, 0.0)
+        self.buffer[self.data_offset:self.data_offset + len(data)] = data
+        SLOT_HEADER.pack_into(
+            self.buffer, self.offset, seq + 2, len(data),
+            timestamp if timestamp is not None else time.time(),
+        )
+        return True
+
+    def sequence(self) -> int:
+        return self._header()[0]
+
+    def read(self, last_seq: int = -1) -> Optional[Tuple[int, bytes, float]]:
+        """
+        Retorna (seq, dados, timestamp), ou None se vazio, inalterado desde
+        last_seq ou se o escritor não liberou o slot após algumas tentativas.
+        """
+        for _ in range(READ_RETRIES):
+            seq, length, timestamp = self._header()
+            if seq == 0 or seq == last_seq:
+                return None
+            if seq % 2:
+                time.sleep(0)
+                continue
+            data = bytes(self.buffer[self.data_offset:self.data_offset + length])
+            if self._header()[0] == seq:
+                return seq, data, timestamp
+        return None
+
+
+class CameraSharedState:
+    """Segmento de memória compartilhada de uma câmera (frame + estatísticas)"""
+
+    def __init__(self, name: str, create: bool = False):
+        size = SharedSlot.size_for(FRAME_SLOT_CAPACITY) + SharedSlot.size_for(STATS_SLOT_CAPACITY)
+        self.shm = create_segment(name, size) if create else shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        buffer = self.shm.buf
+        self.frame = SharedSlot(buffer, 0, FRAME_SLOT_CAPACITY)
+        self.stats = SharedSlot(buffer, SharedSlot.size_for(FRAME_SLOT_CAPACITY), STATS_SLOT_CAPACITY)
+        self.owner = create
+
+    def publish(self, frame_bytes: Optional[bytes], stats: Dict) -> None:
+        captured_at = stats.get('freshness', {}).get('display_captured_at')
+        if frame_bytes is not None and not self.frame.write(frame_bytes, captured_at):
+            logger.warning("Frame of %d bytes exceeds shared slot %s", len(frame_bytes), self.name)
+        self.stats.write(json.dumps(stats, separators=(',', ':')).encode('utf-8'))
+
+    def close(self) -> None:
+        # Libera as views antes de fechar o mapeamento
+        self.frame = self.stats = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (BufferError, FileNotFoundError) as exc:
+            logger.debug("Error releasing shared memory %s: %s", self.name, exc)
+
+
+class WorkerStatus:
+    """
+    Estado do modelo de um worker (carga, aquecimento, troca) em um slot de
+    memória compartilhada: o worker publica, a API lê em /readyz e
+    /api/admin/model.
+    """
+
+    def __init__(self, name: str, create: bool = False):
+        size = SharedSlot.size_for(WORKER_STATUS_CAPACITY)
+        self.shm = create_segment(name, size) if create else shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.slot = SharedSlot(self.shm.buf, 0, WORKER_STATUS_CAPACITY)
+        self.owner = create
+
+    def publish(self, status: Dict) -> None:
+        self.slot.write(json.dumps(status, separators=(',', ':')).encode('utf-8'), time.time())
+
+    def read(self) -> Optional[Dict]:
+        snapshot = self.slot.read()
+        return json.loads(snapshot[1]) if snapshot else None
+
+    def close(self) -> None:
+        self.slot = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (BufferError, FileNotFoundError) as exc:
+            logger.debug("Error releasing shared memory %s: %s", self.name, exc)
+
+
+def create_segment(name: str, size: int) -> shared_memory.SharedMemory:
+    """Cria o segmento; um que sobrou de uma API que caiu é removido e recriado"""
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        logger.warning("Removing stale shared memory segment %s", name)
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+def shm_name(camera_id: str) -> str:
+    """Nome curto (limite de 30 caracteres no macOS) e único por id completo"""
+    return f"ccr_{hashlib.sha1(camera_id.encode('utf-8')).hexdigest()[:16]}"
+
+
+def worker_status_name(index: int) -> str:
+    return f"ccw_{os.getpid()}_{index}"
+
+
+def combine_phases(phases: List[Dict]) -> Dict:
+    """Fase do startup somada entre workers: falha se algum falhou, concluída quando todos concluíram"""
+    for phase in phases:
+        if phase.get('status') == 'failed':
+            return {'status': 'failed', 'error': phase.get('error')}
+    statuses = [phase.get('status') for phase in phases]
+    if statuses and all(status in ('done', 'skipped') for status in statuses):
+        return {'status': 'done', 'seconds': max(phase.get('seconds', 0.0) for phase in phases)}
+    return {'status': 'running' if 'running' in statuses else 'pending'}
+
+
+def worker_main(worker_index: int, commands, budget_share: float = 1.0, status_name: Optional[str] = None) -> None:
+    """
+    Processo worker: recebe comandos ('start', 'config', 'stop', 'evidence', 'display', 'model', 'shutdown')
+    e roda um CameraPipeline por câmera atribuída (sob o CameraSupervisor
+    local, que reinicia pipelines travados), publicando em memória
+    compartilhada. O orçamento de inferência do nó é dividido entre os
+    workers (`budget_share`), já que todos disputam a mesma GPU. O estado
+    do modelo vai para o segmento `status_name` (WorkerStatus).
+    """
+    logging.basicConfig(level=logging.INFO)
+    from camera_supervisor import CameraSupervisor
+    from rate_controller import rate_controller
+    from stream_sources import display_demand
+
+    rate_controller.budget *= budget_share
+
+    configs: Dict[str, Dict] = {}
+    states: Dict[str, CameraSharedState] = {}
+    configs_lock = threading.Lock()
+
+    def get_config(camera_id):
+        with configs_lock:
+            return dict(configs.get(camera_id, {}))
+
+    def make_publisher(camera_id):
+        def publish(frame_bytes, stats):
+            state = states.get(camera_id)
+            if state is not None:
+                state.publish(frame_bytes, stats)
+        return publish
+
+    supervisor = CameraSupervisor(get_config, make_publisher).start()
+
+    # Mesmo formato das fases do startup da API (model_load, warmup)
+    phases = {'model_load': {'status': 'pending'}, 'warmup': {'status': 'pending'}}
+
+    def warm_up():
+        # Carrega o modelo enquanto as primeiras câmeras ainda conectam
+        from camera_pipeline import get_model, warm_up_model
+        for name, step in (('model_load', get_model), ('warmup', warm_up_model)):
+            phases[name] = {'status': 'running'}
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as exc:
+                logger.error("Worker %d: model %s failed: %s", worker_index, name, exc)
+                phases[name] = {'status': 'failed', 'error': str(exc)}
+                if name == 'model_load':
+                    phases['warmup'] = {'status': 'skipped', 'reason': 'model not loaded'}
+                return
+            phases[name] = {'status': 'done', 'seconds': round(time.perf_counter() - started, 3)}
+
+    threading.Thread(target=warm_up, name=f"Worker{worker_index}-Warmup", daemon=True).start()
+
+    status = WorkerStatus(status_name) if status_name else None
+    status_stop = threading.Event()
+
+    def publish_status():
+        import camera_pipeline
+        from model_manager import model_swapper
+        while True:
+            with model_swapper.lock:
+                swap = dict(model_swapper.status)
+            status.publish({'active': camera_pipeline.active_model_path, 'swap': swap, **phases})
+            if status_stop.wait(WORKER_STATUS_INTERVAL):
+                return
+
+    status_thread = None
+    if status is not None:
+        status_thread = threading.Thread(target=publish_status, name=f"Worker{worker_index}-Status", daemon=True)
+        status_thread.start()
+
+    def handle(command) -> None:
+        action = command[0]
+        if action == 'model':
+            from camera_pipeline import DEFAULT_IMGSZ
+            from model_manager import model_swapper
+            with configs_lock:
+                sizes = sorted({int(config.get('imgsz') or DEFAULT_IMGSZ) for config in configs.values()})
+            model_swapper.start(command[1], sizes)
+            return
+        camera_id = command[1]
+        if action == 'config':
+            with configs_lock:
+                configs[camera_id] = command[2]
+        elif action == 'start':
+            if supervisor.is_running(camera_id):
+                with configs_lock:
+                    configs[camera_id] = command[2]
+                return
+            try:
+                state = CameraSharedState(command[3])
+            except FileNotFoundError:
+                # A API já parou a câmera (e removeu o segmento) antes do comando chegar
+                logger.warning("Worker %d: shared memory for camera %s is gone; not starting", worker_index, camera_id)
+                return
+            with configs_lock:
+                configs[camera_id] = command[2]
+            states[camera_id] = state
+            supervisor.start_camera(camera_id)
+        elif action == 'evidence':
+            from evidence_clips import evidence_store
+            evidence_store.capture(camera_id, 'manual', clip_id=command[2])
+        elif action == 'display':
+            display_demand.set(camera_id, command[2])
+        elif action == 'stop':
+            supervisor.stop_camera(camera_id)
+            display_demand.remove(camera_id)
+            with configs_lock:
+                configs.pop(camera_id, None)
+            state = states.pop(camera_id, None)
+            if state:
+                state.close()
+
+    logger.info("Camera worker %d started", worker_index)
+    while True:
+        command = commands.get()
+        if command[0] == 'shutdown':
+            break
+        try:
+            handle(command)
+        except Exception:
+            logger.exception("Worker %d: command %s failed", worker_index, command[:2])
+
+    supervisor.shutdown()
+    for state in states.values():
+        state.close()
+    if status_thread is not None:
+        status_stop.set()
+        status_thread.join(timeout=5.0)
+        status.close()
+    logger.info("Camera worker %d stopped", worker_index)
+
+
+class CameraWorkerPool:
+    """
+    Distribui câmeras entre processos worker e lê seus resultados da
+    memória compartilhada.
+
+    O processo da API cria (e remove) os segmentos; cada câmera vai para o
+    worker com menos câmeras no momento. Um thread monitor recria workers
+    que morreram (com backoff) e reenvia as câmeras atribuídas a eles.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self.context = mp.get_context('spawn')  # CUDA não sobrevive a fork
+        self.processes = []
+        self.queues = []
+        self.statuses: List[WorkerStatus] = []  # Estado do modelo publicado por cada worker
+        self.assignments: Dict[str, int] = {}
+        self.configs: Dict[str, Dict] = {}
+        self.states: Dict[str, CameraSharedState] = {}
+        self.requested_at: Dict[str, float] = {}
+        self.ready_at: Dict[str, float] = {}
+        self.display_until: Dict[str, float] = {}  # Demanda do stream principal (reenviada a workers recriados)
+        self.model_path: Optional[str] = None  # Modelo trocado em runtime (reaplicado a workers recriados)
+        self.restarts = [0] * num_workers
+        self.next_restart_at: Dict[int, float] = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def _spawn_worker(self, index: int):
+        # Segmento novo a cada spawn: nada do estado de um worker que morreu
+        status = WorkerStatus(worker_status_name(index), create=True)
+        commands = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main, args=(index, commands, 1.0 / self.num_workers, status.name),
+            name=f"CameraWorker-{index}", daemon=True,
+        )
+        process.start()
+        return commands, process, status
+
+    def start(self) -> 'CameraWorkerPool':
+        for index in range(self.num_workers):
+            commands, process, status = self._spawn_worker(index)
+            self.queues.append(commands)
+            self.processes.append(process)
+            self.statuses.append(status)
+        self.running = True
+        threading.Thread(target=self._monitor_loop, name="CameraWorkerMonitor", daemon=True).start()
+        logger.info("Started %d camera worker processes", self.num_workers)
+        return self
+
+    def _restart_worker(self, index: int) -> None:
+        self.statuses[index].close()  # O nome é reaproveitado pelo novo segmento
+        commands, process, status = self._spawn_worker(index)
+        with self.lock:
+            self.queues[index] = commands
+            self.processes[index] = process
+            self.statuses[index] = status
+            cameras = [
+                (camera_id, self.configs.get(camera_id, {}), self.states[camera_id].name)
+                for camera_id, worker in self.assignments.items()
+                if worker == index and camera_id in self.states
+            ]
+            display_until = dict(self.display_until)
+        if self.model_path:
+            commands.put(('model', self.model_path))
+        for camera_id, config, name in cameras:
+            commands.put(('start', camera_id, config, name))
+            if camera_id in display_until:
+                commands.put(('display', camera_id, display_until[camera_id]))
+        logger.info("Camera worker %d restarted with %d cameras", index, len(cameras))
+
+    def _check_ready(self, now: float) -> None:
+        """Marca como prontas as câmeras que já publicaram o primeiro frame"""
+        with self.lock:
+            pending = [
+                (camera_id, state) for camera_id, state in self.states.items()
+                if camera_id not in self.ready_at
+            ]
+        for camera_id, state in pending:
+            try:
+                published = state.frame.sequence() > 0
+            except (AttributeError, ValueError):
+                continue
+            if published:
+                self.ready_at[camera_id] = now
+                logger.info(
+                    "Camera %s ready in %.1fs", camera_id, now - self.requested_at.get(camera_id, now),
+                )
+
+    def _monitor_loop(self) -> None:
+        from camera_supervisor import WATCHDOG_INTERVAL, restart_delay
+
+        while self.running:
+            now = time.time()
+            self._check_ready(now)
+            for index, process in enumerate(list(self.processes)):
+                if not self.running or process.is_alive():
+                    continue
+                restart_at = self.next_restart_at.get(index)
+                if restart_at is None:
+                    self.restarts[index] += 1
+                    delay = restart_delay(self.restarts[index])
+                    self.next_restart_at[index] = now + delay
+                    logger.warning(
+                        "Camera worker %d died (exit code %s); restarting in %.1fs",
+                        index, process.exitcode, delay,
+                    )
+                elif now >= restart_at:
+                    del self.next_restart_at[index]
+                    try:
+                        self._restart_worker(index)
+                    except Exception as exc:
+                        logger.error("Failed to restart camera worker %d: %s", index, exc)
+            time.sleep(WATCHDOG_INTERVAL)
+
+    def _least_loaded(self) -> int:
+        load = [0] * self.num_workers
+        for index in self.assignments.values():
+            load[index] += 1
+        return load.index(min(load))
+
+    def start_camera(self, camera_id: str, config: Dict) -> int:
+        """Atribui a câmera a um worker e inicia o pipeline; retorna o índice do worker"""
+        with self.lock:
+            if camera_id in self.assignments:
+                return self.assignments[camera_id]
+            index = self._least_loaded()
+            state = CameraSharedState(shm_name(camera_id), create=True)
+            self.assignments[camera_id] = index
+            self.configs[camera_id] = config
+            self.states[camera_id] = state
+            self.requested_at[camera_id] = time.time()
+            display_until = self.display_until.get(camera_id)
+        self.queues[index].put(('start', camera_id, config, state.name))
+        if display_until is not None:
+            self.queues[index].put(('display', camera_id, display_until))
+        logger.info("Camera %s assigned to worker %d", camera_id, index)
+        return index
+
+    def update_config(self, camera_id: str, config: Dict) -> None:
+        with self.lock:
+            index = self.assignments.get(camera_id)
+            if index is not None:
+                self.configs[camera_id] = config
+        if index is not None:
+            self.queues[index].put(('config', camera_id, config))
+
+    def stop_camera(self, camera_id: str) -> bool:
+        with self.lock:
+            index = self.assignments.pop(camera_id, None)
+            self.configs.pop(camera_id, None)
+            self.requested_at.pop(camera_id, None)
+            self.ready_at.pop(camera_id, None)
+            state = self.states.pop(camera_id, None)
+        if index is None:
+            return False
+        self.queues[index].put(('stop', camera_id))
+        if state:
+            state.close()
+        return True
+
+    def is_running(self, camera_id: str) -> bool:
+        return camera_id in self.assignments
+
+    def capture_evidence(self, camera_id: str, clip_id: str) -> bool:
+        """Pede ao worker da câmera que grave o buffer de evidência como `clip_id`"""
+        with self.lock:
+            index = self.assignments.get(camera_id)
+        if index is None:
+            return False
+        self.queues[index].put(('evidence', camera_id, clip_id))
+        return True
+
+    def set_display_demand(self, camera_id: str, until: float) -> None:
+        """Repassa ao worker da câmera até quando o stream principal deve ficar aberto"""
+        with self.lock:
+            self.display_until[camera_id] = until
+            index = self.assignments.get(camera_id)
+        if index is not None:
+            self.queues[index].put(('display', camera_id, until))
+
+    def swap_model(self, path: str) -> None:
+        """Pede a todos os workers que carreguem e troquem para o modelo `path`"""
+        self.model_path = path
+        for commands in list(self.queues):
+            commands.put(('model', path))
+
+    def readiness(self) -> Dict[str, Dict]:
+        """Por câmera: se já publicou o primeiro frame e quanto tempo levou"""
+        with self.lock:
+            requested = dict(self.requested_at)
+        report = {}
+        for camera_id, requested_at in requested.items():
+            ready_at = self.ready_at.get(camera_id)
+            report[camera_id] = {
+                'ready': ready_at is not None,
+                'startup_seconds': round(ready_at - requested_at, 2) if ready_at else None,
+            }
+        return report
+
+    def model_report(self) -> Dict:
+        """
+        Estado do modelo somado entre os workers vivos: fases de carga e
+        aquecimento, modelo ativo (lista durante uma troca em andamento) e
+        a troca pedida por swap_model, concluída quando todos a aplicaram.
+        """
+        workers = []
+        for index, (process, status) in enumerate(zip(list(self.processes), list(self.statuses))):
+            try:
+                published = status.read()
+            except (AttributeError, ValueError):
+                published = None  # Segmento sendo recriado por _restart_worker
+            workers.append({'index': index, 'alive': process.is_alive(), **(published or {})})
+        alive = [worker for worker in workers if worker['alive']]
+        pending = {'status': 'pending'}
+        active = sorted({worker['active'] for worker in alive if worker.get('active')})
+        swap_states = {worker.get('swap', {}).get('state', 'idle') for worker in alive}
+        if 'loading' in swap_states:
+            swap_state = 'loading'
+        elif 'failed' in swap_states:
+            swap_state = 'failed'
+        elif self.model_path is None:
+            swap_state = 'idle'
+        else:
+            # O comando pode ainda estar na fila de algum worker
+            swap_state = 'done' if alive and active == [self.model_path] else 'loading'
+        return {
+            'active': active[0] if len(active) == 1 else (active or None),
+            'model_load': combine_phases([worker.get('model_load', pending) for worker in alive]),
+            'warmup': combine_phases([worker.get('warmup', pending) for worker in alive]),
+            'swap': {'state': swap_state, 'path': self.model_path},
+            'workers': workers,
+        }
+
+    def read_frame(self, camera_id: str, last_seq: int = -1) -> Optional[Tuple[int, bytes, float]]:
+        """Último frame JPEG publicado: (seq, bytes, momento de captura) ou None"""
+        state = self.states.get(camera_id)
+        try:
+            return state.frame.read(last_seq) if state else None
+        except (AttributeError, ValueError):
+            return None  # Segmento liberado por stop_camera durante a leitura
+
+    def read_stats(self, camera_id: str) -> Optional[Dict]:
+        state = self.states.get(camera_id)
+        try:
+            snapshot = state.stats.read() if state else None
+        except (AttributeError, ValueError):
+            return None
+        return json.loads(snapshot[1]) if snapshot else None
+
+    def workers_info(self):
+        with self.lock:
+            assignments = dict(self.assignments)
+        return [
+            {
+                'index': index,
+                'pid': process.pid,
+                'alive': process.is_alive(),
+                'restarts': self.restarts[index],
+                'cameras': sorted(cid for cid, worker in assignments.items() if worker == index),
+            }
+            for index, process in enumerate(self.processes)
+        ]
+
+    def shutdown(self) -> None:
+        self.running = False
+        for commands in self.queues:
+            commands.put(('shutdown',))
+        for process in self.processes:
+            process.join(timeout=10.0)
+        for status in self.statuses:
+            status.close()
+        with self.lock:
+            states = list(self.states.values())
+            self.states.clear()
+            self.assignments.clear()
+            self.configs.clear()
+            self.requested_at.clear()
+            self.ready_at.clear()
+        for state in states:
+            state.close()
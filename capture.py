@@ -6,6 +6,11 @@ import sys
 import logging
 import math # Para backoff exponencial
 import os
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from metrics import Histogram
 
 # Obtém logger específico para este módulo
 logger = logging.getLogger(__name__)
@@ -15,13 +20,125 @@ MAX_RECONNECT_ATTEMPTS = None # None para infinito, ou um número alto (ex: 1000
 INITIAL_RECONNECT_DELAY = 2   # Delay inicial em segundos (2s)
 MAX_RECONNECT_DELAY = 60      # Delay máximo em segundos (1 min)
 BACKOFF_FACTOR = 1.5          # Fator exponencial (menor que 2 para crescimento mais suave)
+PTS_REFERENCE_WINDOW = 600    # Janela (s) da referência relógio-PTS; absorve deriva do relógio da câmera
+
+# Fontes de replay (arquivo local ou sintética) para testes de carga sem câmeras
+DEFAULT_REPLAY_FPS = 25.0
+SYNTHETIC_CARS = 12
+
+
+def parse_replay_source(src):
+    """
+    Reconhece fontes de replay; retorna as opções ou None para fontes ao vivo.
+
+    - caminho de arquivo local: loop em fps nativo
+    - replay:///caminho/video.mp4?loop=1&pace=native&offset=12.5
+    - synthetic://?fps=25&seed=3&offset=0&width=640&height=360
+
+    `pace`: 'native' (fps do arquivo), 'unpaced' (o mais rápido possível) ou
+    um número de fps. `offset` (s) desloca o início, para várias câmeras
+    virtuais a partir do mesmo arquivo. `start` (epoch) fixa o instante do
+    frame 0; os timestamps são sempre start + índice / fps. Um `start` que já
+    passou na primeira abertura é ignorado (vale o instante da abertura): os
+    frames nasceriam mais velhos que MAX_FRAME_AGE_SECONDS e o pipeline
+    descartaria tudo, e um restart do supervisor precisa conseguir recriar a
+    câmera com a mesma URL. `width`/`height` fixam a resolução da fonte
+    sintética (ex.: simular um substream). `pace` e `fps` numéricos <= 0 são
+    rejeitados (ValueError).
+    """
+    if not isinstance(src, str):
+        return None
+    if os.path.isfile(src):
+        parsed, kind, path = None, 'file', src
+    else:
+        parsed = urlparse(src)
+        if parsed.scheme == 'synthetic':
+            kind, path = 'synthetic', None
+        elif parsed.scheme in ('replay', 'file'):
+            kind, path = 'file', parsed.netloc + parsed.path
+        else:
+            return None
+    query = {key: values[-1] for key, values in parse_qs(parsed.query).items()} if parsed else {}
+    pace = query.get('pace', 'native')
+    if pace not in ('native', 'unpaced'):
+        pace = float(pace)
+        if not pace > 0:
+            raise ValueError(f"replay pace must be 'native', 'unpaced' or a positive fps, got {query['pace']!r}")
+    fps = float(query['fps']) if 'fps' in query else None
+    if fps is not None and not fps > 0:
+        raise ValueError(f"replay fps must be positive, got {query['fps']!r}")
+    return {
+        'kind': kind,
+        'path': path,
+        'loop': query.get('loop', '1') != '0',
+        'pace': pace,
+        'fps': fps,
+        'offset': float(query.get('offset', 0.0)),
+        'seed': int(query.get('seed', 0)),
+        'start': float(query['start']) if 'start' in query else None,
+        'width': int(query['width']) if 'width' in query else None,
+        'height': int(query['height']) if 'height' in query else None,
+    }
+
+
+class SyntheticSource:
+    """
+    Fonte sintética com a parte da interface do cv2.VideoCapture usada aqui:
+    retângulos "carros" se movendo sobre um fundo fixo, determinísticos pela
+    semente e pelo índice do frame.
+    """
+
+    def __init__(self, width, height, fps=DEFAULT_REPLAY_FPS, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.seed = seed
+        self.index = 0
+        self.opened = True
+        self.background = np.random.default_rng(seed).integers(60, 120, (height, width, 3), dtype=np.uint8)
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        frame = self.background.copy()
+        for car in range(SYNTHETIC_CARS):
+            x = int((self.index * (car + 1) * 3 + car * 97 + self.seed * 31) % self.width)
+            y = int((car * 53 + self.seed * 17) % self.height)
+            cv2.rectangle(frame, (x, y), (x + 80, y + 40), (30 + car * 15, 40, 200), -1)
+        self.index += 1
+        return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            return self.index * 1000.0 / self.fps
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.index)
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.index = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.opened = False
 
 class VideoCapture:
     """
     Classe otimizada para captura de vídeo usando um thread dedicado,
     com lógica de reconexão automática para streams.
     """
-    def __init__(self, src=0, width=640, height=480, backend=None):
+    def __init__(self, src=0, width=640, height=480, backend=None, connect_semaphore=None):
         self.src = src
         self.width = width
         self.height = height
@@ -30,10 +147,23 @@ class VideoCapture:
         self.status = "initializing" # Estados: initializing, connected, reconnecting, failed, stopped
         self.grabbed = False         # Último status de cap.read()
         self.frame = None            # Último frame lido com sucesso
+        self.frame_count = 0         # Total de frames lidos com sucesso
+        self.last_frame_time = None  # time.time() do último frame lido com sucesso
+        self.frame_timestamp = None  # Momento estimado de captura do último frame (ver _stamp_frame)
+        self._min_pts_offset = None  # Menor (relógio - PTS) na janela atual
+        self._previous_min_offset = None # Menor (relógio - PTS) na janela anterior
+        self._pts_window_start = 0.0
         self.started = False         # Flag para controlar o loop do thread
         self.read_lock = threading.Lock() # Lock para acesso seguro a frame, grabbed, status, cap
         self.reconnect_attempts = 0  # Contador de tentativas de reconexão
+        self.reconnects = 0          # Total de quedas da conexão (métrica)
+        self.read_histogram = Histogram() # Tempo de cada cap.read() (rede + decodificação)
         self.thread: threading.Thread = None # O objeto do thread
+        self.connect_semaphore = connect_semaphore # Limita conexões RTSP simultâneas entre câmeras (opcional)
+        self.replay = parse_replay_source(src) # Opções de replay (arquivo/sintética) ou None se ao vivo
+        self.replay_fps = None       # fps dos timestamps/ritmo do replay
+        self._replay_epoch = None    # Instante do frame 0 do replay
+        self._replay_index = 0       # Índice do último frame entregue (contínuo entre loops)
         self._log_extra = {'source': self.src} # Contexto base para logs
         logger.info("Objeto VideoCapture criado.", extra=self._log_extra)
 
@@ -42,7 +172,18 @@ class VideoCapture:
         Tenta (re)estabelecer a conexão com a fonte de vídeo.
         Retorna True se bem-sucedido, False caso contrário.
         Deve ser chamado com o read_lock adquirido se acessando self.cap.
+        Se houver connect_semaphore, espera uma vaga antes de abrir a fonte
+        (evita uma avalanche de reconexões quando a rede inteira oscila).
         """
+        if self.connect_semaphore is None:
+            return self._open_source()
+        with self.connect_semaphore:
+            if not self.started:
+                return False # stop() chamado enquanto aguardava a vez
+            return self._open_source()
+
+    def _open_source(self) -> bool:
+        """Abre a fonte e valida o primeiro frame (ver _connect)."""
         logger.info("Tentando conectar/reconectar...", extra=self._log_extra)
         # Libera captura antiga se existir
         if self.cap is not None:
@@ -53,6 +194,9 @@ class VideoCapture:
                 logger.warning(f"Erro não crítico ao liberar captura antiga: {e_rel}", extra=self._log_extra)
             self.cap = None
 
+        if self.replay is not None:
+            return self._open_replay()
+
         # Tenta criar nova captura
         try:
             open_backends = []
@@ -97,6 +241,11 @@ class VideoCapture:
             # Atualiza estado inicial seguro (já estamos dentro de um lock ou antes do thread)
             self.grabbed = True
             self.frame = frame
+            self.frame_count += 1
+            self.last_frame_time = time.time()
+            self._min_pts_offset = self._previous_min_offset = None # PTS recomeça (ou salta) a cada conexão
+            self._pts_window_start = self.last_frame_time
+            self._stamp_frame(self.cap, self.last_frame_time)
             self.status = "connected"
             self.reconnect_attempts = 0 # Reseta tentativas ao conectar
             return True
@@ -105,6 +254,106 @@ class VideoCapture:
              if self.cap: self.cap.release(); self.cap=None # Garante liberação
              return False
 
+    def _open_replay(self) -> bool:
+        """Abre a fonte de replay (arquivo ou sintética) e posiciona no offset."""
+        options = self.replay
+        try:
+            if options['kind'] == 'synthetic':
+                cap = SyntheticSource(
+                    options['width'] or self.width, options['height'] or self.height,
+                    options['fps'] or DEFAULT_REPLAY_FPS, options['seed'],
+                )
+            else:
+                cap = cv2.VideoCapture(options['path'])
+            if cap is None or not cap.isOpened():
+                logger.error("Falha ao abrir fonte de replay.", extra=self._log_extra)
+                return False
+
+            native_fps = options['fps'] or cap.get(cv2.CAP_PROP_FPS) or DEFAULT_REPLAY_FPS
+            self.replay_fps = options['pace'] if isinstance(options['pace'], float) else native_fps
+            if options['offset']:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, round(options['offset'] * native_fps))
+
+            grabbed, frame = cap.read()
+            if not grabbed:
+                logger.error("Falha ao ler primeiro frame do replay.", extra=self._log_extra)
+                cap.release()
+                return False
+
+            self.cap = cap
+            if self._replay_epoch is None:
+                now = time.time()
+                if options['start'] is not None and options['start'] < now:
+                    logger.warning(f"Início do replay ({options['start']:.3f}) já passou; usando o instante da abertura.",
+                                   extra=self._log_extra)
+                self._replay_epoch = max(options['start'] or 0.0, now)
+            logger.info(f"Replay aberto ({options['kind']}, {self.replay_fps:.1f} fps, pace={options['pace']}).", extra=self._log_extra)
+            self.grabbed = True
+            self.frame = frame
+            self.frame_count += 1
+            self.last_frame_time = time.time()
+            self.frame_timestamp = self._replay_epoch + self._replay_index / self.replay_fps
+            self.status = "connected"
+            self.reconnect_attempts = 0
+            return True
+        except Exception as e_conn:
+            logger.error(f"Exceção ao abrir replay: {e_conn}", exc_info=False, extra=self._log_extra)
+            return False
+
+    def _pace_replay(self):
+        """
+        Avança o índice do replay e, se houver ritmo, espera até o instante do
+        frame. Retorna o timestamp determinístico do frame.
+        """
+        self._replay_index += 1
+        due = self._replay_epoch + self._replay_index / self.replay_fps
+        if self.replay['pace'] != 'unpaced':
+            while self.started:
+                remaining = due - time.time()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, 0.1))
+        return due
+
+    def _rewind_replay(self, cap) -> bool:
+        """Fim do arquivo: volta ao início se em loop. False se o replay terminou."""
+        if not self.replay['loop']:
+            logger.info("Fim do arquivo de replay (sem loop).", extra=self._log_extra)
+            return False
+        if not cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+            # Alguns containers não aceitam seek: reabre o arquivo. Com o read_lock,
+            # como na reconexão, para read() não ver cap/frame trocando no meio
+            with self.read_lock:
+                return self._open_source()
+        return True
+
+    def _stamp_frame(self, cap, now):
+        """
+        Estima quando o frame foi capturado. time.time() na leitura não enxerga o
+        atraso acumulado no buffer do FFmpeg (max_delay), então compara o PTS do
+        stream com o relógio: o menor (relógio - PTS) das duas últimas janelas
+        de PTS_REFERENCE_WINDOW é a referência, e o excedente é o tempo que o
+        frame passou em buffers. Deve ser chamado com o read_lock adquirido.
+        """
+        try:
+            pts = cap.get(cv2.CAP_PROP_POS_MSEC)
+        except Exception:
+            pts = 0
+        if not pts or pts <= 0:
+            self.frame_timestamp = now
+            return
+        offset = now - pts / 1000.0
+        if now - self._pts_window_start >= PTS_REFERENCE_WINDOW:
+            self._previous_min_offset = self._min_pts_offset
+            self._min_pts_offset = None
+            self._pts_window_start = now
+        if self._min_pts_offset is None or offset < self._min_pts_offset:
+            self._min_pts_offset = offset
+        reference = self._min_pts_offset
+        if self._previous_min_offset is not None:
+            reference = min(reference, self._previous_min_offset)
+        self.frame_timestamp = now - (offset - reference)
+
     def set(self, prop_id, value):
         """Define uma propriedade da captura OpenCV."""
         with self.read_lock:
@@ -161,7 +410,15 @@ class VideoCapture:
             # Tenta ler o frame fora do lock principal para permitir chamadas a read()
             if current_cap_ref:
                 try:
+                    read_started = time.perf_counter()
                     grabbed, frame = current_cap_ref.read()
+                    self.read_histogram.observe(time.perf_counter() - read_started)
+                    if not grabbed and self.started and self.replay is not None:
+                        # Fim do arquivo de replay: loop (sem reconexão) ou encerra
+                        if self._rewind_replay(current_cap_ref):
+                            continue
+                        self.started = False
+                        break
                     if not grabbed and self.started: # Verifica 'started' de novo, pode ter sido parado enquanto lia
                         logger.warning("Falha ao ler frame (grabbed=False). Iniciando reconexão...", extra=self._log_extra)
                         capture_error = True
@@ -176,9 +433,16 @@ class VideoCapture:
             # --- Processamento do Resultado da Leitura ---
             if grabbed and frame is not None:
                 # Sucesso na leitura
+                replay_timestamp = self._pace_replay() if self.replay is not None else None
                 with self.read_lock:
                     self.grabbed = True
                     self.frame = frame
+                    self.frame_count += 1
+                    self.last_frame_time = time.time()
+                    if replay_timestamp is not None:
+                        self.frame_timestamp = replay_timestamp
+                    else:
+                        self._stamp_frame(current_cap_ref, self.last_frame_time)
                     # Se estava reconectando, volta para conectado e reseta tentativas
                     if self.status == "reconnecting":
                         logger.info("Reconexão bem sucedida!", extra=self._log_extra)
@@ -193,6 +457,8 @@ class VideoCapture:
             if self.started and (not grabbed or capture_error):
                 with self.read_lock: # Atualiza status para 'reconnecting'
                     if self.status != "failed": # Só tenta se não falhou permanentemente
+                        if self.status == "connected":
+                            self.reconnects += 1
                         self.status = "reconnecting"
                         self.grabbed = False # Garante que read() retorne False
                     else:
@@ -253,8 +519,23 @@ class VideoCapture:
             current_status = self.status
         return current_grabbed, frame_copy, current_status
 
-    def stop(self):
-        """Sinaliza para o thread parar e espera (com timeout) sua finalização."""
+    def read_timed(self):
+        """
+        Como read(), mas também retorna o momento estimado de captura do frame
+        e o contador de frames, lidos atomicamente com o frame.
+        Retorna: (grabbed, frame, status, captured_at, frame_count)
+        """
+        with self.read_lock:
+            frame_copy = self.frame.copy() if self.frame is not None else None
+            current_grabbed = self.grabbed and self.status == "connected"
+            return current_grabbed, frame_copy, self.status, self.frame_timestamp, self.frame_count
+
+    def stop(self, wait=True):
+        """
+        Sinaliza para o thread parar e espera (com timeout) sua finalização.
+        Com wait=False apenas sinaliza e retorna; o próprio thread libera o
+        recurso e marca 'stopped' ao sair do loop.
+        """
         if not self.started and self.status not in ["initializing", "failed"]:
              # Se nunca iniciou ou já está 'stopped', não faz nada
              # logger.debug("Tentativa de stop() em captura não iniciada/já parada.", extra=self._log_extra)
@@ -265,6 +546,10 @@ class VideoCapture:
         self.started = False
         thread_to_join = self.thread # Pega referência local
 
+        if not wait:
+            logger.info("Parada sinalizada (sem aguardar o thread).", extra=self._log_extra)
+            return
+
         if thread_to_join and thread_to_join.is_alive():
              logger.debug("Aguardando thread finalizar...", extra=self._log_extra)
              # Espera um tempo razoável (maior que o delay de reconexão pode ajudar)
@@ -0,0 +1,169 @@
+"""
+Cascata de detectores: modelo nano em todo frame, modelo maior sob demanda.
+
+O modelo leve (yolo11n) roda em todos os frames. Só quando o resultado é
+ambíguo para alguma vaga (detecção com confiança baixa, caixa com centro
+perto da borda da vaga ou mudança de estado em relação ao último frame) o
+modelo pesado é chamado — no frame inteiro ou apenas no recorte das vagas
+ambíguas.
+"""
+
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from calibration import box_iou_matrix
+
+CASCADE_MODES = ('off', 'frame', 'crop')
+LOW_CONFIDENCE = 0.45        # Detecção dentro da vaga abaixo disso escala
+BORDER_MARGIN_RATIO = 0.15   # Centro a menos de 15% do lado da caixa da borda = ambíguo
+CROP_PADDING_RATIO = 0.25    # Folga do recorte em torno da vaga
+CROP_NMS_IOU = 0.5           # Caixas de recortes com IoU acima disso são o mesmo veículo
+CROP_NMS_CONTAINMENT = 0.8   # ... ou com essa fração da menor dentro da maior (carro cortado pela borda)
+
+Detections = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (xyxy, conf, cls)
+
+
+def empty_detections() -> Detections:
+    return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32), np.empty((0,), dtype=np.int64)
+
+
+def find_ambiguous_spots(
+    polygons: Sequence[Sequence[Sequence[int]]],
+    detections: Detections,
+    status: Sequence[bool],
+    previous_status: Optional[Sequence[bool]],
+    low_confidence: float = LOW_CONFIDENCE,
+    border_margin_ratio: float = BORDER_MARGIN_RATIO,
+) -> Dict[int, str]:
+    """Retorna {índice da vaga: motivo} para as vagas que precisam do modelo pesado"""
+    ambiguous: Dict[int, str] = {}
+    if previous_status is not None and len(previous_status) == len(status):
+        for idx, (before, now) in enumerate(zip(previous_status, status)):
+            if before != now:
+                ambiguous[idx] = 'state_change'
+
+    boxes, confs, _ = detections
+    if not len(boxes) or not polygons:
+        return ambiguous
+
+    contours = [np.array(pts, dtype=np.int32) for pts in polygons]
+    for xyxy, conf in zip(boxes, confs):
+        center = (float((xyxy[0] + xyxy[2]) / 2), float((xyxy[1] + xyxy[3]) / 2))
+        margin = border_margin_ratio * float(min(xyxy[2] - xyxy[0], xyxy[3] - xyxy[1]))
+        for idx, pts in enumerate(contours):
+            if idx in ambiguous:
+                continue
+            distance = cv2.pointPolygonTest(pts, center, True)
+            if distance >= 0 and conf < low_confidence:
+                ambiguous[idx] = 'low_confidence'
+            elif abs(distance) < margin:
+                ambiguous[idx] = 'border'
+    return ambiguous
+
+
+def spot_crop_rect(polygon: Sequence[Sequence[int]], frame_shape,
+                   padding_ratio: float = CROP_PADDING_RATIO) -> Tuple[int, int, int, int]:
+    """Retângulo (x1, y1, x2, y2) em volta da vaga, com folga e limitado ao frame"""
+    height, width = frame_shape[:2]
+    x, y, w, h = cv2.boundingRect(np.array(polygon, dtype=np.int32))
+    pad_x, pad_y = int(w * padding_ratio), int(h * padding_ratio)
+    return (
+        max(x - pad_x, 0),
+        max(y - pad_y, 0),
+        min(x + w + pad_x, width),
+        min(y + h + pad_y, height),
+    )
+
+
+def suppress_duplicates(boxes: np.ndarray, confs: np.ndarray, iou_threshold: float = CROP_NMS_IOU,
+                        containment: float = CROP_NMS_CONTAINMENT) -> np.ndarray:
+    """
+    NMS guloso por confiança; retorna os índices mantidos (em ordem crescente).
+
+    Além do IoU, descarta a caixa que tem `containment` da sua área (ou da
+    outra) coberta por uma já mantida: o mesmo carro visto inteiro num
+    recorte e cortado pela borda do recorte vizinho tem IoU baixo.
+    """
+    if len(boxes) < 2:
+        return np.arange(len(boxes))
+    iou = box_iou_matrix(boxes, boxes)
+    areas = np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1e-9)
+    inter = iou * (areas[:, None] + areas[None, :]) / (1.0 + iou)
+    covered = inter / np.minimum(areas[:, None], areas[None, :])
+    duplicate = (iou >= iou_threshold) | (covered >= containment)
+    kept = []
+    for idx in np.argsort(-confs, kind='stable'):
+        if not any(duplicate[idx, other] for other in kept):
+            kept.append(idx)
+    return np.sort(np.array(kept, dtype=np.int64))
+
+
+def merge_crop_detections(base: Detections, crops: Sequence[Tuple[Tuple[int, int, int, int], Detections]]) -> Detections:
+    """
+    Substitui as detecções leves dentro dos recortes pelas do modelo pesado.
+
+    As caixas de cada recorte são deslocadas para coordenadas do frame.
+    Recortes com folga se sobrepõem quando as vagas são vizinhas, então o
+    mesmo veículo pode vir de dois recortes: as caixas dos recortes passam
+    por suppress_duplicates antes de entrar no resultado.
+    """
+    boxes, confs, classes = base
+    keep = np.ones(len(boxes), dtype=bool)
+    if len(boxes):
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        for (x1, y1, x2, y2), _ in crops:
+            inside = (centers[:, 0] >= x1) & (centers[:, 0] < x2) & (centers[:, 1] >= y1) & (centers[:, 1] < y2)
+            keep &= ~inside
+
+    crop_boxes = [np.empty((0, 4), dtype=np.float32)]
+    crop_confs = [np.empty((0,), dtype=np.float32)]
+    crop_classes = [np.empty((0,), dtype=np.int64)]
+    for (x1, y1, _, _), (rect_boxes, rect_confs, rect_classes) in crops:
+        if not len(rect_boxes):
+            continue
+        crop_boxes.append(rect_boxes.astype(np.float32) + np.array([x1, y1, x1, y1], dtype=np.float32))
+        crop_confs.append(rect_confs)
+        crop_classes.append(rect_classes)
+    crop_boxes = np.concatenate(crop_boxes).astype(np.float32)
+    crop_confs = np.concatenate(crop_confs).astype(np.float32)
+    crop_classes = np.concatenate(crop_classes).astype(np.int64)
+    unique = suppress_duplicates(crop_boxes, crop_confs)
+    return (
+        np.concatenate([boxes[keep], crop_boxes[unique]]).astype(np.float32),
+        np.concatenate([confs[keep], crop_confs[unique]]).astype(np.float32),
+        np.concatenate([classes[keep], crop_classes[unique]]).astype(np.int64),
+    )
+
+
+class CascadeStats:
+    """Contadores de escalonamento de uma câmera"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.escalations = 0
+        self.escalated_spots = 0
+        self.reasons: Dict[str, int] = {}
+
+    def record(self, ambiguous: Dict[int, str]) -> None:
+        with self.lock:
+            self.frames += 1
+            if not ambiguous:
+                return
+            self.escalations += 1
+            self.escalated_spots += len(ambiguous)
+            for reason in ambiguous.values():
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'frames': self.frames,
+                'escalations': self.escalations,
+                'escalation_rate': round(self.escalations / self.frames, 4) if self.frames else 0.0,
+                'escalated_spots': self.escalated_spots,
+                'reasons': dict(self.reasons),
+            }
@@ -6,6 +6,8 @@ from typing import List, Tuple
 import cv2
 import numpy as np
 
+from spot_geometry import normalize_areas, parse_reference_size, scale_areas
+
 Point = Tuple[int, int]
 Polygon = List[Point]
 
@@ -148,7 +150,7 @@ def load_background(source: str) -> np.ndarray:
     return image
 
 
-def load_existing(json_path: Path) -> List[Polygon]:
+def load_existing(json_path: Path, image_size: Tuple[int, int]) -> List[Polygon]:
     if not json_path.exists():
         return []
     try:
@@ -156,29 +158,26 @@ def load_existing(json_path: Path) -> List[Polygon]:
     except json.JSONDecodeError as exc:
         raise RuntimeError(f"Erro ao interpretar {json_path}: {exc}") from exc
 
-    polygons = []
-    for item in data.get("areas", []):
-        pts = item.get("points")
-        if isinstance(pts, list) and len(pts) == 4:
-            polygon = []
-            valid = True
-            for pt in pts:
-                if isinstance(pt, (list, tuple)) and len(pt) == 2:
-                    polygon.append((int(pt[0]), int(pt[1])))
-                else:
-                    valid = False
-                    break
-            if valid:
-                polygons.append(polygon)
-    return polygons
+    raw = [item.get("points") for item in data.get("areas", [])]
+    # Arquivos antigos (pixels sem resolução de referência) assumem a imagem atual
+    reference = parse_reference_size(data.get("reference_size"), default=image_size)
+    normalized = normalize_areas(raw, reference)
+    return [
+        [(x, y) for x, y in polygon]
+        for polygon in scale_areas(normalized, image_size[0], image_size[1])
+    ]
 
 
-def save_polygons(json_path: Path, polygons: List[Polygon]) -> None:
+def save_polygons(json_path: Path, polygons: List[Polygon], image_size: Tuple[int, int]) -> None:
     data = {
+        "reference_size": [int(image_size[0]), int(image_size[1])],
         "areas": [
-            {"id": idx + 1, "points": [[int(x), int(y)] for x, y in polygon]}
-            for idx, polygon in enumerate(polygons)
-        ]
+            {"id": idx + 1, "points": points}
+            for idx, points in enumerate(normalize_areas(
+                [[[int(x), int(y)] for x, y in polygon] for polygon in polygons],
+                image_size,
+            ))
+        ],
     }
     json_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
 
@@ -194,7 +193,8 @@ def main() -> None:
     json_path = Path(args.output)
     load_path = Path(args.load) if args.load else json_path
 
-    existing_polygons = load_existing(load_path)
+    image_size = (background.shape[1], background.shape[0])
+    existing_polygons = load_existing(load_path, image_size)
     annotator = ParkingAreaAnnotator(background, existing=existing_polygons)
 
     cv2.namedWindow(annotator.window, cv2.WINDOW_NORMAL)
@@ -210,7 +210,7 @@ def main() -> None:
         elif key == 27:  # ESC
             break
         elif key in {ord("s"), ord("S")}:
-            save_polygons(json_path, annotator.polygons)
+            save_polygons(json_path, annotator.polygons, image_size)
             annotator.status_message = f"Vagas salvas em {json_path}."
             annotator.reset_canvas()
         elif key in {ord("u"), ord("U")}:
@@ -230,7 +230,7 @@ def main() -> None:
     cv2.destroyAllWindows()
 
     if annotator.polygons:
-        save_polygons(json_path, annotator.polygons)
+        save_polygons(json_path, annotator.polygons, image_size)
         print(f"Anotações salvas em {json_path.resolve()}")
     else:
         print("Nenhuma vaga salva.")
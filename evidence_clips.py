@@ -0,0 +1,225 @@
+"""
+Clipes de evidência das mudanças de ocupação.
+
+Cada câmera guarda em memória os últimos EVIDENCE_SECONDS de JPEGs — os
+mesmos bytes já codificados para o stream, sem recodificar — amostrados a
+no máximo EVIDENCE_FPS e limitados a EVIDENCE_MAX_MB por câmera. Numa
+mudança de vaga confirmada (a histerese confirma segundos depois da
+transição, então o buffer já contém o momento da mudança) ou sob demanda,
+a sequência de frames é gravada em disco por um thread de escrita, fora do
+pipeline:
+
+    evidence_clips/<câmera>/<clip_id>/frame_0000.jpg ... + index.json
+
+O evento de ocupação leva a referência do clipe em `metadata['clips']`.
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVIDENCE_SECONDS = float(os.getenv('EVIDENCE_SECONDS', '10'))  # 0 desliga
+EVIDENCE_FPS = float(os.getenv('EVIDENCE_FPS', '5'))
+EVIDENCE_MAX_MB = float(os.getenv('EVIDENCE_MAX_MB', '8'))  # Por câmera
+EVIDENCE_DIR = Path(os.getenv('EVIDENCE_DIR', 'evidence_clips'))
+EVIDENCE_KEEP_CLIPS = int(os.getenv('EVIDENCE_KEEP_CLIPS', '500'))  # Por câmera, em disco
+# Mudanças a menos disso do último clipe compartilham o mesmo clipe
+EVIDENCE_MIN_INTERVAL = float(os.getenv('EVIDENCE_MIN_INTERVAL', str(EVIDENCE_SECONDS / 2)))
+EVIDENCE_WRITE_QUEUE = 16  # Clipes aguardando gravação; além disso são descartados
+
+CLIP_INDEX = 'index.json'
+
+
+def safe_name(value: str) -> str:
+    return ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(value))
+
+
+def clip_dir(camera_id: str, clip_id: str, directory: Path = EVIDENCE_DIR) -> Path:
+    return directory / safe_name(camera_id) / safe_name(clip_id)
+
+
+def new_clip_id(reason: str, now: Optional[float] = None) -> str:
+    now = time.time() if now is None else now
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{safe_name(reason)}"
+
+
+class FrameRing:
+    """JPEGs dos últimos `seconds`, com teto de bytes e de taxa"""
+
+    def __init__(self, seconds: float = EVIDENCE_SECONDS, max_fps: float = EVIDENCE_FPS,
+                 max_bytes: int = int(EVIDENCE_MAX_MB * 1024 * 1024)):
+        self.seconds = seconds
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.max_bytes = max_bytes
+        self.frames: Deque[Tuple[float, bytes]] = deque()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, captured_at: float, frame_bytes: bytes) -> None:
+        with self.lock:
+            if self.frames:
+                delta = captured_at - self.frames[-1][0]
+                if 0 <= delta < self.min_interval:
+                    return
+                if delta < 0:  # Relógio voltou (replay reiniciado, troca de fonte)
+                    self.frames.clear()
+                    self.bytes = 0
+            self.frames.append((captured_at, frame_bytes))
+            self.bytes += len(frame_bytes)
+            while self.frames and (
+                self.frames[0][0] < captured_at - self.seconds or self.bytes > self.max_bytes
+            ):
+                self.bytes -= len(self.frames.popleft()[1])
+
+    def snapshot(self) -> List[Tuple[float, bytes]]:
+        with self.lock:
+            return list(self.frames)
+
+
+class EvidenceStore:
+    """Buffers por câmera (no processo que roda o pipeline) e o thread de gravação"""
+
+    def __init__(self, seconds: float = EVIDENCE_SECONDS, directory: Path = EVIDENCE_DIR):
+        self.seconds = seconds
+        self.directory = directory
+        self.rings: Dict[str, FrameRing] = {}
+        self.last_clip: Dict[str, Tuple[float, Dict]] = {}
+        self.lock = threading.Lock()
+        self.pending: "queue.Queue[Tuple[Path, Dict, List[Tuple[float, bytes]]]]" = queue.Queue(EVIDENCE_WRITE_QUEUE)
+        self.writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.seconds > 0
+
+    def record(self, camera_id: str, captured_at: Optional[float], frame_bytes: Optional[bytes]) -> None:
+        """Guarda o JPEG publicado (chamado a cada frame; O(1) amortizado)"""
+        if not self.enabled or frame_bytes is None:
+            return
+        ring = self.rings.get(camera_id)
+        if ring is None:
+            with self.lock:
+                ring = self.rings.setdefault(camera_id, FrameRing(self.seconds))
+        ring.add(captured_at or time.time(), frame_bytes)
+
+    def remove(self, camera_id: str) -> None:
+        with self.lock:
+            self.rings.pop(camera_id, None)
+            self.last_clip.pop(camera_id, None)
+
+    def capture(self, camera_id: str, reason: str, clip_id: Optional[str] = None,
+                min_interval: float = 0.0) -> Optional[Dict]:
+        """
+        Agenda a gravação do buffer atual e devolve a referência do clipe.
+        Dentro de `min_interval` desde o último clipe da câmera devolve o
+        mesmo (mudanças em sequência compartilham a evidência).
+        """
+        ring = self.rings.get(camera_id)
+        frames = ring.snapshot() if ring is not None else []
+        if not frames:
+            return None
+        now = time.time()
+        with self.lock:
+            last = self.last_clip.get(camera_id)
+            if last is not None and now - last[0] < min_interval:
+                return last[1]
+            clip_id = clip_id or new_clip_id(reason, now)
+            clip = {
+                'id': clip_id,
+                'camera_id': camera_id,
+                'reason': reason,
+                'path': str(clip_dir(camera_id, clip_id, self.directory)),
+                'frames': len(frames),
+                'start': frames[0][0],
+                'end': frames[-1][0],
+            }
+        try:
+            self.pending.put_nowait((clip_dir(camera_id, clip_id, self.directory), clip, frames))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Evidence writer is behind; dropping clip %s for camera %s", clip_id, camera_id)
+            return None
+        with self.lock:
+            self.last_clip[camera_id] = (now, clip)
+        self._ensure_writer()
+        return clip
+
+    def _ensure_writer(self) -> None:
+        with self.lock:
+            if self.writer is None or not self.writer.is_alive():
+                self.writer = threading.Thread(target=self._write_loop, name="EvidenceWriter", daemon=True)
+                self.writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            path, clip, frames = self.pending.get()
+            try:
+                write_clip(path, clip, frames)
+                self.written += 1
+                prune_clips(path.parent, EVIDENCE_KEEP_CLIPS)
+            except Exception as exc:
+                logger.error("Failed to write evidence clip %s: %s", path, exc)
+
+
+def write_clip(path: Path, clip: Dict, frames: List[Tuple[float, bytes]]) -> None:
+    """Grava os JPEGs e o index.json (por último: clipe com índice está completo)"""
+    path.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for idx, (captured_at, frame_bytes) in enumerate(frames):
+        name = f"frame_{idx:04d}.jpg"
+        with open(path / name, 'wb') as f:
+            f.write(frame_bytes)
+        entries.append({'file': name, 'captured_at': captured_at})
+    tmp_path = path / (CLIP_INDEX + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({**clip, 'frames': entries}, f)
+    os.replace(tmp_path, path / CLIP_INDEX)
+
+
+def prune_clips(camera_dir: Path, keep: int) -> None:
+    """Mantém só os `keep` clipes mais recentes da câmera (ids ordenam por data)"""
+    clips = sorted(entry for entry in camera_dir.iterdir() if entry.is_dir())
+    for old in clips[:max(len(clips) - keep, 0)]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def list_clips(camera_id: str, directory: Path = EVIDENCE_DIR) -> List[Dict]:
+    """Clipes completos gravados da câmera, mais recentes primeiro"""
+    camera_dir = directory / safe_name(camera_id)
+    if not camera_dir.is_dir():
+        return []
+    clips = []
+    for entry in sorted(camera_dir.iterdir(), reverse=True):
+        index = entry / CLIP_INDEX
+        if not index.is_file():
+            continue
+        try:
+            with open(index, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        clips.append({**data, 'frames': len(data.get('frames', []))})
+    return clips
+
+
+def load_clip(camera_id: str, clip_id: str, directory: Path = EVIDENCE_DIR) -> Optional[Dict]:
+    index = clip_dir(camera_id, clip_id, directory) / CLIP_INDEX
+    try:
+        with open(index, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+evidence_store = EvidenceStore()
@@ -0,0 +1,184 @@
+"""
+Último frame JPEG de cada câmera com notificação de frame novo.
+
+Os pipelines publicam aqui (threads) ou o FrameHubPump copia da memória
+compartilhada dos workers; os streams MJPEG esperam o próximo frame em vez
+de reenviar o mesmo em loop. Há espera para threads (`wait`, servidor
+Flask) e para asyncio (`wait_async`, modo ASGI): a publicação acorda as
+threads da câmera e resolve um único future por event loop, então cada
+visualizador custa uma corrotina, não um thread.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAME_POLL_INTERVAL = 0.01  # Segundos entre leituras da memória compartilhada (modo worker)
+
+Frame = Tuple[int, bytes, Optional[float]]  # (seq, JPEG, momento de captura)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FrameHub:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames: Dict[str, Frame] = {}
+        self.conditions: Dict[str, threading.Condition] = {}
+        self.async_waiters: Dict[str, Dict[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self.viewers: Dict[str, int] = {}
+        # Chamado com (camera_id, True) no primeiro visualizador e (camera_id, False) quando o último sai
+        self.viewer_listener: Optional[Callable[[str, bool], None]] = None
+        self.listener_lock = threading.Lock()
+        self.seq = 0
+
+    def _condition(self, camera_id: str) -> threading.Condition:
+        condition = self.conditions.get(camera_id)
+        if condition is None:
+            condition = self.conditions[camera_id] = threading.Condition(self.lock)
+        return condition
+
+    def _wake(self, camera_id: str) -> None:
+        """Acorda quem espera pela câmera (chamado com o lock adquirido)"""
+        condition = self.conditions.get(camera_id)
+        if condition is not None:
+            condition.notify_all()
+        for loop, future in self.async_waiters.pop(camera_id, {}).items():
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # Event loop já encerrado
+
+    def publish(self, camera_id: str, frame_bytes: bytes, captured_at: Optional[float] = None) -> None:
+        with self.lock:
+            self.seq += 1
+            self.frames[camera_id] = (self.seq, frame_bytes, captured_at)
+            self._wake(camera_id)
+
+    def remove(self, camera_id: str) -> None:
+        """Câmera parada: descarta o frame e libera quem está esperando"""
+        with self.lock:
+            self.frames.pop(camera_id, None)
+            self._wake(camera_id)
+            self.conditions.pop(camera_id, None)
+
+    def latest(self, camera_id: str) -> Optional[Frame]:
+        return self.frames.get(camera_id)
+
+    def wait(self, camera_id: str, last_seq: int, timeout: float) -> Optional[Frame]:
+        """Bloqueia até haver frame diferente de last_seq; None no timeout"""
+        with self.lock:
+            frame = self.frames.get(camera_id)
+            if frame is None or frame[0] == last_seq:
+                self._condition(camera_id).wait(timeout)
+                frame = self.frames.get(camera_id)
+        return frame if frame is not None and frame[0] != last_seq else None
+
+    async def wait_async(self, camera_id: str, last_seq: int, timeout: float) -> Optional[Frame]:
+        """Como wait(), sem bloquear o event loop"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            frame = self.frames.get(camera_id)
+            if frame is not None and frame[0] != last_seq:
+                return frame
+            waiters = self.async_waiters.setdefault(camera_id, {})
+            future = waiters.get(loop)
+            if future is None or future.done():
+                future = waiters[loop] = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        frame = self.frames.get(camera_id)
+        return frame if frame is not None and frame[0] != last_seq else None
+
+    def _notify_viewers(self, camera_id: str) -> None:
+        """Avisa o listener do estado atual (serializado: o último aviso vale)"""
+        listener = self.viewer_listener
+        if listener is None:
+            return
+        with self.listener_lock:
+            try:
+                listener(camera_id, camera_id in self.viewers)
+            except Exception as exc:
+                logger.warning("Viewer listener failed for camera %s: %s", camera_id, exc)
+
+    @contextmanager
+    def watch(self, camera_id: str):
+        """Marca um visualizador ativo (o pump só copia frames de câmeras assistidas)"""
+        with self.lock:
+            first = camera_id not in self.viewers
+            self.viewers[camera_id] = self.viewers.get(camera_id, 0) + 1
+        if first:
+            self._notify_viewers(camera_id)
+        try:
+            yield
+        finally:
+            with self.lock:
+                remaining = self.viewers.get(camera_id, 1) - 1
+                if remaining > 0:
+                    self.viewers[camera_id] = remaining
+                else:
+                    self.viewers.pop(camera_id, None)
+            if remaining <= 0:
+                self._notify_viewers(camera_id)
+
+    def watched(self) -> List[str]:
+        with self.lock:
+            return list(self.viewers)
+
+    def viewer_counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.viewers)
+
+
+class FrameHubPump:
+    """
+    Modo worker: um único thread copia os frames novos da memória
+    compartilhada para o hub, só das câmeras com visualizadores.
+    `read_frame(camera_id, last_seq)` segue CameraWorkerPool.read_frame.
+    """
+
+    def __init__(self, hub: FrameHub, read_frame: Callable[[str, int], Optional[Frame]],
+                 interval: float = FRAME_POLL_INTERVAL):
+        self.hub = hub
+        self.read_frame = read_frame
+        self.interval = interval
+        self.last_seq: Dict[str, int] = {}
+        self.running = False
+
+    def start(self) -> 'FrameHubPump':
+        self.running = True
+        threading.Thread(target=self._loop, name="FrameHubPump", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+
+    def _loop(self) -> None:
+        while self.running:
+            watched = self.hub.watched()
+            for camera_id in watched:
+                try:
+                    snapshot = self.read_frame(camera_id, self.last_seq.get(camera_id, -1))
+                except Exception as exc:
+                    logger.debug("Failed to read shared frame for %s: %s", camera_id, exc)
+                    continue
+                if snapshot is not None:
+                    seq, frame_bytes, captured_at = snapshot
+                    self.last_seq[camera_id] = seq
+                    self.hub.publish(camera_id, frame_bytes, captured_at or None)
+            for camera_id in set(self.last_seq) - set(watched):
+                self.last_seq.pop(camera_id, None)
+            time.sleep(self.interval)
+
+
+frame_hub = FrameHub()
@@ -0,0 +1,130 @@
+"""
+Redução do histórico de ocupação para gráficos.
+
+Uma semana de snapshots (um por minuto por câmera) tem ~10 mil linhas, mas
+um gráfico precisa de algumas centenas de pontos. Dois métodos:
+
+- buckets: janelas de tempo fixas (alinhadas ao epoch) com média, mínimo e
+  máximo da ocupação, preservando picos e vales de cada janela;
+- lttb: Largest-Triangle-Three-Buckets, escolhe linhas reais que mantêm o
+  formato visual da curva.
+"""
+
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Colunas lidas do Supabase para séries (sem o JSONB `details`)
+SERIES_COLUMNS = 'timestamp,total_spots,occupied_spots,free_spots,occupancy_percentage'
+DOWNSAMPLE_METHODS = ('buckets', 'lttb')
+MIN_POINTS = 2
+MAX_POINTS = 5000
+MIN_BUCKET_SECONDS = 1
+MAX_BUCKET_SECONDS = 7 * 24 * 3600
+MAX_HISTORY_HOURS = 31 * 24  # Janela máxima da série reduzida (cada ponto bruto é lido e agregado aqui)
+
+
+def parse_points(value) -> Optional[int]:
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        return None
+    return points if MIN_POINTS <= points <= MAX_POINTS else None
+
+
+def parse_bucket_seconds(value) -> Optional[int]:
+    try:
+        seconds = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if MIN_BUCKET_SECONDS <= seconds <= MAX_BUCKET_SECONDS else None
+
+
+def parse_hours(value) -> Optional[int]:
+    try:
+        hours = int(value)
+    except (TypeError, ValueError):
+        return None
+    return hours if 1 <= hours <= MAX_HISTORY_HOURS else None
+
+
+def parse_method(value) -> Optional[str]:
+    return value if value in DOWNSAMPLE_METHODS else None
+
+
+def parse_timestamp(value: str) -> float:
+    """ISO 8601 do PostgREST (com 'Z' ou offset) -> epoch em segundos"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def bucket_seconds_for(window_seconds: float, points: int) -> int:
+    """Largura de bucket (s) para caber a janela em ~points pontos"""
+    return max(MIN_BUCKET_SECONDS, math.ceil(window_seconds / points))
+
+
+def bucket_series(rows: Sequence[Dict], bucket_seconds: int) -> List[Dict]:
+    """
+    Agrega as linhas em janelas de bucket_seconds (buckets vazios são omitidos).
+    `rows` em ordem cronológica, com as colunas de SERIES_COLUMNS.
+    """
+    if not rows:
+        return []
+    times = np.array([parse_timestamp(row['timestamp']) for row in rows])
+    percentage = np.array([float(row['occupancy_percentage']) for row in rows])
+    occupied = np.array([float(row['occupied_spots']) for row in rows])
+    free = np.array([float(row['free_spots']) for row in rows])
+    total = np.array([int(row['total_spots']) for row in rows])
+
+    bucket_ids = np.floor(times / bucket_seconds).astype(np.int64)
+    # Linhas já ordenadas: cada bucket é um trecho contíguo
+    starts = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+    counts = np.diff(np.r_[starts, len(rows)])
+
+    series = []
+    for bucket_id, start, count in zip(bucket_ids[starts], starts, counts):
+        end = start + count
+        window = percentage[start:end]
+        series.append({
+            'timestamp': datetime.fromtimestamp(int(bucket_id) * bucket_seconds, tz=timezone.utc).isoformat(),
+            'occupancy_percentage': round(float(window.mean()), 2),
+            'occupancy_min': round(float(window.min()), 2),
+            'occupancy_max': round(float(window.max()), 2),
+            'occupied_spots': round(float(occupied[start:end].mean()), 2),
+            'free_spots': round(float(free[start:end].mean()), 2),
+            'total_spots': int(total[start:end].max()),
+            'samples': int(count),
+        })
+    return series
+
+
+def lttb(rows: Sequence[Dict], threshold: int) -> List[Dict]:
+    """Largest-Triangle-Three-Buckets sobre (timestamp, occupancy_percentage)"""
+    if threshold >= len(rows):
+        return list(rows)
+    if threshold < 3:
+        return [rows[0], rows[-1]]
+    x = np.array([parse_timestamp(row['timestamp']) for row in rows])
+    y = np.array([float(row['occupancy_percentage']) for row in rows])
+
+    selected = [0]
+    every = (len(rows) - 2) / (threshold - 2)
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start = int(math.floor(bucket * every)) + 1
+        end = int(math.floor((bucket + 1) * every)) + 1
+        next_end = min(int(math.floor((bucket + 2) * every)) + 1, len(rows))
+        # Média do próximo bucket (o último ponto fecha a série)
+        if end < next_end:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        areas = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(areas))
+        selected.append(anchor)
+    selected.append(len(rows) - 1)
+    return [rows[idx] for idx in selected]
@@ -12,6 +12,7 @@ from ultralytics import YOLO
 from ultralytics.utils.plotting import Annotator, colors
 
 from capture import VideoCapture
+from spot_geometry import normalize_areas, parse_reference_size, scale_areas
 
 app = Flask(__name__)
 
@@ -40,7 +41,7 @@ MAX_DISPLAY_WIDTH = 1280
 MAX_DISPLAY_HEIGHT = 720
 fps_smooth = 0.0
 prev_frame_time = None
-parking_areas: List[np.ndarray] = []
+parking_areas: List[List[List[float]]] = []  # Coordenadas normalizadas (0..1)
 parking_status: List[bool] = []
 parking_last_loaded = 0.0
 parking_file_mtime: float | None = None
@@ -71,7 +72,7 @@ def resolve_class_ids(names_map, target_names) -> Set[int]:
     return resolved
 
 
-def load_parking_areas_from_json(path: Path) -> List[np.ndarray]:
+def load_parking_areas_from_json(path: Path) -> List[List[List[float]]]:
     if not path.exists():
         return []
     try:
@@ -80,22 +81,16 @@ def load_parking_areas_from_json(path: Path) -> List[np.ndarray]:
         print(f"[parking] Erro ao interpretar {path}: {exc}")
         return []
 
-    polygons: List[np.ndarray] = []
-    for item in data.get("areas", []):
-        points = item.get("points")
-        if not isinstance(points, list) or len(points) != 4:
-            continue
-        polygon = []
-        valid = True
-        for pt in points:
-            if isinstance(pt, (list, tuple)) and len(pt) == 2:
-                polygon.append((int(pt[0]), int(pt[1])))
-            else:
-                valid = False
-                break
-        if valid and len(polygon) == 4:
-            polygons.append(np.array(polygon, dtype=np.int32))
-    return polygons
+    # Arquivos sem reference_size assumem a resolução de captura
+    reference = parse_reference_size(
+        data.get("reference_size"), default=(CAPTURE_WIDTH, CAPTURE_HEIGHT)
+    )
+    return normalize_areas([item.get("points") for item in data.get("areas", [])], reference)
+
+
+def parking_polygons_for(frame: np.ndarray) -> List[np.ndarray]:
+    height, width = frame.shape[:2]
+    return [np.array(polygon, dtype=np.int32) for polygon in scale_areas(parking_areas, width, height)]
 
 
 def ensure_parking_areas_loaded(force: bool = False) -> None:
@@ -366,8 +361,9 @@ def process_stream():
 
         fps_label = fps_smooth if fps_smooth > 0 else 0.0
         if parking_areas:
-            parking_status[:] = compute_parking_status(parking_areas, vehicle_centers)
-            draw_parking_overlay(annotated_frame, parking_areas, parking_status)
+            polygons = parking_polygons_for(annotated_frame)
+            parking_status[:] = compute_parking_status(polygons, vehicle_centers)
+            draw_parking_overlay(annotated_frame, polygons, parking_status)
 
         cv2.putText(
             annotated_frame,
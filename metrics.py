@@ -0,0 +1,183 @@
+"""
+Instrumentação do pipeline das câmeras e exportação no formato Prometheus.
+
+Cada câmera mantém histogramas cumulativos (buckets fixos) do tempo de cada
+etapa do processamento e contadores de frames descartados/duplicados e
+reconexões. O snapshot vai junto das estatísticas publicadas pela câmera
+(`stats['metrics']`), então funciona igual com threads e com workers em
+processos separados; `render_prometheus` monta o texto servido em /metrics.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Limites superiores dos buckets em segundos (o +Inf é implícito)
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+STAGES = (
+    'capture_wait', 'resize', 'inference', 'postprocess', 'occupancy',
+    'overlay', 'encode', 'publish',
+)
+METRIC_PREFIX = 'parking'
+
+
+class Histogram:
+    """Histograma de latência com buckets fixos; observe() é O(log buckets)"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def as_dict(self) -> Dict:
+        return {'buckets': list(self.counts), 'sum': round(self.sum, 6), 'count': self.count}
+
+
+class PipelineMetrics:
+    """Histogramas por etapa e contadores de uma câmera"""
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        self.dropped_frames = 0     # Frames capturados que nunca foram processados nem exibidos
+        self.duplicate_frames = 0   # Mesmo frame da câmera processado de novo
+        self.stale_frames = 0       # Frames descartados por passar do prazo de frescor
+        self.frame_age = Histogram()  # Idade do frame (captura -> publicação)
+        self.queues: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stages[stage].observe(seconds)
+
+    def record_capture_frame(self, capture_frame: Optional[int], last_frame: int) -> None:
+        """Conta frames pulados/repetidos a partir do contador do VideoCapture"""
+        if capture_frame is None or last_frame < 0:
+            return
+        if capture_frame == last_frame:
+            self.duplicate_frames += 1
+        elif capture_frame > last_frame + 1:
+            self.dropped_frames += capture_frame - last_frame - 1
+
+    def as_dict(self, capture=None) -> Dict:
+        snapshot = {
+            'stages': {stage: histogram.as_dict() for stage, histogram in self.stages.items()},
+            'dropped_frames': self.dropped_frames,
+            'duplicate_frames': self.duplicate_frames,
+            'stale_frames': self.stale_frames,
+            'frame_age': self.frame_age.as_dict(),
+            'queues': dict(self.queues),
+        }
+        if capture is not None:
+            snapshot['reconnects'] = getattr(capture, 'reconnects', 0)
+            read_histogram = getattr(capture, 'read_histogram', None)
+            if read_histogram is not None:
+                snapshot['stages']['capture_read'] = read_histogram.as_dict()
+        return snapshot
+
+
+class StageTimer:
+    """Cronômetro de etapas: lap(stage) registra o tempo desde o último lap"""
+
+    __slots__ = ('metrics', 'last')
+
+    def __init__(self, metrics: PipelineMetrics):
+        self.metrics = metrics
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.metrics.observe(stage, elapsed)
+        self.last = now
+        return elapsed
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render_prometheus(cameras: Dict[str, Dict], process_queues: Optional[Dict[str, int]] = None,
+                      caches: Optional[Dict[str, Dict]] = None) -> str:
+    """
+    Texto de exposição Prometheus a partir de {camera_id: stats publicados}.
+    Câmeras sem `metrics` (ainda sem frame) aparecem só no gauge `up`.
+    `caches` são os contadores de caches de consulta ({nome: cache.stats()}).
+    """
+    stage_name = f'{METRIC_PREFIX}_stage_seconds'
+    age_name = f'{METRIC_PREFIX}_frame_age_seconds'
+    lines: List[str] = [
+        f'# HELP {stage_name} Time spent in each camera pipeline stage.',
+        f'# TYPE {stage_name} histogram',
+    ]
+    age_lines: List[str] = [
+        f'# HELP {age_name} Age of published frames since capture.',
+        f'# TYPE {age_name} histogram',
+    ]
+    counters: Dict[str, List[str]] = {
+        'frames_dropped_total': [], 'frames_duplicate_total': [], 'frames_stale_total': [],
+        'capture_reconnects_total': [], 'cache_requests_total': [], 'cache_evictions_total': [],
+    }
+    gauges: Dict[str, List[str]] = {
+        'camera_up': [], 'camera_fps': [], 'spots_occupied': [], 'queue_depth': [], 'cache_entries': [],
+    }
+
+    for camera_id, stats in sorted(cameras.items()):
+        stats = stats or {}
+        snapshot = stats.get('metrics')
+        gauges['camera_up'].append(f'{_labels(camera=camera_id)} {1 if snapshot else 0}')
+        if not snapshot:
+            continue
+        gauges['camera_fps'].append(f"{_labels(camera=camera_id)} {float(stats.get('fps') or 0.0):.3f}")
+        gauges['spots_occupied'].append(f"{_labels(camera=camera_id)} {int(stats.get('occupied') or 0)}")
+        for stage, histogram in snapshot.get('stages', {}).items():
+            _append_histogram(lines, stage_name, histogram, camera=camera_id, stage=stage)
+        if snapshot.get('frame_age'):
+            _append_histogram(age_lines, age_name, snapshot['frame_age'], camera=camera_id)
+        counters['frames_dropped_total'].append(f"{_labels(camera=camera_id)} {snapshot.get('dropped_frames', 0)}")
+        counters['frames_duplicate_total'].append(f"{_labels(camera=camera_id)} {snapshot.get('duplicate_frames', 0)}")
+        counters['frames_stale_total'].append(f"{_labels(camera=camera_id)} {snapshot.get('stale_frames', 0)}")
+        counters['capture_reconnects_total'].append(f"{_labels(camera=camera_id)} {snapshot.get('reconnects', 0)}")
+        for queue_name, depth in snapshot.get('queues', {}).items():
+            gauges['queue_depth'].append(f'{_labels(camera=camera_id, queue=queue_name)} {depth}')
+
+    for queue_name, depth in (process_queues or {}).items():
+        gauges['queue_depth'].append(f'{_labels(camera="", queue=queue_name)} {depth}')
+
+    for cache_name, cache_stats in (caches or {}).items():
+        for result, key in (('hit', 'hits'), ('miss', 'misses'), ('coalesced', 'coalesced')):
+            counters['cache_requests_total'].append(f'{_labels(cache=cache_name, result=result)} {cache_stats[key]}')
+        counters['cache_evictions_total'].append(f"{_labels(cache=cache_name)} {cache_stats['evictions']}")
+        gauges['cache_entries'].append(f"{_labels(cache=cache_name)} {cache_stats['entries']}")
+
+    lines.extend(age_lines)
+    _append_family(lines, counters, 'counter')
+    _append_family(lines, gauges, 'gauge')
+    return '\n'.join(lines) + '\n'
+
+
+def _append_histogram(lines: List[str], name: str, histogram: Dict, **labels) -> None:
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram['buckets']):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{_labels(**labels, le=le)} {cumulative}')
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram['count']}")
+
+
+def _append_family(lines: List[str], families: Dict[str, Iterable[str]], kind: str) -> None:
+    for name, samples in families.items():
+        metric = f'{METRIC_PREFIX}_{name}'
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.extend(f'{metric}{sample}' for sample in samples)
@@ -0,0 +1,227 @@
+"""
+Troca do modelo YOLO em produção e avaliação sombra.
+
+A troca carrega e aquece o novo modelo em background e só então o coloca
+no caminho de inferência (camera_pipeline.swap_model), sem derrubar os
+streams. O modo sombra roda um modelo candidato em uma fração amostrada dos
+frames, fora do thread da câmera, e compara latência e ocupação das vagas
+com o modelo em produção.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+import camera_pipeline
+from camera_pipeline import (
+    DEFAULT_IMGSZ,
+    compute_parking_status,
+    detection_centers,
+    extract_detections,
+    load_yolo,
+    run_detection,
+    warm_up_model,
+)
+
+logger = logging.getLogger(__name__)
+
+MODEL_SUFFIXES = ('.pt', '.onnx', '.engine', '.torchscript')
+SHADOW_SAMPLE_RATE = 0.1
+SHADOW_QUEUE_SIZE = 4        # Frames aguardando o candidato; excedente é descartado
+LATENCY_WINDOW = 512         # Amostras de latência guardadas por câmera
+
+
+def is_valid_model_path(path) -> bool:
+    return isinstance(path, str) and path.strip() != '' and path.lower().endswith(MODEL_SUFFIXES)
+
+
+def load_and_warm(path: str, sizes: Sequence[int]):
+    """Carrega o modelo e roda o aquecimento em cada imgsz; retorna (modelo, tempos)"""
+    started = time.perf_counter()
+    detector = load_yolo(path)
+    loaded = time.perf_counter()
+    for imgsz in sizes or (DEFAULT_IMGSZ,):
+        warm_up_model(imgsz, detector=detector)
+    return detector, {
+        'load_seconds': round(loaded - started, 3),
+        'warmup_seconds': round(time.perf_counter() - loaded, 3),
+    }
+
+
+def latency_summary(samples) -> Dict:
+    if not samples:
+        return {'count': 0}
+    values = np.fromiter(samples, dtype=np.float64) * 1000.0
+    return {
+        'count': int(len(values)),
+        'mean_ms': round(float(values.mean()), 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+    }
+
+
+class ModelSwapper:
+    """Uma troca de modelo por vez, com o estado exposto para a API"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status: Dict = {'state': 'idle'}
+
+    def start(self, path: str, sizes: Sequence[int]) -> bool:
+        """Inicia a troca em background; False se já há uma em andamento"""
+        with self.lock:
+            if self.status.get('state') == 'loading':
+                return False
+            self.status = {'state': 'loading', 'path': path, 'requested_at': time.time()}
+        threading.Thread(target=self._run, args=(path, list(sizes)), name="ModelSwap", daemon=True).start()
+        return True
+
+    def _run(self, path: str, sizes) -> None:
+        previous = camera_pipeline.active_model_path
+        try:
+            detector, timings = load_and_warm(path, sizes)
+            camera_pipeline.swap_model(detector, path)
+        except Exception as exc:
+            logger.error("Model swap to %s failed: %s", path, exc)
+            with self.lock:
+                self.status.update({'state': 'failed', 'error': str(exc)})
+            return
+        with self.lock:
+            self.status.update({'state': 'done', 'previous': previous, 'swapped_at': time.time(), **timings})
+
+
+class CameraShadowStats:
+    def __init__(self):
+        self.frames = 0
+        self.frames_with_disagreement = 0
+        self.spots_compared = 0
+        self.spots_disagreeing = 0
+        self.live_latency = deque(maxlen=LATENCY_WINDOW)
+        self.candidate_latency = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self) -> Dict:
+        return {
+            'frames': self.frames,
+            'frame_disagreement_rate': round(self.frames_with_disagreement / self.frames, 4) if self.frames else 0.0,
+            'spot_disagreement_rate': round(self.spots_disagreeing / self.spots_compared, 4) if self.spots_compared else 0.0,
+            'live_latency': latency_summary(self.live_latency),
+            'candidate_latency': latency_summary(self.candidate_latency),
+        }
+
+
+class ShadowEvaluator:
+    """
+    Roda um modelo candidato em uma amostra dos frames e compara com o
+    modelo em produção.
+
+    `offer()` é chamado pelo pipeline da câmera e nunca bloqueia: o frame
+    vai para uma fila curta e o candidato roda em um thread próprio.
+    """
+
+    def __init__(self, path: str, sample_rate: float = SHADOW_SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.detector = None
+        self.state = 'loading'
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.dropped = 0
+        self.pending: "queue.Queue" = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        self.cameras: Dict[str, CameraShadowStats] = {}
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self._loop, name="ShadowEvaluator", daemon=True).start()
+
+    def offer(self, camera_id: str, frame, imgsz: int, areas, live_status, live_seconds: float) -> None:
+        if self.detector is None or random.random() >= self.sample_rate:
+            return
+        try:
+            self.pending.put_nowait((camera_id, frame, imgsz, areas, list(live_status), live_seconds))
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        self.running = False
+        self.state = 'stopped'
+
+    def _evaluate(self, camera_id, frame, imgsz, areas, live_status, live_seconds) -> None:
+        started = time.perf_counter()
+        result = run_detection(frame, imgsz, detector=self.detector)
+        detections = extract_detections(result, self.detector.vehicle_class_ids)
+        candidate_seconds = time.perf_counter() - started
+        candidate_status = compute_parking_status(areas, detection_centers(detections))
+        disagreeing = sum(1 for live, cand in zip(live_status, candidate_status) if live != cand)
+
+        with self.lock:
+            stats = self.cameras.setdefault(camera_id, CameraShadowStats())
+            stats.frames += 1
+            stats.spots_compared += len(live_status)
+            stats.spots_disagreeing += disagreeing
+            if disagreeing:
+                stats.frames_with_disagreement += 1
+            stats.live_latency.append(live_seconds)
+            stats.candidate_latency.append(candidate_seconds)
+
+    def _loop(self) -> None:
+        try:
+            self.detector, _ = load_and_warm(self.path, (DEFAULT_IMGSZ,))
+            self.state = 'running'
+            logger.info("Shadow model %s running on %.0f%% of frames", self.path, self.sample_rate * 100)
+        except Exception as exc:
+            self.state = 'failed'
+            self.error = str(exc)
+            logger.error("Failed to load shadow model %s: %s", self.path, exc)
+            return
+
+        while self.running:
+            try:
+                item = self.pending.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self._evaluate(*item)
+            except Exception as exc:
+                logger.error("Shadow evaluation error: %s", exc)
+        self.detector = None
+
+    def report(self) -> Dict:
+        with self.lock:
+            cameras = {camera_id: stats.as_dict() for camera_id, stats in self.cameras.items()}
+        frames = sum(stats['frames'] for stats in cameras.values())
+        return {
+            'path': self.path,
+            'state': self.state,
+            'error': self.error,
+            'sample_rate': self.sample_rate,
+            'running_seconds': round(time.time() - self.started_at, 1),
+            'frames': frames,
+            'dropped': self.dropped,
+            'cameras': cameras,
+        }
+
+
+model_swapper = ModelSwapper()
+
+
+def start_shadow(path: str, sample_rate: float) -> ShadowEvaluator:
+    """Substitui a avaliação sombra atual (se houver) por uma nova"""
+    stop_shadow()
+    evaluator = ShadowEvaluator(path, sample_rate)
+    camera_pipeline.set_shadow_evaluator(evaluator)
+    return evaluator
+
+
+def stop_shadow() -> Optional[Dict]:
+    """Encerra a avaliação sombra; retorna o relatório final"""
+    evaluator = camera_pipeline.shadow_evaluator
+    if evaluator is None:
+        return None
+    camera_pipeline.set_shadow_evaluator(None)
+    evaluator.stop()
+    return evaluator.report()
@@ -0,0 +1,171 @@
+"""
+Feed de mudanças de ocupação para push (SSE / WebSocket).
+
+Cada estatística publicada por uma câmera passa por `update`; só quando o
+status estável (pós-histerese) de alguma vaga muda entra um evento no log,
+com número de sequência global. O log é um buffer circular: um cliente que
+reconecta informando o último id recebido ganha só os eventos que perdeu,
+ou um snapshot completo se o id for de outra execução do servidor ou já
+tiver saído do buffer.
+
+Ids de evento têm a forma "<época>:<seq>", a época muda a cada boot.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+OCCUPANCY_FEED_CAPACITY = int(os.getenv('OCCUPANCY_FEED_CAPACITY', '10000'))  # Eventos guardados para replay
+FEED_KEEPALIVE_SECONDS = 15.0  # Comentário SSE / ping para manter proxies abertos
+SSE_KEEPALIVE = b': keepalive\n\n'
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class OccupancyFeed:
+    def __init__(self, capacity: int = OCCUPANCY_FEED_CAPACITY):
+        self.epoch = str(int(time.time()))
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.async_waiters: Dict[asyncio.AbstractEventLoop, asyncio.Future] = {}
+        self.log: Deque[Dict] = deque(maxlen=capacity)
+        self.spots: Dict[str, List[bool]] = {}  # Último status estável conhecido por câmera
+        self.seq = 0
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}:{seq}"
+
+    def parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        """Seq de um id recebido do cliente; None se inválido ou de outro boot"""
+        if not value:
+            return None
+        epoch, _, seq = str(value).partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _append(self, event: Dict) -> None:
+        """Registra o evento e acorda quem espera (chamado com o lock adquirido)"""
+        self.seq += 1
+        event['seq'] = self.seq
+        event['id'] = self.event_id(self.seq)
+        self.log.append(event)
+        self.changed.notify_all()
+        waiters, self.async_waiters = self.async_waiters, {}
+        for loop, future in waiters.items():
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # Event loop já encerrado
+
+    def update(self, camera_id: str, stats: Dict) -> bool:
+        """Compara o status das vagas com o anterior e registra só o que mudou"""
+        current = [bool(spot.get('occupied')) for spot in stats.get('spots') or []]
+        with self.lock:
+            previous = self.spots.get(camera_id)
+            if previous == current:
+                return False
+            self.spots[camera_id] = current
+            reset = previous is None or len(previous) != len(current)
+            changes = {
+                str(idx): occupied
+                for idx, occupied in enumerate(current)
+                if reset or occupied != previous[idx]
+            }
+            occupied_count = sum(current)
+            self._append({
+                'type': 'occupancy',
+                'camera_id': camera_id,
+                'at': time.time(),
+                'occupied': occupied_count,
+                'free': len(current) - occupied_count,
+                'total': len(current),
+                'changes': changes,
+                'reset': reset,
+            })
+            return True
+
+    def remove(self, camera_id: str) -> None:
+        """Câmera parada: avisa os clientes e esquece o estado"""
+        with self.lock:
+            if self.spots.pop(camera_id, None) is None:
+                return
+            self._append({'type': 'offline', 'camera_id': camera_id, 'at': time.time()})
+
+    def _snapshot(self, cameras: Optional[Set[str]]) -> Dict:
+        return {
+            'type': 'snapshot',
+            'seq': self.seq,
+            'id': self.event_id(self.seq),
+            'cameras': {
+                camera_id: {
+                    'occupied': sum(spots),
+                    'free': len(spots) - sum(spots),
+                    'total': len(spots),
+                    'spots': list(spots),
+                }
+                for camera_id, spots in self.spots.items()
+                if cameras is None or camera_id in cameras
+            },
+        }
+
+    def read(self, last_seq: Optional[int], cameras: Optional[Set[str]] = None) -> Tuple[List[Dict], int]:
+        """
+        Eventos depois de last_seq (filtrados por câmera) e a nova posição.
+        Sem posição, ou com lacuna no buffer, devolve um snapshot.
+        """
+        with self.lock:
+            oldest = self.log[0]['seq'] if self.log else self.seq + 1
+            if last_seq is None or last_seq > self.seq or last_seq < oldest - 1:
+                return [self._snapshot(cameras)], self.seq
+            if last_seq == self.seq:
+                return [], last_seq
+            events = []
+            for event in reversed(self.log):  # Caso comum: poucos eventos novos no fim
+                if event['seq'] <= last_seq:
+                    break
+                if cameras is None or event['camera_id'] in cameras:
+                    events.append(event)
+            events.reverse()
+            return events, self.seq
+
+    def wait(self, last_seq: int, timeout: float) -> None:
+        """Bloqueia até haver evento depois de last_seq (ou timeout)"""
+        with self.lock:
+            if self.seq == last_seq:
+                self.changed.wait(timeout)
+
+    async def wait_async(self, last_seq: int, timeout: float) -> None:
+        """Como wait(), sem bloquear o event loop"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.seq != last_seq:
+                return
+            future = self.async_waiters.get(loop)
+            if future is None or future.done():
+                future = self.async_waiters[loop] = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def parse_camera_filter(value: Optional[str]) -> Optional[Set[str]]:
+    """?cameras=a,b -> {'a', 'b'}; vazio = todas"""
+    cameras = {camera_id.strip() for camera_id in (value or '').split(',') if camera_id.strip()}
+    return cameras or None
+
+
+def sse_message(event: Dict) -> bytes:
+    """Evento no formato text/event-stream (id permite retomar com Last-Event-ID)"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+
+
+occupancy_feed = OccupancyFeed()
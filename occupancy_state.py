@@ -0,0 +1,148 @@
+"""
+Histerese do estado das vagas e agrupamento de eventos de ocupação.
+
+Uma detecção perdida não deve mudar o estado de uma vaga: cada vaga só
+passa a ocupada depois de CONFIRM_ON_SECONDS vendo ocupação contínua, e a
+livre depois de CONFIRM_OFF_SECONDS vendo a vaga vazia. As mudanças
+confirmadas são agrupadas em janelas de EVENT_COALESCE_SECONDS e viram um
+único evento com o delta de cada vaga (vagas que voltaram ao estado inicial
+dentro da janela somem do evento). O último estado estável é gravado em
+disco por câmera, para um restart não disparar uma enxurrada de mudanças.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONFIRM_ON_SECONDS = float(os.getenv('CONFIRM_ON_SECONDS', '2'))
+CONFIRM_OFF_SECONDS = float(os.getenv('CONFIRM_OFF_SECONDS', '5'))
+EVENT_COALESCE_SECONDS = float(os.getenv('EVENT_COALESCE_SECONDS', '10'))
+OCCUPANCY_STATE_DIR = Path(os.getenv('OCCUPANCY_STATE_DIR', 'occupancy_state'))
+
+MAX_CONFIRM_SECONDS = 600.0
+
+SpotChange = Tuple[int, bool, bool, float]  # (vaga, antes, depois, momento)
+
+
+def parse_confirm_seconds(value) -> Optional[float]:
+    seconds = float(value)
+    return seconds if 0.0 <= seconds <= MAX_CONFIRM_SECONDS else None
+
+
+class SpotHysteresis:
+    """Máquina de estados por vaga: estado estável + candidato com tempo de confirmação"""
+
+    def __init__(self, confirm_on: float = CONFIRM_ON_SECONDS, confirm_off: float = CONFIRM_OFF_SECONDS,
+                 initial: Optional[Sequence[bool]] = None):
+        self.confirm_on = confirm_on
+        self.confirm_off = confirm_off
+        self.stable: Optional[List[bool]] = list(initial) if initial is not None else None
+        self.pending_since: List[Optional[float]] = [None] * len(self.stable or [])
+
+    def update(self, now: float, raw: Sequence[bool]) -> Tuple[List[bool], List[SpotChange]]:
+        """Aplica o status bruto do frame; retorna (estado estável, mudanças confirmadas)"""
+        raw = [bool(value) for value in raw]
+        if self.stable is None or len(self.stable) != len(raw):
+            # Primeiro frame ou vagas redesenhadas: adota o estado atual sem gerar eventos
+            self.stable = list(raw)
+            self.pending_since = [None] * len(raw)
+            return list(self.stable), []
+
+        changes: List[SpotChange] = []
+        for idx, (stable, observed) in enumerate(zip(self.stable, raw)):
+            if observed == stable:
+                self.pending_since[idx] = None
+                continue
+            if self.pending_since[idx] is None:
+                self.pending_since[idx] = now
+            required = self.confirm_on if observed else self.confirm_off
+            if now - self.pending_since[idx] >= required:
+                self.stable[idx] = observed
+                self.pending_since[idx] = None
+                changes.append((idx, stable, observed, now))
+        return list(self.stable), changes
+
+    def configure(self, confirm_on: Optional[float], confirm_off: Optional[float]) -> None:
+        self.confirm_on = CONFIRM_ON_SECONDS if confirm_on is None else confirm_on
+        self.confirm_off = CONFIRM_OFF_SECONDS if confirm_off is None else confirm_off
+
+
+class EventCoalescer:
+    """Junta as mudanças confirmadas dentro de uma janela em um único evento"""
+
+    def __init__(self, window: float = EVENT_COALESCE_SECONDS):
+        self.window = window
+        self.opened_at: Optional[float] = None
+        self.initial: Dict[int, bool] = {}   # Estado de cada vaga ao abrir a janela
+        self.latest: Dict[int, Tuple[bool, float]] = {}
+        self.previous_occupied: Optional[int] = None
+        self.merged = 0
+
+    def add(self, changes: Sequence[SpotChange], occupied_before: int) -> None:
+        for idx, before, after, at in changes:
+            if self.opened_at is None:
+                self.opened_at = at
+                self.previous_occupied = occupied_before
+            self.initial.setdefault(idx, before)
+            self.latest[idx] = (after, at)
+            self.merged += 1
+
+    def flush(self, now: float, occupied_now: int, force: bool = False) -> Optional[Dict]:
+        """Fecha a janela se venceu; retorna o evento (ou None se nada mudou de fato)"""
+        if self.opened_at is None or (not force and now - self.opened_at < self.window):
+            return None
+        deltas = {
+            str(idx): {'from': self.initial[idx], 'to': after, 'at': round(at, 3)}
+            for idx, (after, at) in sorted(self.latest.items())
+            if after != self.initial[idx]
+        }
+        event = {
+            'previous': self.previous_occupied,
+            'current': occupied_now,
+            'spots': deltas,
+            'changes_merged': self.merged,
+            'window_start': round(self.opened_at, 3),
+            'window_seconds': round(now - self.opened_at, 3),
+        }
+        self.opened_at = None
+        self.initial = {}
+        self.latest = {}
+        self.merged = 0
+        return event if deltas else None
+
+
+def state_path(camera_id: str, directory: Path = OCCUPANCY_STATE_DIR) -> Path:
+    safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(camera_id))
+    return directory / f"{safe}.json"
+
+
+def load_stable_state(camera_id: str, directory: Path = OCCUPANCY_STATE_DIR) -> Optional[List[bool]]:
+    """Último estado estável gravado da câmera (None se não houver)"""
+    path = state_path(camera_id, directory)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [bool(value) for value in data.get('status', [])]
+    except Exception as exc:
+        logger.warning("Could not read occupancy state %s: %s", path, exc)
+        return None
+
+
+def save_stable_state(camera_id: str, status: Sequence[bool], directory: Path = OCCUPANCY_STATE_DIR) -> None:
+    """Grava o estado estável (arquivo por câmera, substituição atômica)"""
+    path = state_path(camera_id, directory)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'status': [bool(value) for value in status], 'updated_at': time.time()}, f)
+        os.replace(tmp_path, path)
+    except Exception as exc:
+        logger.warning("Could not save occupancy state %s: %s", path, exc)
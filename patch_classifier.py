@@ -0,0 +1,168 @@
+"""
+Motor de ocupação por classificação de recortes das vagas.
+
+Para câmeras fixas a pergunta é só "a vaga está ocupada?". Em vez de rodar
+o detector no frame inteiro, cada vaga (4 pontos) é retificada por
+perspectiva em um patch pequeno de tamanho fixo, os patches de todas as
+câmeras são agrupados em lotes e classificados por uma rede minúscula
+(ONNX via cv2.dnn, roda bem em CPU).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PATCH_SIZE = 64
+MAX_BATCH_SIZE = 256
+BATCH_WINDOW = 0.005  # seconds aguardando outras câmeras antes de rodar o lote
+
+
+def order_corners(points: Sequence[Sequence[float]]) -> np.ndarray:
+    """Ordena os 4 pontos como topo-esq, topo-dir, base-dir, base-esq"""
+    pts = np.asarray(points, dtype=np.float32)
+    sums = pts.sum(axis=1)
+    diffs = np.diff(pts, axis=1).ravel()
+    return np.array([
+        pts[np.argmin(sums)],
+        pts[np.argmin(diffs)],
+        pts[np.argmax(sums)],
+        pts[np.argmax(diffs)],
+    ], dtype=np.float32)
+
+
+_transform_cache: Dict[Tuple, np.ndarray] = {}
+
+
+def _spot_transform(polygon: Sequence[Sequence[int]], size: int) -> np.ndarray:
+    key = (tuple(tuple(pt) for pt in polygon), size)
+    matrix = _transform_cache.get(key)
+    if matrix is None:
+        target = np.array([[0, 0], [size - 1, 0], [size - 1, size - 1], [0, size - 1]], dtype=np.float32)
+        matrix = cv2.getPerspectiveTransform(order_corners(polygon), target)
+        if len(_transform_cache) > 4096:
+            _transform_cache.clear()
+        _transform_cache[key] = matrix
+    return matrix
+
+
+def warp_spot_patches(frame: np.ndarray, polygons: Sequence[Sequence[Sequence[int]]],
+                      size: int = PATCH_SIZE) -> np.ndarray:
+    """Retifica cada vaga em um patch size x size -> array (N, size, size, 3)"""
+    patches = np.empty((len(polygons), size, size, 3), dtype=np.uint8)
+    for idx, polygon in enumerate(polygons):
+        patches[idx] = cv2.warpPerspective(
+            frame, _spot_transform(polygon, size), (size, size), flags=cv2.INTER_LINEAR
+        )
+    return patches
+
+
+class PatchClassifier:
+    """Classificador ONNX de patches (saída: prob. de ocupada por patch)"""
+
+    def __init__(self, model_path: str, size: int = PATCH_SIZE):
+        self.model_path = model_path
+        self.size = size
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.lock = threading.Lock()  # cv2.dnn.Net não é thread-safe
+
+    def classify(self, patches: np.ndarray) -> np.ndarray:
+        """Retorna a probabilidade de ocupação de cada patch (N,)"""
+        if not len(patches):
+            return np.empty((0,), dtype=np.float32)
+        blob = cv2.dnn.blobFromImages(
+            list(patches), scalefactor=1.0 / 255, size=(self.size, self.size), swapRB=True
+        )
+        with self.lock:
+            self.net.setInput(blob)
+            output = np.asarray(self.net.forward(), dtype=np.float32).reshape(len(patches), -1)
+        if output.shape[1] == 1:
+            return 1.0 / (1.0 + np.exp(-output[:, 0]))
+        # Duas classes (livre, ocupada): softmax
+        exp = np.exp(output - output.max(axis=1, keepdims=True))
+        return exp[:, 1] / exp.sum(axis=1)
+
+
+class PatchBatcher:
+    """
+    Agrupa patches de várias câmeras em um único lote de inferência.
+
+    Cada thread de câmera chama classify() e bloqueia até o resultado; o
+    thread do batcher junta o que chegar dentro de BATCH_WINDOW (até
+    MAX_BATCH_SIZE patches), roda uma inferência e distribui os resultados.
+    """
+
+    def __init__(self, classifier: PatchClassifier, max_batch: int = MAX_BATCH_SIZE,
+                 window: float = BATCH_WINDOW):
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.window = window
+        self.requests: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self.batches = 0
+        self.patches = 0
+        self.thread = threading.Thread(target=self._loop, name="PatchBatcher", daemon=True)
+        self.thread.start()
+
+    def classify(self, patches: np.ndarray, timeout: Optional[float] = 5.0) -> np.ndarray:
+        future: Future = Future()
+        self.requests.put((patches, future))
+        return future.result(timeout=timeout)
+
+    def _loop(self):
+        while True:
+            pending = [self.requests.get()]
+            total = len(pending[0][0])
+            deadline = time.perf_counter() + self.window
+            while total < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                total += len(item[0])
+
+            try:
+                probs = self.classifier.classify(np.concatenate([patches for patches, _ in pending]))
+            except Exception as exc:
+                for _, future in pending:
+                    future.set_exception(exc)
+                continue
+
+            self.batches += 1
+            self.patches += total
+            offset = 0
+            for patches, future in pending:
+                future.set_result(probs[offset:offset + len(patches)])
+                offset += len(patches)
+
+
+def spot_confidence(probs: np.ndarray) -> np.ndarray:
+    """Confiança da decisão binária de cada vaga (0.5 = incerta, 1.0 = certa)"""
+    return np.maximum(probs, 1.0 - probs)
+
+
+def load_patch_batcher(model_path: str) -> Optional[PatchBatcher]:
+    """Carrega o classificador se o modelo existir; None caso contrário"""
+    if not Path(model_path).exists():
+        logger.warning("Patch classifier model %s not found; patch engine disabled", model_path)
+        return None
+    try:
+        batcher = PatchBatcher(PatchClassifier(model_path))
+    except Exception as exc:
+        logger.error("Failed to load patch classifier %s: %s", model_path, exc)
+        return None
+    logger.info("Patch classifier loaded from %s", model_path)
+    return batcher
@@ -0,0 +1,191 @@
+"""
+Controle adaptativo da taxa de inferência por câmera.
+
+Cada câmera declara uma taxa alvo (target_fps) e uma prioridade. O
+controlador mede o custo de inferência de cada câmera (segundos por frame)
+e distribui o orçamento de inferência do nó (INFERENCE_BUDGET segundos de
+inferência por segundo) em ordem de prioridade: as câmeras de prioridade
+alta recebem a taxa alvo primeiro, as demais dividem o que sobra. Câmeras
+estáticas (ocupação sem mudança há STATIC_AFTER_SECONDS) caem para
+STATIC_FPS até a próxima mudança. Quando nem o orçamento cobre a demanda,
+o nível atingido é reduzido proporcionalmente até MIN_FPS (load shedding).
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_TARGET_FPS = float(os.getenv('DEFAULT_TARGET_FPS', '10'))
+INFERENCE_BUDGET = float(os.getenv('INFERENCE_BUDGET', '0.85'))  # segundos de inferência por segundo
+PRIORITIES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+STATIC_FPS = 1.0
+STATIC_AFTER_SECONDS = 60.0
+MIN_FPS = 0.2               # Mesmo sob sobrecarga toda câmera atualiza a cada 5 s
+MAX_FPS = 60.0
+DEFAULT_COST = 0.02         # seconds por frame antes da primeira medição
+COST_SMOOTHING_ALPHA = 0.1
+REALLOCATE_INTERVAL = 1.0   # seconds
+
+
+def parse_priority(value) -> Optional[str]:
+    return value if value in PRIORITIES else None
+
+
+def parse_target_fps(value) -> Optional[float]:
+    fps = float(value)
+    return fps if MIN_FPS <= fps <= MAX_FPS else None
+
+
+def allocate_rates(
+    demands: Iterable[Tuple[str, float, str, float]],
+    budget: float,
+    min_fps: float = MIN_FPS,
+) -> Dict[str, Tuple[float, bool]]:
+    """
+    Distribui o orçamento de inferência por prioridade.
+
+    `demands`: (camera_id, taxa desejada, prioridade, custo em s/frame).
+    Retorna {camera_id: (taxa permitida, descartando carga?)}.
+    """
+    tiers: Dict[str, list] = {priority: [] for priority in PRIORITIES}
+    for camera_id, desired, priority, cost in demands:
+        tiers.get(priority, tiers[DEFAULT_PRIORITY]).append((camera_id, desired, cost))
+
+    allocation: Dict[str, Tuple[float, bool]] = {}
+    remaining = max(budget, 0.0)
+    for priority in PRIORITIES:
+        tier = tiers[priority]
+        demand = sum(desired * cost for _, desired, cost in tier)
+        if demand <= remaining:
+            for camera_id, desired, _ in tier:
+                allocation[camera_id] = (desired, False)
+            remaining -= demand
+            continue
+        scale = remaining / demand if demand > 0 else 0.0
+        for camera_id, desired, _ in tier:
+            allocation[camera_id] = (max(desired * scale, min(min_fps, desired)), True)
+        remaining = 0.0
+    return allocation
+
+
+class CameraRate:
+    """Estado de taxa de uma câmera"""
+
+    def __init__(self):
+        self.target_fps = DEFAULT_TARGET_FPS
+        self.priority = DEFAULT_PRIORITY
+        self.cost = 0.0                  # EMA do custo de inferência (s/frame)
+        self.allowed_fps = DEFAULT_TARGET_FPS
+        self.shed = False
+        self.last_change = time.time()   # Última mudança de ocupação
+        self.last_start: Optional[float] = None
+        self.measured_fps = 0.0
+
+    def is_static(self, now: float) -> bool:
+        return now - self.last_change >= STATIC_AFTER_SECONDS
+
+    def desired_fps(self, now: float) -> float:
+        return min(self.target_fps, STATIC_FPS) if self.is_static(now) else self.target_fps
+
+
+class RateController:
+    """Orçamento de inferência compartilhado pelas câmeras de um processo"""
+
+    def __init__(self, budget: float = INFERENCE_BUDGET):
+        self.budget = budget
+        self.cameras: Dict[str, CameraRate] = {}
+        self.lock = threading.Lock()
+        self.last_allocation = 0.0
+
+    def configure(self, camera_id: str, target_fps: Optional[float], priority: Optional[str]) -> None:
+        with self.lock:
+            rate = self.cameras.setdefault(camera_id, CameraRate())
+            rate.target_fps = target_fps or DEFAULT_TARGET_FPS
+            rate.priority = priority or DEFAULT_PRIORITY
+
+    def remove(self, camera_id: str) -> None:
+        with self.lock:
+            self.cameras.pop(camera_id, None)
+
+    def frame_started(self, camera_id: str) -> None:
+        now = time.time()
+        with self.lock:
+            rate = self.cameras.setdefault(camera_id, CameraRate())
+            if rate.last_start is not None and now > rate.last_start:
+                instant = 1.0 / (now - rate.last_start)
+                rate.measured_fps = instant if not rate.measured_fps else (
+                    rate.measured_fps * (1 - COST_SMOOTHING_ALPHA) + COST_SMOOTHING_ALPHA * instant
+                )
+            rate.last_start = now
+
+    def record(self, camera_id: str, inference_seconds: float, changed: bool) -> None:
+        """Registra o custo de inferência do frame e se a ocupação mudou"""
+        now = time.time()
+        with self.lock:
+            rate = self.cameras.setdefault(camera_id, CameraRate())
+            rate.cost = inference_seconds if not rate.cost else (
+                rate.cost * (1 - COST_SMOOTHING_ALPHA) + COST_SMOOTHING_ALPHA * inference_seconds
+            )
+            if changed:
+                was_static = rate.is_static(now)
+                rate.last_change = now
+                if was_static:
+                    self.last_allocation = 0.0  # Volta à taxa cheia já no próximo frame
+            if now - self.last_allocation >= REALLOCATE_INTERVAL:
+                self._reallocate(now)
+
+    def _reallocate(self, now: float) -> None:
+        known = [rate.cost for rate in self.cameras.values() if rate.cost]
+        fallback = sum(known) / len(known) if known else DEFAULT_COST
+        allocation = allocate_rates(
+            (
+                (camera_id, rate.desired_fps(now), rate.priority, rate.cost or fallback)
+                for camera_id, rate in self.cameras.items()
+            ),
+            self.budget,
+        )
+        for camera_id, (allowed, shed) in allocation.items():
+            rate = self.cameras[camera_id]
+            rate.allowed_fps = allowed
+            rate.shed = shed
+        self.last_allocation = now
+
+    def next_delay(self, camera_id: str) -> float:
+        """Segundos a esperar antes do próximo frame desta câmera"""
+        with self.lock:
+            rate = self.cameras.get(camera_id)
+            if rate is None or rate.last_start is None or rate.allowed_fps <= 0:
+                return 0.0
+            return max(rate.last_start + 1.0 / rate.allowed_fps - time.time(), 0.0)
+
+    def snapshot(self, camera_id: str) -> Dict:
+        now = time.time()
+        with self.lock:
+            rate = self.cameras.get(camera_id)
+            if rate is None:
+                return {}
+            return {
+                'target_fps': rate.target_fps,
+                'allowed_fps': round(rate.allowed_fps, 2),
+                'measured_fps': round(rate.measured_fps, 2),
+                'priority': rate.priority,
+                'static': rate.is_static(now),
+                'shed': rate.shed,
+                'inference_ms': round(rate.cost * 1000.0, 2),
+            }
+
+    def load(self) -> Dict:
+        """Demanda atual em segundos de inferência por segundo contra o orçamento"""
+        with self.lock:
+            used = sum(rate.cost * rate.allowed_fps for rate in self.cameras.values())
+            return {
+                'budget': self.budget,
+                'used': round(used, 3),
+                'utilization': round(used / self.budget, 3) if self.budget else None,
+                'shedding': sorted(camera_id for camera_id, rate in self.cameras.items() if rate.shed),
+            }
+
+
+rate_controller = RateController()
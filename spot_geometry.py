@@ -0,0 +1,100 @@
+"""
+Geometria das vagas independente de resolução.
+
+As vagas são armazenadas em coordenadas normalizadas (0..1) junto com a
+resolução de referência em que foram desenhadas, e convertidas sob demanda
+para a resolução de cada etapa do pipeline (inferência, recorte, exibição).
+Configurações antigas em pixels são detectadas e normalizadas na carga.
+"""
+
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+# Resolução usada pelo snapshot/desenho antes das coordenadas normalizadas
+DEFAULT_REFERENCE_SIZE = (1280, 720)
+NORMALIZED_DECIMALS = 6
+
+Point = List[float]
+Polygon = List[Point]
+
+
+def is_valid_polygon(polygon) -> bool:
+    """Verifica se o polígono tem exatamente 4 pontos (x, y)"""
+    if not isinstance(polygon, (list, tuple)) or len(polygon) != 4:
+        return False
+    return all(isinstance(pt, (list, tuple)) and len(pt) == 2 for pt in polygon)
+
+
+def is_normalized(polygons: Sequence[Sequence[Sequence[float]]]) -> bool:
+    """True se todas as coordenadas estão no intervalo [0, 1]"""
+    for polygon in polygons:
+        for x, y in polygon:
+            if not (0.0 <= float(x) <= 1.0 and 0.0 <= float(y) <= 1.0):
+                return False
+    return True
+
+
+def parse_reference_size(value, default: Tuple[int, int] = DEFAULT_REFERENCE_SIZE) -> Tuple[int, int]:
+    """Interpreta [w, h] ou {'width', 'height'}; retorna o default se inválido"""
+    try:
+        if isinstance(value, dict):
+            width, height = int(value['width']), int(value['height'])
+        elif isinstance(value, (list, tuple)) and len(value) == 2:
+            width, height = int(value[0]), int(value[1])
+        else:
+            return default
+    except (KeyError, TypeError, ValueError):
+        return default
+    if width <= 0 or height <= 0:
+        return default
+    return width, height
+
+
+def normalize_areas(polygons, reference_size: Optional[Sequence[int]] = None) -> List[Polygon]:
+    """
+    Converte vagas para coordenadas normalizadas.
+
+    Vagas em pixels são divididas pela resolução de referência (em que foram
+    desenhadas); vagas já normalizadas são apenas validadas. Polígonos
+    inválidos são descartados.
+    """
+    valid = [polygon for polygon in (polygons or []) if is_valid_polygon(polygon)]
+    if is_normalized(valid):
+        return [
+            [[round(float(x), NORMALIZED_DECIMALS), round(float(y), NORMALIZED_DECIMALS)] for x, y in polygon]
+            for polygon in valid
+        ]
+
+    width, height = parse_reference_size(reference_size)
+    return [
+        [
+            [
+                round(min(max(float(x) / width, 0.0), 1.0), NORMALIZED_DECIMALS),
+                round(min(max(float(y) / height, 0.0), 1.0), NORMALIZED_DECIMALS),
+            ]
+            for x, y in polygon
+        ]
+        for polygon in valid
+    ]
+
+
+@lru_cache(maxsize=512)
+def _scale_cached(key: Tuple[Tuple[Tuple[float, float], ...], ...], width: int, height: int):
+    return tuple(
+        tuple((int(round(x * width)), int(round(y * height))) for x, y in polygon)
+        for polygon in key
+    )
+
+
+def scale_areas(normalized: Sequence[Sequence[Sequence[float]]], width: int, height: int) -> List[List[List[int]]]:
+    """
+    Converte vagas normalizadas para pixels na resolução (width, height).
+
+    O resultado é memoizado por resolução, então chamar a cada frame custa
+    apenas a montagem da chave.
+    """
+    if not normalized:
+        return []
+    key = tuple(tuple((float(x), float(y)) for x, y in polygon) for polygon in normalized)
+    scaled = _scale_cached(key, int(width), int(height))
+    return [[list(pt) for pt in polygon] for polygon in scaled]
@@ -0,0 +1,149 @@
+"""
+Fontes de vídeo por câmera: substream para inferência, stream principal
+sob demanda para exibição.
+
+Câmeras no estilo Hikvision têm o stream principal (`Channels/101`, `301`)
+e um substream de baixa resolução (`Channels/102`, `302`). Com
+`inference_url` configurado, o pipeline decodifica só o substream para
+detectar; o principal (`display_url`, por padrão o próprio `url`) é aberto
+apenas enquanto alguém assiste ao stream da câmera, e fechado
+DISPLAY_LINGER_SECONDS depois que o último visualizador sai.
+
+    "inference_url": "rtsp://.../Streaming/Channels/302"   # ou "auto": deriva de `url`
+    "display_url": "rtsp://.../Streaming/Channels/301"     # opcional (padrão: `url`)
+
+As vagas são normalizadas (0..1), então as mesmas áreas valem para os dois
+streams; detecções são reescaladas do frame da inferência para o de exibição.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_LINGER_SECONDS = float(os.getenv('DISPLAY_LINGER_SECONDS', '10'))  # Principal aberto após o último visualizador
+DISPLAY_RETRY_SECONDS = 30.0  # Espera antes de reabrir um stream principal que falhou
+AUTO_SUBSTREAM = 'auto'
+
+# .../Channels/101 -> .../Channels/102 (canal N, stream 01 = principal, 02 = sub)
+HIKVISION_CHANNEL = re.compile(r'(/Channels/\d+)01(?=$|[/?])', re.IGNORECASE)
+
+
+def substream_url(url: str) -> Optional[str]:
+    """URL do substream de uma câmera Hikvision; None se o formato não for reconhecido"""
+    substream, count = HIKVISION_CHANNEL.subn(r'\g<1>02', url or '', count=1)
+    return substream if count else None
+
+
+def parse_stream_url(value) -> Optional[str]:
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip()
+
+
+def inference_source(config: Dict) -> str:
+    """Fonte decodificada continuamente para a detecção (padrão: `url`)"""
+    url = config.get('url', '')
+    value = config.get('inference_url')
+    if value == AUTO_SUBSTREAM:
+        return substream_url(url) or url
+    return value or url
+
+
+def display_source(config: Dict) -> Optional[str]:
+    """Stream principal para exibição; None se for a própria fonte da inferência"""
+    display = config.get('display_url') or config.get('url', '')
+    return display if display and display != inference_source(config) else None
+
+
+class DisplayDemand:
+    """
+    Até quando cada câmera precisa do stream principal (math.inf enquanto
+    houver visualizador). Vive no processo que roda o pipeline; no modo
+    worker a API repassa as mudanças por comando.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.until: Dict[str, float] = {}
+
+    def set(self, camera_id: str, until: float) -> None:
+        with self.lock:
+            self.until[camera_id] = until
+
+    def hold(self, camera_id: str) -> float:
+        """Primeiro visualizador entrou: principal aberto até release()"""
+        self.set(camera_id, math.inf)
+        return math.inf
+
+    def release(self, camera_id: str, linger: float = DISPLAY_LINGER_SECONDS) -> float:
+        """Último visualizador saiu: mantém o principal por `linger` (reconexões rápidas)"""
+        until = time.time() + linger
+        self.set(camera_id, until)
+        return until
+
+    def wanted(self, camera_id: str, now: Optional[float] = None) -> bool:
+        until = self.until.get(camera_id)
+        return until is not None and (time.time() if now is None else now) < until
+
+    def remove(self, camera_id: str) -> None:
+        with self.lock:
+            self.until.pop(camera_id, None)
+
+
+class MainStream:
+    """
+    Captura do stream principal de uma câmera, aberta sob demanda.
+    `open_capture(url)` cria o VideoCapture (não iniciado); a conexão roda
+    em background para não travar o pipeline, que segue exibindo o frame da
+    inferência até o principal entregar frames.
+    """
+
+    def __init__(self, camera_id: str, open_capture: Callable, demand: Optional[DisplayDemand] = None):
+        self.camera_id = camera_id
+        self.open_capture = open_capture
+        self.demand = demand if demand is not None else display_demand
+        self.capture = None
+        self.url: Optional[str] = None
+        self.opened_at = 0.0
+        self.opens = 0  # Aberturas do principal (métrica)
+
+    def read(self, url: Optional[str]):
+        """Último frame do principal, se houver demanda e ele estiver conectado; senão None"""
+        if url is None or not self.demand.wanted(self.camera_id):
+            self.close()
+            return None
+        now = time.time()
+        if self.capture is not None and (
+            self.url != url
+            or (self.capture.status == 'failed' and now - self.opened_at >= DISPLAY_RETRY_SECONDS)
+        ):
+            self.close()
+        if self.capture is None:
+            self.url = url
+            self.opened_at = now
+            self.opens += 1
+            self.capture = self.open_capture(url)
+            threading.Thread(target=self.capture.start, name=f"MainStream-{self.camera_id}", daemon=True).start()
+            logger.info("Opening main stream for camera %s", self.camera_id)
+            return None
+        grabbed, frame, _ = self.capture.read()
+        return frame if grabbed else None
+
+    @property
+    def is_open(self) -> bool:
+        return self.capture is not None
+
+    def close(self) -> None:
+        if self.capture is not None:
+            self.capture.stop(wait=False)
+            self.capture = None
+            logger.info("Closed main stream for camera %s", self.camera_id)
+
+
+display_demand = DisplayDemand()
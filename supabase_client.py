@@ -4,37 +4,169 @@ Handles all database operations for the parking monitoring system
 """
 
 import os
-from datetime import datetime, date
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone
+from typing import Callable, Dict, Hashable, List, Optional, Any, Tuple
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
 # Load environment variables
 load_dotenv()
 
+# Read-through cache for the dashboard queries (seconds per query type; 0 disables)
+CACHE_TTL_HISTORY = float(os.getenv('CACHE_TTL_HISTORY', '30'))
+CACHE_TTL_EVENTS = float(os.getenv('CACHE_TTL_EVENTS', '10'))
+CACHE_TTL_STATISTICS = float(os.getenv('CACHE_TTL_STATISTICS', '300'))
+CACHE_TTL_REALTIME = float(os.getenv('CACHE_TTL_REALTIME', '5'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '256'))
+PAGE_SIZE = 1000  # PostgREST max-rows default
+
+
+class _Inflight:
+    """Upstream call in progress; identical concurrent queries wait on it"""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryCache:
+    """
+    TTL + LRU cache with request coalescing. Entries carry tags so writes can
+    invalidate every cached query they affect; a load that races with an
+    invalidation of one of its tags is returned but not stored.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Inflight] = {}
+        self._generations: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key: Hashable, ttl: float, loader: Callable[[], Any], tags: Tuple = ()) -> Any:
+        if ttl <= 0:
+            return loader()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                self.misses += 1
+                inflight = self._inflight[key] = _Inflight()
+                generations = tuple(self._generations.get(tag, 0) for tag in tags)
+            else:
+                self.coalesced += 1
+        if not owner:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+
+        try:
+            inflight.value = loader()
+        except BaseException as exc:
+            inflight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                current = tuple(self._generations.get(tag, 0) for tag in tags)
+                if inflight.error is None and current == generations:
+                    self._store(key, time.monotonic() + ttl, inflight.value, tags)
+            inflight.done.set()
+        return inflight.value
+
+    def _store(self, key: Hashable, expires_at: float, value: Any, tags: Tuple) -> None:
+        self._entries[key] = (expires_at, value, tags)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *tags: Hashable) -> None:
+        """Drop every entry carrying one of the tags"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [key for key, (_, _, entry_tags) in self._entries.items() if any(tag in entry_tags for tag in tags)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            }
+
+
 class SupabaseClient:
     """Client for interacting with Supabase database"""
 
     def __init__(self):
-        """Initialize Supabase client"""
+        """Read credentials; the client itself is created on first use (see connect)"""
         self.url = os.getenv('SUPABASE_URL')
         self.key = os.getenv('SUPABASE_KEY')
-
-        if not self.url or not self.key:
-            print("[WARNING] Supabase credentials not found. Using local storage only.")
-            self.client: Optional[Client] = None
-        else:
+        self._client = None
+        self._connect_attempted = False
+        self._connect_lock = threading.Lock()
+        self.cache = QueryCache()
+
+    def connect(self):
+        """Create the Supabase client (imports the SDK); safe to call more than once"""
+        with self._connect_lock:
+            if self._connect_attempted:
+                return self._client
+            self._connect_attempted = True
+
+            if not self.url or not self.key:
+                print("[WARNING] Supabase credentials not found. Using local storage only.")
+                return None
             try:
-                self.client = create_client(self.url, self.key)
+                from supabase import create_client
+                self._client = create_client(self.url, self.key)
                 print("[SUCCESS] Connected to Supabase successfully")
             except Exception as e:
                 print(f"[ERROR] Failed to connect to Supabase: {e}")
-                self.client = None
+                self._client = None
+            return self._client
+
+    @property
+    def client(self):
+        if not self._connect_attempted:
+            return self.connect()
+        return self._client
 
     def is_connected(self) -> bool:
         """Check if connected to Supabase"""
         return self.client is not None
 
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the read-through query cache"""
+        return self.cache.stats()
+
     # CAMERA OPERATIONS
 
     def save_camera(self, camera_id: str, name: str, location: str, url: str,
@@ -56,6 +188,7 @@ class SupabaseClient:
 
             # Upsert (insert or update)
             self.client.table('cameras').upsert(data).execute()
+            self.cache.invalidate('realtime')
             return True
         except Exception as e:
             print(f"[ERROR] Error saving camera: {e}")
@@ -95,6 +228,7 @@ class SupabaseClient:
                 'status': status,
                 'updated_at': datetime.now().isoformat()
             }).eq('id', camera_id).execute()
+            self.cache.invalidate('realtime')
             return True
         except Exception as e:
             print(f"[ERROR] Error updating camera status: {e}")
@@ -122,6 +256,7 @@ class SupabaseClient:
 
         try:
             self.client.table('cameras').delete().eq('id', camera_id).execute()
+            self.cache.invalidate(('camera', camera_id), ('events', None), 'realtime')
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting camera: {e}")
@@ -152,6 +287,7 @@ class SupabaseClient:
                 'areas_count': len(areas),
                 'updated_at': datetime.now().isoformat()
             }).eq('id', camera_id).execute()
+            self.cache.invalidate('realtime')
 
             return True
         except Exception as e:
@@ -191,6 +327,7 @@ class SupabaseClient:
                 'details': details
             }
             self.client.table('occupancy_history').insert(data).execute()
+            self.cache.invalidate(('occupancy', camera_id), 'realtime')
             return True
         except Exception as e:
             print(f"[ERROR] Error saving occupancy: {e}")
@@ -213,13 +350,47 @@ class SupabaseClient:
         if not self.is_connected():
             return []
 
-        try:
+        def query():
             response = self.client.table('occupancy_history').select('*').eq('camera_id', camera_id).gte('timestamp', f'now() - interval \'{hours} hours\'').order('timestamp', desc=True).execute()
             return response.data if response.data else []
+
+        try:
+            return self.cache.get_or_load(
+                ('history', camera_id, hours), CACHE_TTL_HISTORY, query,
+                tags=(('occupancy', camera_id), ('camera', camera_id)),
+            )
         except Exception as e:
             print(f"[ERROR] Error getting occupancy history: {e}")
             return []
 
+    def get_occupancy_series(self, camera_id: str, hours: int = 24, columns: str = '*') -> List[Dict]:
+        """Occupancy rows of the last N hours in chronological order, only the given columns (all pages)"""
+        if not self.is_connected():
+            return []
+
+        def query():
+            since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+            rows: List[Dict] = []
+            while True:
+                response = (
+                    self.client.table('occupancy_history').select(columns)
+                    .eq('camera_id', camera_id).gte('timestamp', since)
+                    .order('timestamp').range(len(rows), len(rows) + PAGE_SIZE - 1).execute()
+                )
+                page = response.data or []
+                rows.extend(page)
+                if len(page) < PAGE_SIZE:
+                    return rows
+
+        try:
+            return self.cache.get_or_load(
+                ('series', camera_id, hours, columns), CACHE_TTL_HISTORY, query,
+                tags=(('occupancy', camera_id), ('camera', camera_id)),
+            )
+        except Exception as e:
+            print(f"[ERROR] Error getting occupancy series: {e}")
+            return []
+
     # EVENT OPERATIONS
 
     def log_event(self, camera_id: str, event_type: str, description: str = None,
@@ -237,6 +408,7 @@ class SupabaseClient:
                 'metadata': metadata
             }
             self.client.table('events').insert(data).execute()
+            self.cache.invalidate(('events', camera_id), ('events', None))
             return True
         except Exception as e:
             print(f"[ERROR] Error logging event: {e}")
@@ -247,12 +419,18 @@ class SupabaseClient:
         if not self.is_connected():
             return []
 
-        try:
-            query = self.client.table('events').select('*')
+        def query():
+            request = self.client.table('events').select('*')
             if camera_id:
-                query = query.eq('camera_id', camera_id)
-            response = query.order('timestamp', desc=True).limit(limit).execute()
+                request = request.eq('camera_id', camera_id)
+            response = request.order('timestamp', desc=True).limit(limit).execute()
             return response.data if response.data else []
+
+        try:
+            return self.cache.get_or_load(
+                ('events', camera_id, limit), CACHE_TTL_EVENTS, query,
+                tags=(('events', camera_id), ('camera', camera_id)),
+            )
         except Exception as e:
             print(f"[ERROR] Error getting events: {e}")
             return []
@@ -278,20 +456,39 @@ class SupabaseClient:
                 'peak_hour': peak_hour
             }
             # Upsert based on camera_id and date
-            self.client.table('daily_statistics').upsert(data).execute()
+            self.client.table('daily_statistics').upsert(data, on_conflict='camera_id,date').execute()
+            self.cache.invalidate(('statistics', camera_id))
             return True
         except Exception as e:
             print(f"[ERROR] Error saving daily statistics: {e}")
             return False
 
+    def get_daily_statistics_for_date(self, camera_id: str, stats_date: date) -> Optional[Dict]:
+        """Get the daily statistics row of one camera for one date"""
+        if not self.is_connected():
+            return None
+
+        try:
+            response = self.client.table('daily_statistics').select('*').eq('camera_id', camera_id).eq('date', stats_date.isoformat()).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            print(f"[ERROR] Error getting daily statistics: {e}")
+            return None
+
     def get_daily_statistics(self, camera_id: str, days: int = 7) -> List[Dict]:
         """Get daily statistics for the last N days"""
         if not self.is_connected():
             return []
 
-        try:
+        def query():
             response = self.client.table('daily_statistics').select('*').eq('camera_id', camera_id).gte('date', f'now() - interval \'{days} days\'').order('date', desc=True).execute()
             return response.data if response.data else []
+
+        try:
+            return self.cache.get_or_load(
+                ('statistics', camera_id, days), CACHE_TTL_STATISTICS, query,
+                tags=(('statistics', camera_id), ('camera', camera_id)),
+            )
         except Exception as e:
             print(f"[ERROR] Error getting daily statistics: {e}")
             return []
@@ -303,9 +500,12 @@ class SupabaseClient:
         if not self.is_connected():
             return []
 
-        try:
+        def query():
             response = self.client.table('camera_stats_realtime').select('*').execute()
             return response.data if response.data else []
+
+        try:
+            return self.cache.get_or_load(('realtime',), CACHE_TTL_REALTIME, query, tags=('realtime',))
         except Exception as e:
             print(f"[ERROR] Error getting realtime stats: {e}")
             return []
@@ -0,0 +1,235 @@
+"""Testes da API Flask (test client, sem câmeras nem Supabase) (pytest)"""
+
+import threading
+import time
+
+import pytest
+
+import api_server
+import camera_pipeline
+
+
+def camera_stats(occupied, fps=10.0):
+    spots = [{'index': idx, 'occupied': value, 'dwell_seconds': fps} for idx, value in enumerate(occupied)]
+    return {
+        'occupied': sum(occupied), 'free': len(occupied) - sum(occupied), 'total': len(occupied),
+        'fps': fps, 'spots': spots, 'rate': {'measured_fps': fps},
+    }
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, 'cameras_config', {'cam1': {'name': 'Entrada', 'areas': []}})
+    monkeypatch.setattr(api_server, 'cameras_stats', {})
+    monkeypatch.setattr(api_server, 'worker_pool', None)
+    monkeypatch.setattr(api_server, 'CONFIG_FILE', str(tmp_path / 'cameras_config.json'))
+    api_server.occupancy_feed.remove('cam1')
+    api_server.mark_cameras_changed()
+    return api_server.app.test_client()
+
+
+def test_listing_etag_only_changes_with_occupancy(client):
+    api_server.publish_camera_frame('cam1', None, camera_stats([True, False], fps=9.0))
+    etag = client.get('/api/cameras').headers['ETag']
+
+    api_server.publish_camera_frame('cam1', None, camera_stats([True, False], fps=3.0))  # Só fps mudou
+    assert client.get('/api/cameras', headers={'If-None-Match': etag}).status_code == 304
+
+    api_server.publish_camera_frame('cam1', None, camera_stats([True, True], fps=3.0))
+    response = client.get('/api/cameras', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json[0]['stats']['occupied'] == 2
+    assert 'fps' not in response.json[0]['stats']
+
+
+def test_long_poll_waits_for_a_real_change(client):
+    api_server.publish_camera_frame('cam1', None, camera_stats([False]))
+    etag = client.get('/api/cameras').headers['ETag']
+
+    started = time.time()
+    assert client.get('/api/cameras?wait=0.3', headers={'If-None-Match': etag}).status_code == 304
+    assert time.time() - started >= 0.3
+
+    timer = threading.Timer(0.1, api_server.publish_camera_frame, ('cam1', None, camera_stats([True])))
+    timer.start()
+    started = time.time()
+    response = client.get('/api/cameras?wait=5', headers={'If-None-Match': etag})
+    timer.join()
+    assert response.status_code == 200 and time.time() - started < 2
+
+
+def test_live_stats_endpoint_is_not_cached(client):
+    api_server.publish_camera_frame('cam1', None, camera_stats([True], fps=7.5))
+    response = client.get('/api/cameras/stats')
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert response.json['cam1']['current_fps'] == 7.5
+    assert response.json['cam1']['spots'][0]['dwell_seconds'] == 7.5
+
+
+@pytest.mark.parametrize('value', [320.5, '320', True, 300, 0])
+def test_imgsz_setting_rejects_non_integer_sizes(client, value):
+    response = client.put('/api/cameras/cam1/settings', json={'imgsz': value})
+    assert response.status_code == 400
+    assert 'imgsz' not in api_server.cameras_config['cam1']
+
+
+def test_imgsz_setting_accepts_a_multiple_of_32(client):
+    response = client.put('/api/cameras/cam1/settings', json={'imgsz': 416})
+    assert response.status_code == 200 and response.json['settings']['imgsz'] == 416
+
+
+def test_calibration_needs_in_process_cameras(client, monkeypatch):
+    monkeypatch.setattr(api_server, 'worker_pool', object())
+    response = client.post('/api/cameras/cam1/calibrate', json={'candidates': [320, 640]})
+    assert response.status_code == 409
+    assert client.post('/api/cameras/cam1/calibrate', json={'candidates': [320.5]}).status_code == 400
+
+
+@pytest.fixture
+def started(monkeypatch):
+    phases = {name: {'status': 'done'} for name in api_server.READINESS_PHASES}
+    monkeypatch.setattr(api_server, 'startup_phases', phases)
+    return phases
+
+
+def test_readyz_reports_the_swapped_model(client, started, monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'active_model_path', 'yolo11m.pt')
+    response = client.get('/readyz')
+    assert response.status_code == 200 and response.json['model'] == 'yolo11m.pt'
+
+
+class FakeWorkerPool:
+    def __init__(self, report):
+        self.report = report
+
+    def model_report(self):
+        return self.report
+
+
+def test_readyz_waits_for_the_workers_model(client, started, monkeypatch):
+    report = {
+        'active': None, 'model_load': {'status': 'running'}, 'warmup': {'status': 'pending'},
+        'swap': {'state': 'idle', 'path': None}, 'workers': [{'index': 0, 'alive': True}],
+    }
+    monkeypatch.setattr(api_server, 'worker_pool', FakeWorkerPool(report))
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.json['phases']['model_load'] == {'status': 'running'}
+
+    report.update(active='yolo11m.pt', model_load={'status': 'done'}, warmup={'status': 'done'},
+                  swap={'state': 'done', 'path': 'yolo11m.pt'})
+    response = client.get('/readyz')
+    assert response.status_code == 200 and response.json['model'] == 'yolo11m.pt'
+    status = client.get('/api/admin/model').json
+    assert status['mode'] == 'workers' and status['swap']['state'] == 'done'
+    assert status['workers'] == report['workers']
+
+
+class RecordingDB:
+    """Supabase falso: registra as chamadas (nome, argumentos)"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+def test_auto_start_launches_cameras_in_parallel(client, monkeypatch):
+    cameras = {f'cam{index}': {'name': f'Vaga {index}', 'status': 'online', 'areas': [[0, 0]]} for index in range(3)}
+    cameras['broken'] = {'name': 'Quebrada', 'status': 'online', 'areas': [[0, 0]]}
+    cameras['idle'] = {'name': 'Sem vagas', 'status': 'online', 'areas': []}
+    monkeypatch.setattr(api_server, 'cameras_config', cameras)
+    monkeypatch.setattr(api_server, 'db', RecordingDB())
+    # Em série, o primeiro launch ficaria preso na barreira até o timeout
+    barrier = threading.Barrier(3, timeout=2.0)
+
+    def launch(camera_id, video_url):
+        if camera_id == 'broken':
+            raise RuntimeError('rtsp unreachable')
+        barrier.wait()
+
+    monkeypatch.setattr(api_server, 'launch_camera_pipeline', launch)
+    api_server.auto_start_online_cameras()
+
+    assert all(cameras[f'cam{index}']['stream_url'].endswith(f'/api/cameras/cam{index}/stream') for index in range(3))
+    assert cameras['broken']['status'] == 'offline' and 'stream_url' not in cameras['idle']
+    assert ('update_camera_status', ('broken', 'offline')) in api_server.db.calls
+
+
+def test_startup_lists_ready_and_pending_cameras(client, monkeypatch):
+    class FakeSupervisor:
+        def health(self):
+            return {
+                'cam1': {'state': 'running', 'ready': True, 'startup_seconds': 1.8, 'capture_status': 'connected'},
+                'cam2': {'state': 'connecting', 'ready': False, 'startup_seconds': None, 'capture_status': None},
+            }
+
+    monkeypatch.setattr(api_server, 'supervisor', FakeSupervisor())
+    monkeypatch.setattr(api_server, 'startup_started_at', time.time() - 5)
+    body = client.get('/api/startup').json
+    assert (body['total'], body['ready'], body['pending']) == (2, 1, 1)
+    assert body['cameras']['cam1'] == {'state': 'running', 'ready': True, 'startup_seconds': 1.8}
+    assert 5 <= body['elapsed'] < 10
+
+
+def test_stop_answers_before_the_supabase_bookkeeping(client, monkeypatch):
+    release = threading.Event()
+    db = RecordingDB()
+    monkeypatch.setattr(db, 'update_camera_status', lambda *args: release.wait(5), raising=False)
+    monkeypatch.setattr(api_server, 'db', db)
+    monkeypatch.setattr(api_server, 'shutdown_camera_pipeline', lambda camera_id: True)
+    monkeypatch.setattr(api_server, 'sync_cameras_from_supabase', lambda force=False: None)
+
+    started = time.time()
+    response = client.post('/api/cameras/cam1/stop')
+    assert response.status_code == 200 and time.time() - started < 1
+    assert api_server.cameras_config['cam1']['status'] == 'offline'
+    release.set()
+
+
+def test_model_load_failure_skips_the_warmup(monkeypatch):
+    monkeypatch.setattr(api_server, 'startup_phases', {})
+
+    def missing_model():
+        raise ModuleNotFoundError("No module named 'ultralytics'")
+
+    monkeypatch.setattr(api_server, 'get_model', missing_model)
+    api_server.load_and_warm_model()
+    assert api_server.startup_phases['model_load']['status'] == 'failed'
+    assert api_server.startup_phases['warmup'] == {'status': 'skipped', 'reason': 'model not loaded'}
+
+
+def test_warmup_covers_every_configured_imgsz(monkeypatch):
+    monkeypatch.setattr(api_server, 'startup_phases', {})
+    monkeypatch.setattr(api_server, 'get_model', lambda: object())
+    monkeypatch.setattr(api_server, 'configured_imgsz_values', lambda: [320, 640])
+    warmed = []
+    monkeypatch.setattr(api_server, 'warm_up_model', warmed.append)
+    api_server.load_and_warm_model()
+    assert warmed == [320, 640]
+    assert api_server.startup_phases['warmup']['status'] == 'done'
+    assert api_server.startup_phases['warmup']['imgsz'] == [320, 640]
+
+
+def test_model_is_loaded_once_on_first_use(monkeypatch):
+    class Detector:
+        vehicle_class_ids = {2, 7}
+
+    loads = []
+
+    def load_yolo(path):
+        loads.append(path)
+        time.sleep(0.05)  # Chamadas concorrentes chegam enquanto o primeiro carrega
+        return Detector()
+
+    monkeypatch.setattr(camera_pipeline, 'model', None)
+    monkeypatch.setattr(camera_pipeline, 'target_class_ids', set())
+    monkeypatch.setattr(camera_pipeline, 'load_yolo', load_yolo)
+    threads = [threading.Thread(target=camera_pipeline.get_model) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == [camera_pipeline.active_model_path]
+    assert camera_pipeline.target_class_ids == {2, 7}
@@ -0,0 +1,169 @@
+"""Testes do modo ASGI: ponte WSGI, streams em corrotinas e esperas do frame_hub (pytest)"""
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+import api_server
+import asgi_server
+from frame_hub import FrameHub, frame_hub
+from occupancy_feed import occupancy_feed
+
+
+def http_scope(path, method='GET', query=b'', headers=()):
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5555),
+    }
+
+
+class Client:
+    """Um lado da conexão ASGI: guarda o que a app enviou e decide quando desconectar"""
+
+    def __init__(self, messages=(), disconnect=None):
+        self.incoming = list(messages)
+        self.sent = []
+        self.disconnect = disconnect or asyncio.Event()
+        self.closing_type = 'http.disconnect'
+
+    async def receive(self):
+        if self.incoming:
+            return self.incoming.pop(0)
+        await self.disconnect.wait()
+        return {'type': self.closing_type}
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def body(self):
+        return b''.join(message.get('body', b'') for message in self.sent if message['type'] == 'http.response.body')
+
+
+@pytest.fixture
+def cameras(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, 'cameras_config', {'cam1': {'name': 'Entrada', 'areas': []}})
+    monkeypatch.setattr(api_server, 'cameras_stats', {})
+    monkeypatch.setattr(api_server, 'worker_pool', None)
+    monkeypatch.setattr(api_server, 'CONFIG_FILE', str(tmp_path / 'cameras_config.json'))
+    api_server.mark_cameras_changed()
+
+
+def test_environ_merges_repeated_headers_and_keeps_content_headers():
+    environ = asgi_server.build_environ(http_scope('/api/x', 'POST', b'a=1', [
+        ('Content-Type', 'application/json'), ('Content-Length', '2'), ('Accept', 'text/html'), ('Accept', '*/*'),
+    ]), b'{}')
+    assert (environ['CONTENT_TYPE'], environ['CONTENT_LENGTH']) == ('application/json', '2')
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*' and environ['QUERY_STRING'] == 'a=1'
+    assert environ['wsgi.input'].read() == b'{}'
+
+
+def test_regular_endpoints_go_through_the_flask_app(cameras):
+    client = Client([{'type': 'http.request', 'body': b''}])
+    asyncio.run(asgi_server.app(http_scope('/api/cameras'), client.receive, client.send))
+    start = client.sent[0]
+    assert start['status'] == 200
+    assert json.loads(client.body())[0]['id'] == 'cam1'
+
+    etag = dict(start['headers'])[b'etag'].decode('latin-1')
+    cached = Client([{'type': 'http.request', 'body': b''}])
+    asyncio.run(asgi_server.app(http_scope('/api/cameras', headers=[('If-None-Match', etag)]), cached.receive, cached.send))
+    assert cached.sent[0]['status'] == 304
+
+
+def test_request_body_arrives_in_chunks(cameras):
+    body = json.dumps({'imgsz': 416}).encode('utf-8')
+    client = Client([
+        {'type': 'http.request', 'body': body[:5], 'more_body': True},
+        {'type': 'http.request', 'body': body[5:]},
+    ])
+    scope = http_scope('/api/cameras/cam1/settings', 'PUT', headers=[('Content-Type', 'application/json')])
+    asyncio.run(asgi_server.app(scope, client.receive, client.send))
+    assert client.sent[0]['status'] == 200
+    assert api_server.cameras_config['cam1']['imgsz'] == 416
+
+
+def test_stream_sends_each_new_frame_and_releases_the_viewer(monkeypatch):
+    monkeypatch.setattr(asgi_server, 'is_camera_running', lambda camera_id: True)
+    frame_hub.remove('asgi-cam')
+
+    async def scenario():
+        client = Client()
+        stream = asyncio.create_task(asgi_server.app(http_scope('/api/cameras/asgi-cam/stream'), client.receive, client.send))
+        await asyncio.sleep(0.05)
+        assert frame_hub.viewer_counts().get('asgi-cam') == 1
+        for index in range(2):
+            # Publicação vem do thread da câmera, não do event loop
+            threading.Thread(target=frame_hub.publish, args=('asgi-cam', b'jpeg-%d' % index, 1.0)).start()
+            await asyncio.sleep(0.05)
+        client.disconnect.set()
+        await asyncio.wait_for(stream, 5.0)
+        return client
+
+    client = asyncio.run(scenario())
+    parts = [message['body'] for message in client.sent[1:] if message.get('more_body')]
+    assert len(parts) == 2 and parts[0].endswith(b'jpeg-0\r\n') and parts[1].endswith(b'jpeg-1\r\n')
+    assert 'asgi-cam' not in frame_hub.viewer_counts()
+    frame_hub.remove('asgi-cam')
+
+
+def test_one_future_per_loop_wakes_every_waiter():
+    hub = FrameHub()
+
+    async def scenario():
+        waiters = [asyncio.create_task(hub.wait_async('cam', -1, 5.0)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert len(hub.async_waiters['cam']) == 1
+        threading.Thread(target=hub.publish, args=('cam', b'jpeg', 2.0)).start()
+        return await asyncio.gather(*waiters)
+
+    frames = asyncio.run(scenario())
+    assert [frame[1] for frame in frames] == [b'jpeg'] * 3
+
+
+def test_wait_async_times_out_and_removal_releases_waiters():
+    hub = FrameHub()
+    hub.publish('cam', b'jpeg')
+    seq = hub.latest('cam')[0]
+
+    async def scenario():
+        assert await hub.wait_async('cam', seq, 0.05) is None  # Nada novo: timeout
+        waiter = asyncio.create_task(hub.wait_async('cam', seq, 5.0))
+        await asyncio.sleep(0.01)
+        hub.remove('cam')
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_viewer_listener_sees_first_and_last_viewer_only():
+    hub = FrameHub()
+    calls = []
+    hub.viewer_listener = lambda camera_id, watched: calls.append((camera_id, watched))
+    with hub.watch('cam'):
+        with hub.watch('cam'):
+            pass
+        assert calls == [('cam', True)]
+    assert calls == [('cam', True), ('cam', False)]
+
+
+def test_occupancy_websocket_starts_with_a_snapshot():
+    occupancy_feed.update('ws-cam', {'spots': [{'occupied': True}]})
+
+    async def scenario():
+        client = Client([{'type': 'websocket.connect'}])
+        client.closing_type = 'websocket.disconnect'
+        scope = {'type': 'websocket', 'path': '/api/occupancy/ws', 'query_string': b'cameras=ws-cam', 'headers': []}
+        task = asyncio.create_task(asgi_server.app(scope, client.receive, client.send))
+        await asyncio.sleep(0.05)
+        client.disconnect.set()
+        await asyncio.wait_for(task, 5.0)
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.sent[0] == {'type': 'websocket.accept'}
+    snapshot = json.loads(client.sent[1]['text'])
+    assert snapshot['type'] == 'snapshot' and list(snapshot['cameras']) == ['ws-cam']
+    occupancy_feed.remove('ws-cam')
@@ -0,0 +1,99 @@
+"""Testes do gerador de carga MJPEG contra um servidor HTTP local (pytest)"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import benchmark_streaming
+from api_server import mjpeg_part
+from benchmark_streaming import StreamClient, process_cpu_seconds
+
+FRAME = b'\xff\xd8' + b'x' * 2000 + b'\xff\xd9'
+SERVER_FPS = 20.0
+
+
+class MjpegHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith('/status'):
+            body = b'{"status": "online"}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            while not self.server.stopping.is_set():
+                self.wfile.write(mjpeg_part(FRAME, time.time() - 0.05))
+                self.wfile.flush()
+                time.sleep(1.0 / SERVER_FPS)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MjpegHandler)
+    server.daemon_threads = True
+    server.stopping = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.stopping.set()
+    server.shutdown()
+    server.server_close()
+
+
+class ChunkedResponse:
+    """Resposta falsa que devolve o stream em pedaços arbitrários"""
+
+    def __init__(self, data, size):
+        self.chunks = [data[start:start + size] for start in range(0, len(data), size)]
+
+    def read1(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+def test_parts_split_across_reads_are_reassembled():
+    now = time.time()
+    stream = b''.join(mjpeg_part(FRAME, now - 0.2) for _ in range(4)) + b'--frame\r\n'
+    client = StreamClient('http://unused', 'cam1', measure_from=0.0, deadline=now + 5, insecure=True)
+    client._consume(ChunkedResponse(stream, 333), started=now)
+    assert client.frames == 4 and client.bytes == len(stream)
+    assert len(client.ages) == 4 and all(0.199 <= age < 1.0 for age in client.ages)  # X-Captured-At em ms
+    assert client.error == 'stream closed' and client.first_frame is not None
+
+
+def test_step_measures_normal_slow_and_status_clients(server_url):
+    args = benchmark_streaming.parse_args([
+        '--url', server_url, '--camera', 'cam1', '--duration', '1.0', '--warmup', '0.3',
+        '--slow-fraction', '0.5', '--slow-rate', '16', '--status-clients', '1', '--status-interval', '0.1',
+        '--server-pid', str(os.getpid()),
+    ])
+    step = benchmark_streaming.run_step(args, clients=2)
+
+    normal, slow = step['normal'], step['slow']
+    assert (normal['clients'], slow['clients']) == (1, 1) and normal['failed'] == 0
+    assert SERVER_FPS * 0.5 <= normal['fps']['mean'] <= SERVER_FPS * 1.2
+    # 16 KB/s não dá conta de 20 frames de ~2 KB por segundo
+    assert slow['bytes_per_second'] < normal['bytes_per_second']
+    assert normal['capture_to_client']['p50_ms'] >= 50
+    assert step['status']['errors'] == 0 and step['status']['latency']['count'] >= 5
+    assert step['server_cpu_percent'] is not None
+
+
+def test_server_cpu_needs_a_readable_process():
+    assert process_cpu_seconds(None) is None
+    assert process_cpu_seconds(os.getpid()) >= 0
+    assert process_cpu_seconds(2 ** 22 + 12345) is None
@@ -0,0 +1,47 @@
+"""Testes da calibração de imgsz (pytest)"""
+
+import numpy as np
+
+from calibration import calibrate_imgsz, parse_imgsz, parse_imgsz_candidates
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+CARS = np.array([[100 + 150 * i, 300, 220 + 150 * i, 400] for i in range(4)], dtype=np.float32)
+
+
+def detector(missed_below: int):
+    """Detector falso: acha todos os carros a partir de `missed_below`, nenhum abaixo"""
+    def detect(frame, imgsz):
+        return CARS if imgsz >= missed_below else np.empty((0, 4), dtype=np.float32)
+    return detect
+
+
+def test_chooses_smallest_size_with_enough_recall():
+    report = calibrate_imgsz([FRAME] * 3, detector(416), [], candidates=(320, 416, 512, 640))
+    assert report['imgsz'] == 416
+    assert not report['inconclusive']
+    assert report['candidates'][0]['recall'] == 0.0
+
+
+def test_empty_lot_is_inconclusive_and_keeps_reference_size():
+    report = calibrate_imgsz([FRAME] * 3, detector(10_000), [], candidates=(320, 640))
+    assert report['inconclusive']
+    assert report['imgsz'] == 640
+    assert report['reference_detections'] == 0
+
+
+def test_too_few_reference_detections_is_inconclusive():
+    report = calibrate_imgsz([FRAME] * 2, detector(320), [], candidates=(320, 640))
+    assert report['reference_detections'] == 8
+    assert report['inconclusive'] and report['imgsz'] == 640
+
+
+def test_parse_imgsz_candidates():
+    assert parse_imgsz_candidates([320, 640]) == [320, 640]
+    for value in ([], [0], [-32], [300], [320.0], [True], '640', None):
+        assert parse_imgsz_candidates(value) is None
+
+
+def test_parse_imgsz_does_not_coerce():
+    assert parse_imgsz(416) == 416
+    for value in (320.5, 320.0, '320', True, 0, -64, 300, None):
+        assert parse_imgsz(value) is None
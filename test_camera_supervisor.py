@@ -0,0 +1,126 @@
+"""Testes do watchdog e do backoff do CameraSupervisor (pytest)"""
+
+import threading
+
+import pytest
+
+import camera_supervisor
+from camera_supervisor import RESTART_RESET_AFTER, CameraHandle, CameraSupervisor, restart_delay
+
+NOW = 10_000.0
+
+
+class Thread:
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+class Capture:
+    def __init__(self, status='connected', last_frame_time=NOW):
+        self.status = status
+        self.last_frame_time = last_frame_time
+        self.stops = []
+
+    def stop(self, wait=True):
+        self.stops.append(wait)
+
+
+class Pipeline:
+    def __init__(self, last_heartbeat=NOW):
+        self.last_heartbeat = last_heartbeat
+        self.last_frame_at = None
+        self.main_stream = None
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    monkeypatch.setattr(camera_supervisor.random, 'uniform', lambda low, high: 1.0)  # Sem jitter
+    sup = CameraSupervisor(lambda camera_id: {}, lambda camera_id: None, stall_seconds=30)
+    sup.spawned = []
+    monkeypatch.setattr(sup, '_spawn', lambda handle: sup.spawned.append(handle.camera_id))
+    return sup
+
+
+def running_handle(capture=None, pipeline=None, thread=None, started_at=NOW - 60):
+    handle = CameraHandle('cam1')
+    handle.state = 'running'
+    handle.thread = thread or Thread()
+    handle.capture = capture or Capture()
+    handle.pipeline = pipeline or Pipeline()
+    handle.started_at = started_at
+    return handle
+
+
+def test_backoff_doubles_up_to_the_cap():
+    delays = [restart_delay(attempt, jitter=0.0) for attempt in range(1, 8)]
+    assert delays == [2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0]
+
+
+def test_jitter_stays_within_bounds():
+    for _ in range(200):
+        assert 4.0 * 0.5 <= restart_delay(2) <= 4.0 * 1.5
+
+
+def test_healthy_camera_is_left_alone(supervisor):
+    handle = running_handle()
+    supervisor._check(handle, NOW)
+    assert handle.state == 'running' and handle.next_restart_at is None
+
+
+def test_dead_thread_is_restarted_after_the_backoff(supervisor):
+    capture = Capture()
+    handle = running_handle(capture=capture, thread=Thread(alive=False))
+    supervisor._check(handle, NOW)
+    assert handle.state == 'crashed' and handle.next_restart_at == NOW + 2.0
+    assert capture.stops == [False]  # A captura antiga é parada sem bloquear o watchdog
+
+    supervisor._check(handle, NOW + 1.0)
+    assert supervisor.spawned == []
+    supervisor._check(handle, NOW + 2.0)
+    assert supervisor.spawned == ['cam1'] and handle.state == 'restarting'
+
+
+def test_frozen_capture_is_a_stall(supervisor):
+    handle = running_handle(capture=Capture(last_frame_time=NOW - 31))
+    supervisor._check(handle, NOW)
+    assert handle.state == 'stalled' and handle.restarts == 1
+
+
+def test_reconnecting_capture_is_not_restarted(supervisor):
+    handle = running_handle(capture=Capture(status='reconnecting', last_frame_time=NOW - 300))
+    supervisor._check(handle, NOW)
+    assert handle.state == 'running'
+
+
+def test_stuck_pipeline_heartbeat_is_a_stall(supervisor):
+    handle = running_handle(pipeline=Pipeline(last_heartbeat=NOW - 45))
+    supervisor._check(handle, NOW)
+    assert handle.state == 'stalled'
+
+
+def test_repeated_failures_back_off_and_stable_run_resets_the_count(supervisor):
+    handle = running_handle(thread=Thread(alive=False))
+    for attempt, expected in enumerate([2.0, 4.0, 8.0], start=1):
+        handle.next_restart_at = None
+        supervisor._check(handle, NOW)
+        assert handle.next_restart_at - NOW == expected and handle.restarts == attempt
+
+    handle.next_restart_at = None
+    handle.thread = Thread()
+    handle.started_at = NOW - RESTART_RESET_AFTER - 1
+    supervisor._check(handle, NOW)
+    assert handle.restarts == 0 and handle.total_restarts == 3
+
+
+def test_stop_while_connecting_never_publishes_the_capture(monkeypatch):
+    sup = CameraSupervisor(lambda camera_id: {'url': 'rtsp://cam'}, lambda camera_id: None)
+    capture = Capture()
+    monkeypatch.setattr(sup, '_open_capture', lambda url: capture)
+    handle = CameraHandle('cam1')
+    stop_event = threading.Event()
+    stop_event.set()  # stop_camera chegou antes do fim do connect
+    sup._run_camera(handle, stop_event)
+    assert handle.capture is None and handle.pipeline is None
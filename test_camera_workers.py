@@ -0,0 +1,182 @@
+"""Testes do seqlock dos slots em memória compartilhada (pytest)"""
+
+import json
+import threading
+import uuid
+
+from camera_workers import (
+    SLOT_HEADER,
+    CameraSharedState,
+    CameraWorkerPool,
+    SharedSlot,
+    WorkerStatus,
+    create_segment,
+    shm_name,
+)
+
+
+def make_slot(capacity=64):
+    return SharedSlot(memoryview(bytearray(SharedSlot.size_for(capacity))), 0, capacity)
+
+
+def test_empty_slot_reads_none():
+    assert make_slot().read() is None
+
+
+def test_write_then_read_returns_even_sequence():
+    slot = make_slot()
+    assert slot.write(b'frame-1', timestamp=12.5)
+    seq, data, timestamp = slot.read()
+    assert (seq, data, timestamp) == (2, b'frame-1', 12.5)
+    assert slot.read(last_seq=seq) is None  # Nada novo desde a última leitura
+    slot.write(b'f2')
+    assert slot.read(last_seq=seq)[:2] == (4, b'f2')
+
+
+def test_oversized_write_is_rejected_without_touching_the_slot():
+    slot = make_slot(capacity=4)
+    slot.write(b'ok')
+    assert not slot.write(b'too large')
+    assert slot.read()[1] == b'ok'
+
+
+def test_reader_gives_up_while_writer_holds_the_slot():
+    slot = make_slot()
+    slot.write(b'old')
+    SLOT_HEADER.pack_into(slot.buffer, slot.offset, 3, 0, 0.0)  # Escritor parado no meio (seq ímpar)
+    assert slot.read() is None
+
+
+def test_reader_retries_when_sequence_changes_mid_copy():
+    slot = make_slot()
+    slot.write(b'first')
+    headers = iter([(2, 5, 1.0), (4, 6, 2.0), (4, 6, 2.0), (4, 6, 2.0)])
+    slot._header = lambda: next(headers)  # Uma escrita termina entre o cabeçalho e a cópia
+    slot.buffer[slot.data_offset:slot.data_offset + 6] = b'second'
+    assert slot.read() == (4, b'second', 2.0)
+
+
+def test_concurrent_reads_never_see_torn_data():
+    slot = make_slot(capacity=4096)
+    stop = threading.Event()
+
+    def writer():
+        value = 0
+        while not stop.is_set():
+            value = (value + 1) % 256
+            slot.write(bytes([value]) * (1 + value * 16))
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        reads = 0
+        last_seq = -1
+        for _ in range(20000):
+            result = slot.read(last_seq)
+            if result is None:
+                continue
+            last_seq, data, _ = result
+            assert len(set(data)) == 1 and len(data) == 1 + data[0] * 16
+            reads += 1
+        assert reads > 0
+    finally:
+        stop.set()
+        thread.join(5)
+
+
+def test_shared_state_round_trip_between_owner_and_reader():
+    name = shm_name(f"test-{uuid.uuid4()}")
+    owner = CameraSharedState(name, create=True)
+    reader = CameraSharedState(name)
+    try:
+        owner.publish(b'jpeg', {'occupied': 3, 'freshness': {'display_captured_at': 7.0}})
+        assert reader.frame.read()[1:] == (b'jpeg', 7.0)
+        assert json.loads(reader.stats.read()[1])['occupied'] == 3
+    finally:
+        reader.close()
+        owner.close()
+
+
+def test_stale_segment_is_replaced():
+    name = shm_name(f"test-{uuid.uuid4()}")
+    stale = create_segment(name, 16)
+    stale.buf[:4] = b'old!'
+    fresh = create_segment(name, 32)
+    try:
+        assert bytes(fresh.buf[:4]) == b'\x00' * 4
+    finally:
+        stale.close()
+        fresh.close()
+        fresh.unlink()
+
+
+def test_shm_name_is_short_and_unique_per_full_id():
+    prefix = 'camera-' + 'x' * 40
+    assert shm_name(prefix + 'a') != shm_name(prefix + 'b')
+    assert len(shm_name(prefix + 'a')) <= 30
+
+
+class FakeProcess:
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+def make_pool(*published, alive=None):
+    pool = CameraWorkerPool(len(published))
+    pool.processes = [FakeProcess(True if alive is None else alive[index]) for index in range(len(published))]
+    pool.statuses = [WorkerStatus(shm_name(f"test-{uuid.uuid4()}"), create=True) for _ in published]
+    for status, worker in zip(pool.statuses, published):
+        if worker is not None:
+            status.publish(worker)
+    return pool
+
+
+def close_pool(pool):
+    for status in pool.statuses:
+        status.close()
+
+
+def worker(active='yolo11s.pt', load='done', warmup='done', swap='idle'):
+    return {
+        'active': active, 'swap': {'state': swap},
+        'model_load': {'status': load, 'seconds': 2.0}, 'warmup': {'status': warmup, 'seconds': 0.5},
+    }
+
+
+def test_model_report_waits_for_every_live_worker():
+    pool = make_pool(worker(), worker(warmup='running'), None)
+    try:
+        report = pool.model_report()
+        assert report['active'] == 'yolo11s.pt'
+        assert report['model_load'] == {'status': 'pending'}  # O terceiro ainda não publicou
+        assert report['warmup'] == {'status': 'running'}
+        assert [item['alive'] for item in report['workers']] == [True, True, True]
+    finally:
+        close_pool(pool)
+
+
+def test_model_report_ignores_dead_workers_and_surfaces_failures():
+    pool = make_pool(worker(), worker(load='failed', warmup='pending'), alive=[True, False])
+    try:
+        assert pool.model_report()['model_load'] == {'status': 'done', 'seconds': 2.0}
+        pool.processes[1].alive = True
+        assert pool.model_report()['model_load']['status'] == 'failed'
+    finally:
+        close_pool(pool)
+
+
+def test_swap_is_done_only_when_every_worker_runs_the_new_model():
+    pool = make_pool(worker(active='yolo11m.pt', swap='done'), worker())
+    pool.model_path = 'yolo11m.pt'
+    try:
+        report = pool.model_report()
+        assert report['swap'] == {'state': 'loading', 'path': 'yolo11m.pt'}  # Comando ainda na fila do segundo
+        assert report['active'] == ['yolo11m.pt', 'yolo11s.pt']
+        pool.statuses[1].publish(worker(active='yolo11m.pt', swap='done'))
+        report = pool.model_report()
+        assert report['swap']['state'] == 'done' and report['active'] == 'yolo11m.pt'
+    finally:
+        close_pool(pool)
@@ -0,0 +1,46 @@
+"""Testes das fontes de replay do capture (pytest)"""
+
+import time
+
+import pytest
+
+from capture import VideoCapture, parse_replay_source
+
+
+def test_live_sources_are_not_replays():
+    assert parse_replay_source('rtsp://camera/stream') is None
+    assert parse_replay_source(0) is None
+
+
+def test_synthetic_source_options():
+    options = parse_replay_source('synthetic://?fps=25&seed=3&pace=unpaced&width=320&height=180')
+    assert options['kind'] == 'synthetic' and options['pace'] == 'unpaced'
+    assert (options['fps'], options['seed'], options['width'], options['height']) == (25.0, 3, 320, 180)
+
+
+@pytest.mark.parametrize('query', ['pace=0', 'pace=-5', 'fps=0', 'fps=-25'])
+def test_non_positive_rate_is_rejected(query):
+    with pytest.raises(ValueError):
+        parse_replay_source(f'synthetic://?{query}')
+
+
+def test_expired_start_is_ignored_so_restarts_can_rebuild_the_camera():
+    url = f'synthetic://?pace=unpaced&start={time.time() - 3600:.3f}'
+    for _ in range(2):  # Um restart do supervisor recria a câmera com a mesma URL
+        capture = VideoCapture(url, width=160, height=90)
+        before = time.time()
+        assert capture._open_source()
+        assert capture.frame_timestamp >= before
+        capture.cap.release()
+
+
+def test_future_start_fixes_frame_zero():
+    start = time.time() + 60
+    capture = VideoCapture(f'synthetic://?fps=10&start={start:.3f}', width=160, height=90)
+    assert capture._open_source()
+    assert capture.frame_timestamp == pytest.approx(start)
+    capture._replay_index = 4
+    capture.started = True
+    capture.replay['pace'] = 'unpaced'  # Não espera o instante do frame no teste
+    assert capture._pace_replay() == pytest.approx(start + 0.5)
+    capture.cap.release()
@@ -0,0 +1,101 @@
+"""Testes dos gatilhos da cascata e da fusão das detecções dos recortes (pytest)"""
+
+import numpy as np
+
+from cascade import CascadeStats, find_ambiguous_spots, merge_crop_detections, spot_crop_rect
+
+SPOTS = [
+    [[0, 0], [100, 0], [100, 100], [0, 100]],
+    [[200, 0], [300, 0], [300, 100], [200, 100]],
+]
+
+
+def detections(*boxes, conf=0.9):
+    xyxy = np.array([box[:4] for box in boxes], dtype=np.float32).reshape(-1, 4)
+    confs = np.array([box[4] if len(box) > 4 else conf for box in boxes], dtype=np.float32)
+    return xyxy, confs, np.full(len(boxes), 2, dtype=np.int64)
+
+
+def test_confident_centered_car_needs_no_escalation():
+    found = detections((20, 20, 80, 80))
+    assert find_ambiguous_spots(SPOTS, found, [True, False], [True, False]) == {}
+
+
+def test_state_change_escalates_the_spot():
+    assert find_ambiguous_spots(SPOTS, detections(), [False, True], [False, False]) == {1: 'state_change'}
+    # Sem estado anterior (primeiro frame) ou com outra quantidade de vagas, não há mudança
+    assert find_ambiguous_spots(SPOTS, detections(), [False, True], None) == {}
+    assert find_ambiguous_spots(SPOTS, detections(), [False, True], [False]) == {}
+
+
+def test_low_confidence_car_inside_the_spot_escalates():
+    found = detections((220, 20, 280, 80, 0.3))
+    assert find_ambiguous_spots(SPOTS, found, [False, True], [False, True]) == {1: 'low_confidence'}
+
+
+def test_center_near_the_spot_edge_escalates_as_border():
+    found = detections((80, 30, 120, 70))  # Centro (100, 50) em cima da borda da vaga 0
+    assert find_ambiguous_spots(SPOTS, found, [True, False], [True, False]) == {0: 'border'}
+    far = detections((130, 30, 170, 70))  # Centro a 50 px das duas vagas
+    assert find_ambiguous_spots(SPOTS, far, [False, False], [False, False]) == {}
+
+
+def test_state_change_wins_over_other_reasons():
+    found = detections((20, 20, 80, 80, 0.2))
+    assert find_ambiguous_spots(SPOTS, found, [True, False], [False, False]) == {0: 'state_change'}
+
+
+def test_crop_rect_is_padded_and_clamped_to_the_frame():
+    assert spot_crop_rect(SPOTS[0], (120, 320, 3)) == (0, 0, 126, 120)
+    assert spot_crop_rect(SPOTS[1], (400, 640, 3)) == (175, 0, 326, 126)
+
+
+def test_crop_boxes_are_mapped_back_to_frame_coordinates():
+    base = detections((20, 20, 80, 80, 0.4), (400, 20, 460, 80))
+    crop = ((175, 0, 325, 125), detections((40, 25, 100, 85, 0.8)))
+    boxes, confs, classes = merge_crop_detections(base, [crop])
+    # A caixa leve fora do recorte fica; a do recorte vem deslocada por (x1, y1)
+    assert boxes.tolist() == [[20, 20, 80, 80], [400, 20, 460, 80], [215, 25, 275, 85]]
+    assert confs.tolist() == np.array([0.4, 0.9, 0.8], dtype=np.float32).tolist()
+    assert classes.dtype == np.int64 and boxes.dtype == np.float32
+
+
+def test_light_boxes_inside_a_crop_are_replaced_by_the_heavy_ones():
+    base = detections((220, 20, 280, 80, 0.3))
+    boxes, _, _ = merge_crop_detections(base, [((175, 0, 325, 125), detections())])
+    assert len(boxes) == 0  # O modelo pesado não viu carro: a detecção fraca sai
+
+
+def test_car_seen_by_two_overlapping_crops_is_kept_once():
+    # Vagas vizinhas: os recortes (0..150) e (100..250) se sobrepõem em 100..150
+    left, right = (0, 0, 150, 100), (100, 0, 250, 100)
+    car_left = detections((105, 10, 145, 90, 0.9))
+    car_right = detections((5, 10, 45, 90, 0.7))  # O mesmo carro, visto pelo outro recorte
+    boxes, confs, _ = merge_crop_detections(detections(), [(left, car_left), (right, car_right)])
+    assert boxes.tolist() == [[105, 10, 145, 90]] and confs.tolist() == [np.float32(0.9)]
+
+
+def test_car_cut_by_a_crop_edge_is_not_counted_twice():
+    left, right = (0, 0, 180, 100), (150, 0, 300, 100)
+    whole = detections((110, 10, 170, 90, 0.9))   # 110..170 em coordenadas do frame
+    cut = detections((0, 10, 20, 90, 0.6))        # Só a parte 150..170 no recorte da direita
+    boxes, _, _ = merge_crop_detections(detections(), [(left, whole), (right, cut)])
+    assert boxes.tolist() == [[110, 10, 170, 90]]
+
+
+def test_adjacent_cars_in_overlapping_crops_are_both_kept():
+    left, right = (0, 0, 150, 100), (100, 0, 250, 100)
+    boxes, _, _ = merge_crop_detections(detections(), [
+        (left, detections((20, 10, 95, 90))), (right, detections((10, 10, 90, 90))),  # 20..95 e 110..190
+    ])
+    assert len(boxes) == 2
+
+
+def test_stats_count_escalations_and_reasons():
+    stats = CascadeStats()
+    stats.record({})
+    stats.record({0: 'border', 1: 'state_change'})
+    assert stats.as_dict() == {
+        'frames': 2, 'escalations': 1, 'escalation_rate': 0.5, 'escalated_spots': 2,
+        'reasons': {'border': 1, 'state_change': 1},
+    }
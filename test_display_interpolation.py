@@ -0,0 +1,74 @@
+"""Testes da exibição interpolada entre inferências esparsas (pytest)"""
+
+import time
+
+import numpy as np
+import pytest
+
+import camera_pipeline
+from camera_pipeline import DisplayStats, scale_detections
+from tracking import VELOCITY_SMOOTHING, IoUTracker
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+
+def test_boxes_are_projected_with_the_track_velocity():
+    tracker = IoUTracker()
+    ids = tracker.update(np.array([[100, 100, 200, 200]], dtype=np.float32), now=0.0)
+    tracker.update(np.array([[110, 100, 210, 200]], dtype=np.float32), now=0.5)  # 20 px/s para a direita
+    speed = 20 * VELOCITY_SMOOTHING  # Primeira medida entra suavizada
+    assert tracker.predict(ids, now=1.0)[0] == pytest.approx([110 + speed * 0.5, 100, 210 + speed * 0.5, 200])
+    # Longe da última detecção a projeção para no horizonte em vez de sair da tela
+    assert tracker.predict(ids, now=60.0, max_horizon=1.0)[0] == pytest.approx([110 + speed, 100, 210 + speed, 200])
+
+
+def test_vanished_tracks_predict_nan():
+    tracker = IoUTracker()
+    tracker.update(np.array([[0, 0, 50, 50]], dtype=np.float32), now=0.0)
+    predicted = tracker.predict(np.array([1, 99]), now=0.1)
+    assert not np.isnan(predicted[0]).any() and np.isnan(predicted[1]).all()
+    assert IoUTracker().predict(np.array([1]), now=0.0).shape == (1, 4)
+
+
+def test_display_stats_account_for_saved_inference():
+    display = DisplayStats()
+    display.record(0.0, inference_seconds=0.04)
+    for step in range(1, 4):
+        display.record(step * 0.1)
+    stats = display.as_dict()
+    assert (stats['inference_frames'], stats['interpolated_frames']) == (1, 3)
+    assert stats['compute_saved_ratio'] == 0.75
+    assert stats['inference_seconds_saved'] == pytest.approx(0.12)
+    assert stats['display_fps'] == pytest.approx(10.0)
+
+
+def test_detections_scale_to_the_display_frame():
+    detections = (np.array([[10, 20, 30, 40]], dtype=np.float32), np.array([0.9]), np.array([2]))
+    assert scale_detections(detections, 1.0, 1.0) is detections
+    assert scale_detections(detections, 2.0, 1.5)[0].tolist() == [[20, 30, 60, 60]]
+
+
+def test_interpolated_frame_draws_projected_boxes(monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    drawn = []
+    monkeypatch.setattr(camera_pipeline, 'annotate_detections',
+                        lambda frame, detections, track_ids=None: drawn.append((detections[0], track_ids)) or frame)
+    config = {'areas': [[[0.1, 0.1], [0.3, 0.1], [0.3, 0.4], [0.1, 0.4]]]}
+    pipeline = camera_pipeline.CameraPipeline('interp', lambda: None, lambda: config, lambda *args: None)
+
+    now = time.time()
+    ids = pipeline.tracker.update(np.array([[100, 100, 200, 200], [500, 100, 600, 200]], dtype=np.float32), now)
+    pipeline.tracker.max_misses = 0
+    pipeline.tracker.update(np.array([[100, 100, 200, 200]], dtype=np.float32), now)  # O segundo sumiu e expirou
+    pipeline.last_render = {
+        'track_ids': ids,
+        'detections': (np.zeros((2, 4), np.float32), np.array([0.9, 0.8], np.float32), np.array([2, 2])),
+        'areas': config['areas'],
+        'status': [True],
+    }
+
+    jpeg = pipeline.render_interpolated(FRAME)
+    assert jpeg[:2] == b'\xff\xd8'
+    (boxes, track_ids), = drawn
+    assert track_ids.tolist() == [ids[0]] and boxes.tolist() == [[100, 100, 200, 200]]
+    assert pipeline.display.interpolated_frames == 1
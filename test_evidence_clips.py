@@ -0,0 +1,84 @@
+"""Testes do buffer circular de evidência e da gravação dos clipes (pytest)"""
+
+import time
+
+from evidence_clips import EvidenceStore, FrameRing, list_clips, load_clip, prune_clips, write_clip
+
+
+def test_ring_keeps_only_the_last_seconds():
+    ring = FrameRing(seconds=2.0, max_fps=20)
+    for step in range(50):  # 10 fps, abaixo do teto de taxa
+        ring.add(100.0 + step * 0.1, b'x')
+    times = [captured_at for captured_at, _ in ring.snapshot()]
+    assert times[-1] == 104.9 and times[-1] - times[0] <= 2.0
+    assert len(times) in (20, 21)  # 2 s a 10 fps (+1 na borda, conforme o arredondamento)
+    assert ring.bytes == len(times)
+
+
+def test_ring_samples_at_most_max_fps():
+    ring = FrameRing(seconds=10.0, max_fps=5)
+    for step in range(30):  # 30 fps durante 1 s
+        ring.add(step / 30, b'x')
+    assert len(ring.snapshot()) == 5
+
+
+def test_ring_drops_oldest_frames_over_the_byte_budget():
+    ring = FrameRing(seconds=60.0, max_fps=100, max_bytes=250)
+    for step in range(5):
+        ring.add(float(step), bytes([step]) * 100)
+    assert [data[0] for _, data in ring.snapshot()] == [3, 4]
+    assert ring.bytes == 200
+
+
+def test_clock_going_backwards_restarts_the_ring():
+    ring = FrameRing(seconds=10.0, max_fps=100)
+    ring.add(50.0, b'old')
+    ring.add(51.0, b'old')
+    ring.add(3.0, b'new')  # Replay voltou ao início
+    assert ring.snapshot() == [(3.0, b'new')] and ring.bytes == 3
+
+
+def wait_written(store, count, timeout=5.0):
+    deadline = time.time() + timeout
+    while store.written < count and time.time() < deadline:
+        time.sleep(0.01)
+    return store.written
+
+
+def test_capture_writes_the_buffer_and_nearby_changes_share_a_clip(tmp_path):
+    store = EvidenceStore(seconds=5.0, directory=tmp_path)
+    now = time.time()
+    for step in range(4):
+        store.record('cam 1', now - 1.0 + step * 0.25, b'jpeg%d' % step)
+
+    clip = store.capture('cam 1', 'spot_change', min_interval=3.0)
+    assert clip['frames'] == 4 and clip['path'].startswith(str(tmp_path / 'cam_1'))
+    assert store.capture('cam 1', 'spot_change', min_interval=3.0) is clip
+    assert wait_written(store, 1) == 1
+
+    saved = load_clip('cam 1', clip['id'], tmp_path)
+    assert [frame['file'] for frame in saved['frames']] == [f'frame_{idx:04d}.jpg' for idx in range(4)]
+    assert (tmp_path / 'cam_1' / clip['id'] / 'frame_0002.jpg').read_bytes() == b'jpeg2'
+    assert [item['id'] for item in list_clips('cam 1', tmp_path)] == [clip['id']]
+
+
+def test_nothing_to_capture_without_frames(tmp_path):
+    assert EvidenceStore(directory=tmp_path).capture('cam1', 'manual') is None
+    disabled = EvidenceStore(seconds=0, directory=tmp_path)
+    disabled.record('cam1', time.time(), b'jpeg')
+    assert disabled.capture('cam1', 'manual') is None
+
+
+def test_incomplete_clips_are_not_listed_and_old_ones_are_pruned(tmp_path):
+    camera_dir = tmp_path / 'cam1'
+    for clip_id in ('20250101-000000-000-a', '20250102-000000-000-b', '20250103-000000-000-c'):
+        write_clip(camera_dir / clip_id, {'id': clip_id, 'camera_id': 'cam1'}, [(1.0, b'jpeg')])
+    (camera_dir / '20250104-000000-000-partial').mkdir()  # Gravação interrompida: sem index.json
+
+    assert [clip['id'] for clip in list_clips('cam1', tmp_path)] == [
+        '20250103-000000-000-c', '20250102-000000-000-b', '20250101-000000-000-a',
+    ]
+    prune_clips(camera_dir, keep=2)
+    assert sorted(entry.name for entry in camera_dir.iterdir()) == [
+        '20250103-000000-000-c', '20250104-000000-000-partial',
+    ]
@@ -0,0 +1,108 @@
+"""Testes do momento de captura (PTS) e do descarte de frames vencidos (pytest)"""
+
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import camera_pipeline
+from capture import PTS_REFERENCE_WINDOW, VideoCapture
+
+
+class PtsSource:
+    def __init__(self):
+        self.pts_ms = 0.0
+
+    def get(self, prop_id):
+        assert prop_id == cv2.CAP_PROP_POS_MSEC
+        return self.pts_ms
+
+
+def stamp(capture, source, pts, now):
+    source.pts_ms = pts * 1000.0
+    capture._stamp_frame(source, now)
+    return capture.frame_timestamp
+
+
+def test_buffered_frame_is_dated_back_by_its_delay():
+    capture, source = VideoCapture('rtsp://camera/stream'), PtsSource()
+    assert stamp(capture, source, 1.0, 1000.0) == 1000.0  # Referência: relógio - PTS = 999
+    assert stamp(capture, source, 2.0, 1001.0) == 1001.0
+    # Frame com PTS 3.0 só saiu do buffer 0.8 s depois do esperado
+    assert stamp(capture, source, 3.0, 1002.8) == pytest.approx(1002.0)
+
+
+def test_previous_window_keeps_the_reference_across_the_rollover():
+    capture, source = VideoCapture('rtsp://camera/stream'), PtsSource()
+    stamp(capture, source, 1.0, 1000.0)
+    later = 1000.0 + PTS_REFERENCE_WINDOW + 1
+    # Primeiro frame da nova janela já chega atrasado: a janela anterior ainda vale
+    assert stamp(capture, source, later - 999.0, later + 0.5) == pytest.approx(later)
+
+
+def test_sources_without_pts_use_the_read_time():
+    capture, source = VideoCapture('rtsp://camera/stream'), PtsSource()
+    assert stamp(capture, source, 0.0, 1234.5) == 1234.5
+
+
+def test_max_frame_age_setting_bounds():
+    assert camera_pipeline.parse_max_frame_age(1.5) == 1.5
+    assert camera_pipeline.parse_max_frame_age(0) is None
+    assert camera_pipeline.parse_max_frame_age(camera_pipeline.MAX_FRAME_AGE_LIMIT + 1) is None
+    with pytest.raises(ValueError):
+        camera_pipeline.parse_max_frame_age('soon')
+
+
+class TimedCapture:
+    """Captura falsa que entrega uma sequência de (idade do frame, contador)"""
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.frame_count = 0
+
+    def read_timed(self):
+        age, self.frame_count = self.frames[0] if len(self.frames) == 1 else self.frames.pop(0)
+        return True, np.zeros((360, 640, 3), np.uint8), 'connected', time.time() - age, self.frame_count
+
+
+def run_pipeline(monkeypatch, capture, iterations, config=None):
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    monkeypatch.setattr(camera_pipeline.time, 'sleep', lambda seconds: None)
+    pipeline = camera_pipeline.CameraPipeline('fresh', lambda: capture, lambda: config or {}, lambda *args: None)
+    processed = []
+
+    def process_frame(frame, captured_at=None):
+        processed.append(capture.frame_count)
+        return None, {}
+
+    monkeypatch.setattr(pipeline, 'process_frame', process_frame)
+    monkeypatch.setattr(pipeline, 'wait_for_next_slot', lambda is_running: None)
+    remaining = iter(range(iterations))
+    pipeline.run(lambda: next(remaining, None) is not None)
+    return pipeline, processed
+
+
+def test_frames_past_the_deadline_are_dropped_not_inferred(monkeypatch):
+    capture = TimedCapture([(5.0, 1), (5.0, 1), (5.0, 2), (0.1, 3)])
+    pipeline, processed = run_pipeline(monkeypatch, capture, 4)
+    assert processed == [3]
+    assert pipeline.metrics.stale_frames == 2  # Cada frame vencido conta uma vez
+
+
+def test_camera_max_frame_age_overrides_the_default(monkeypatch):
+    capture = TimedCapture([(5.0, 1)])
+    _, processed = run_pipeline(monkeypatch, capture, 1, config={'max_frame_age': 10.0})
+    assert processed == [1]
+
+
+def test_published_stats_carry_the_frame_age(monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    published = []
+    pipeline = camera_pipeline.CameraPipeline('fresh', lambda: None, lambda: {}, lambda *args: published.append(args))
+    captured_at = time.time() - 0.25
+    pipeline.publish_timed(b'jpeg', {}, TimedCapture([(0, 7)]), 5, captured_at)
+    freshness = published[0][1]['freshness']
+    assert freshness['captured_at'] == freshness['display_captured_at'] == captured_at
+    assert 240 <= freshness['pipeline_ms'] < 1000
+    assert published[0][1]['metrics']['queues']['frames_behind'] == 0
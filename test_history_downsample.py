@@ -0,0 +1,72 @@
+"""Testes da redução da série de ocupação: buckets e LTTB (pytest)"""
+
+from datetime import datetime, timezone
+
+from history_downsample import (
+    MAX_HISTORY_HOURS,
+    bucket_seconds_for,
+    bucket_series,
+    lttb,
+    parse_hours,
+    parse_timestamp,
+)
+
+T0 = 1_767_225_600  # 2026-01-01T00:00:00Z, múltiplo de qualquer bucket usado aqui
+
+
+def row(seconds, percentage, total=10):
+    occupied = total * percentage / 100
+    return {
+        'timestamp': datetime.fromtimestamp(T0 + seconds, tz=timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'total_spots': total,
+        'occupied_spots': occupied,
+        'free_spots': total - occupied,
+        'occupancy_percentage': percentage,
+    }
+
+
+def test_bucket_series_aggregates_each_window():
+    rows = [row(0, 10), row(30, 30), row(59, 20), row(60, 50), row(200, 90)]
+    series = bucket_series(rows, 60)
+    assert [point['samples'] for point in series] == [3, 1, 1]  # Bucket 120-180 vazio é omitido
+    first = series[0]
+    assert first['occupancy_percentage'] == 20.0
+    assert (first['occupancy_min'], first['occupancy_max']) == (10.0, 30.0)
+    assert parse_timestamp(first['timestamp']) == T0
+    assert parse_timestamp(series[2]['timestamp']) == T0 + 180
+
+
+def test_bucket_series_empty():
+    assert bucket_series([], 60) == []
+
+
+def test_bucket_seconds_for_fits_window_in_points():
+    assert bucket_seconds_for(24 * 3600, 288) == 300
+    assert bucket_seconds_for(10, 1000) == 1
+
+
+def test_lttb_keeps_endpoints_and_threshold():
+    rows = [row(i * 30, (i * 7) % 100) for i in range(100)]
+    reduced = lttb(rows, 10)
+    assert len(reduced) == 10
+    assert reduced[0] is rows[0] and reduced[-1] is rows[-1]
+    times = [parse_timestamp(point['timestamp']) for point in reduced]
+    assert times == sorted(times)
+
+
+def test_lttb_keeps_a_spike():
+    rows = [row(i * 30, 100 if i == 37 else 20) for i in range(100)]
+    assert rows[37] in lttb(rows, 8)
+
+
+def test_lttb_small_inputs():
+    rows = [row(i, i) for i in range(5)]
+    assert lttb(rows, 10) == rows
+    assert lttb(rows, 2) == [rows[0], rows[-1]]
+
+
+def test_parse_hours_caps_the_window():
+    assert parse_hours('24') == 24
+    assert parse_hours(MAX_HISTORY_HOURS) == MAX_HISTORY_HOURS
+    for value in (0, -1, MAX_HISTORY_HOURS + 1, 'abc', None):
+        assert parse_hours(value) is None
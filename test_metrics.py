@@ -0,0 +1,65 @@
+"""Testes dos histogramas por etapa e da exportação Prometheus (pytest)"""
+
+from metrics import LATENCY_BUCKETS, Histogram, PipelineMetrics, render_prometheus
+
+
+def sample(text, name):
+    """Valor da linha `name` (com labels) no texto exposto"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{name} not exported')
+
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    histogram = Histogram()
+    for seconds in (0.001, 0.0011, 0.3, 10.0):
+        histogram.observe(seconds)
+    counts = histogram.counts
+    assert counts[LATENCY_BUCKETS.index(0.001)] == 1      # le="0.001" inclui o próprio limite
+    assert counts[LATENCY_BUCKETS.index(0.0025)] == 1
+    assert counts[LATENCY_BUCKETS.index(0.5)] == 1
+    assert counts[-1] == 1                                # +Inf
+    assert histogram.as_dict()['count'] == 4
+
+
+def test_capture_counter_gaps_are_dropped_and_repeats_duplicated():
+    metrics = PipelineMetrics()
+    metrics.record_capture_frame(10, -1)  # Primeiro frame: nada a comparar
+    metrics.record_capture_frame(14, 10)
+    metrics.record_capture_frame(14, 14)
+    metrics.record_capture_frame(15, 14)
+    assert (metrics.dropped_frames, metrics.duplicate_frames) == (3, 1)
+
+
+def test_prometheus_histograms_are_cumulative():
+    metrics = PipelineMetrics()
+    for seconds in (0.004, 0.02, 0.02, 3.0):
+        metrics.observe('inference', seconds)
+    metrics.stale_frames = 2
+    text = render_prometheus({'cam1': {'fps': 12.5, 'occupied': 3, 'metrics': metrics.as_dict()}})
+
+    labels = 'camera="cam1",stage="inference"'
+    assert sample(text, f'parking_stage_seconds_bucket{{{labels},le="0.005"}}') == 1
+    assert sample(text, f'parking_stage_seconds_bucket{{{labels},le="0.025"}}') == 3
+    assert sample(text, f'parking_stage_seconds_bucket{{{labels},le="2.5"}}') == 3
+    assert sample(text, f'parking_stage_seconds_bucket{{{labels},le="+Inf"}}') == 4
+    assert sample(text, f'parking_stage_seconds_count{{{labels}}}') == 4
+    assert sample(text, 'parking_frames_stale_total{camera="cam1"}') == 2
+    assert sample(text, 'parking_camera_fps{camera="cam1"}') == 12.5
+    assert '# TYPE parking_stage_seconds histogram' in text
+
+
+def test_camera_without_frames_is_only_reported_down():
+    text = render_prometheus({'idle': None, 'cam"1': {'metrics': PipelineMetrics().as_dict()}})
+    assert sample(text, 'parking_camera_up{camera="idle"}') == 0
+    assert sample(text, 'parking_camera_up{camera="cam\\"1"}') == 1  # Aspas escapadas no label
+    assert 'camera="idle",stage=' not in text
+
+
+def test_process_queues_and_caches_are_exported():
+    caches = {'supabase': {'hits': 5, 'misses': 2, 'coalesced': 1, 'evictions': 0, 'entries': 3}}
+    text = render_prometheus({}, {'patch_batcher': 4}, caches)
+    assert sample(text, 'parking_queue_depth{camera="",queue="patch_batcher"}') == 4
+    assert sample(text, 'parking_cache_requests_total{cache="supabase",result="hit"}') == 5
+    assert sample(text, 'parking_cache_entries{cache="supabase"}') == 3
@@ -0,0 +1,98 @@
+"""Testes do feed de ocupação: retomada por id, lacunas e snapshots (pytest)"""
+
+import asyncio
+import json
+import threading
+
+from occupancy_feed import OccupancyFeed, parse_camera_filter, sse_message
+
+
+def stats(*occupied):
+    return {'spots': [{'index': idx, 'occupied': value} for idx, value in enumerate(occupied)]}
+
+
+def test_only_stable_changes_become_events():
+    feed = OccupancyFeed()
+    assert feed.update('cam1', stats(True, False))
+    assert not feed.update('cam1', stats(True, False))
+    assert feed.update('cam1', stats(True, True))
+    first, second = feed.log
+    assert first['reset'] and first['changes'] == {'0': True, '1': False}
+    assert not second['reset'] and second['changes'] == {'1': True}
+    assert (second['occupied'], second['free'], second['total']) == (2, 0, 2)
+
+
+def test_new_client_gets_a_snapshot_then_only_new_events():
+    feed = OccupancyFeed()
+    feed.update('cam1', stats(True))
+    feed.update('cam2', stats(False, False))
+    events, position = feed.read(None)
+    assert [event['type'] for event in events] == ['snapshot']
+    assert events[0]['cameras']['cam2'] == {'occupied': 0, 'free': 2, 'total': 2, 'spots': [False, False]}
+    assert position == 2
+
+    assert feed.read(position) == ([], 2)
+    feed.update('cam2', stats(True, False))
+    events, position = feed.read(position)
+    assert [event['seq'] for event in events] == [3] and position == 3
+
+
+def test_resume_replays_missed_events_for_the_selected_cameras():
+    feed = OccupancyFeed()
+    feed.update('cam1', stats(False))
+    last_id = feed.log[-1]['id']
+    feed.update('cam2', stats(True))
+    feed.update('cam1', stats(True))
+    feed.remove('cam2')
+
+    events, position = feed.read(feed.parse_event_id(last_id), parse_camera_filter('cam1'))
+    assert [(event['type'], event['camera_id']) for event in events] == [('occupancy', 'cam1')]
+    assert position == 4  # A posição avança mesmo com eventos filtrados
+
+    events, _ = feed.read(feed.parse_event_id(last_id))
+    assert [event['type'] for event in events] == ['occupancy', 'occupancy', 'offline']
+
+
+def test_gap_in_the_ring_buffer_falls_back_to_a_snapshot():
+    feed = OccupancyFeed(capacity=3)
+    for step in range(5):
+        feed.update('cam1', stats(step % 2 == 0, True))
+    # No buffer ficam os seqs 3..5: quem parou em 2 não perdeu nada, quem parou em 1 perdeu o 2
+    events, _ = feed.read(2)
+    assert [event['seq'] for event in events] == [3, 4, 5]
+    events, position = feed.read(1)
+    assert events[0]['type'] == 'snapshot' and position == 5
+    assert events[0]['cameras']['cam1']['spots'] == [True, True]
+
+
+def test_ids_from_another_boot_or_ahead_of_the_log_get_a_snapshot():
+    feed = OccupancyFeed()
+    feed.update('cam1', stats(True))
+    assert feed.parse_event_id('123:1') is None
+    assert feed.parse_event_id(f'{feed.epoch}:abc') is None
+    assert feed.read(feed.parse_event_id('123:1'))[0][0]['type'] == 'snapshot'
+    assert feed.read(7)[0][0]['type'] == 'snapshot'
+
+
+def test_wait_async_wakes_up_on_an_update_from_another_thread():
+    feed = OccupancyFeed()
+
+    async def waiter():
+        timer = threading.Timer(0.05, feed.update, ('cam1', stats(True)))
+        timer.start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await feed.wait_async(0, timeout=5.0)
+        timer.join()
+        return loop.time() - started
+
+    assert asyncio.run(waiter()) < 2.0
+    assert feed.seq == 1
+
+
+def test_sse_message_carries_the_resumable_id():
+    feed = OccupancyFeed()
+    feed.update('cam1', stats(True))
+    lines = sse_message(feed.log[0]).decode('utf-8').split('\n')
+    assert lines[0] == f'id: {feed.epoch}:1' and lines[1] == 'event: occupancy'
+    assert json.loads(lines[2][len('data: '):])['camera_id'] == 'cam1'
@@ -0,0 +1,71 @@
+"""Testes da histerese das vagas e do agrupamento de eventos (pytest)"""
+
+from occupancy_state import EventCoalescer, SpotHysteresis, load_stable_state, save_stable_state
+
+
+def test_first_frame_is_adopted_without_changes():
+    hysteresis = SpotHysteresis(confirm_on=2.0, confirm_off=5.0)
+    stable, changes = hysteresis.update(0.0, [True, False])
+    assert stable == [True, False] and changes == []
+
+
+def test_occupied_confirmed_only_after_confirm_on():
+    hysteresis = SpotHysteresis(confirm_on=2.0, confirm_off=5.0, initial=[False])
+    assert hysteresis.update(10.0, [True]) == ([False], [])
+    assert hysteresis.update(11.9, [True]) == ([False], [])
+    assert hysteresis.update(12.0, [True]) == ([True], [(0, False, True, 12.0)])
+
+
+def test_missed_detection_resets_the_candidate():
+    hysteresis = SpotHysteresis(confirm_on=2.0, confirm_off=5.0, initial=[True])
+    hysteresis.update(0.0, [False])
+    hysteresis.update(4.0, [True])  # Detecção voltou antes de confirmar a saída
+    assert hysteresis.update(6.0, [False]) == ([True], [])
+    assert hysteresis.update(11.0, [False]) == ([False], [(0, True, False, 11.0)])
+
+
+def test_redrawn_spots_adopt_new_layout_silently():
+    hysteresis = SpotHysteresis(initial=[False, False])
+    assert hysteresis.update(0.0, [True, True, False]) == ([True, True, False], [])
+
+
+def test_coalescer_waits_for_window_then_emits_one_event():
+    coalescer = EventCoalescer(window=10.0)
+    coalescer.add([(0, False, True, 100.0)], occupied_before=3)
+    coalescer.add([(1, False, True, 104.0)], occupied_before=4)
+    assert coalescer.flush(109.9, occupied_now=5) is None
+    event = coalescer.flush(110.0, occupied_now=5)
+    assert event['previous'] == 3 and event['current'] == 5
+    assert set(event['spots']) == {'0', '1'}
+    assert event['changes_merged'] == 2
+    assert coalescer.flush(200.0, occupied_now=5) is None  # Janela fechada
+
+
+def test_coalescer_drops_spots_back_to_initial_state():
+    coalescer = EventCoalescer(window=10.0)
+    coalescer.add([(0, False, True, 0.0), (1, True, False, 0.0)], occupied_before=1)
+    coalescer.add([(0, True, False, 5.0)], occupied_before=1)
+    event = coalescer.flush(10.0, occupied_now=0)
+    assert event['spots'] == {'1': {'from': True, 'to': False, 'at': 0.0}}
+
+
+def test_coalescer_returns_none_when_everything_reverted():
+    coalescer = EventCoalescer(window=10.0)
+    coalescer.add([(0, False, True, 0.0)], occupied_before=0)
+    coalescer.add([(0, True, False, 3.0)], occupied_before=1)
+    assert coalescer.flush(10.0, occupied_now=0) is None
+    assert coalescer.opened_at is None
+
+
+def test_forced_flush_closes_an_open_window():
+    coalescer = EventCoalescer(window=10.0)
+    coalescer.add([(2, False, True, 50.0)], occupied_before=0)
+    event = coalescer.flush(51.0, occupied_now=1, force=True)
+    assert event['spots']['2']['to'] is True
+    assert event['window_seconds'] == 1.0
+
+
+def test_stable_state_round_trip(tmp_path):
+    save_stable_state('cam/1', [True, False], directory=tmp_path)
+    assert load_stable_state('cam/1', directory=tmp_path) == [True, False]
+    assert load_stable_state('other', directory=tmp_path) is None
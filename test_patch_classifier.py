@@ -0,0 +1,132 @@
+"""Testes do motor de patches e do fallback para o detector (pytest)"""
+
+import threading
+
+import numpy as np
+import pytest
+
+import camera_pipeline
+from patch_classifier import PatchBatcher, order_corners, spot_confidence, warp_spot_patches
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+AREAS = [[[100, 100], [300, 100], [300, 300], [100, 300]], [[500, 100], [700, 100], [700, 300], [500, 300]]]
+NORMALIZED_AREAS = [[[x / 1280, y / 720] for x, y in area] for area in AREAS]
+
+
+class FakeBatcher:
+    def __init__(self, probs):
+        self.probs = np.asarray(probs, dtype=np.float32)
+        self.calls = 0
+
+    def classify(self, patches):
+        self.calls += 1
+        assert patches.shape == (len(self.probs), 64, 64, 3)
+        return self.probs
+
+
+@pytest.fixture
+def fallback_on(monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'PATCH_FALLBACK_TO_DETECTOR', True)
+    monkeypatch.setattr(camera_pipeline, 'PATCH_MIN_CONFIDENCE', 0.8)
+
+
+def use_batcher(monkeypatch, batcher):
+    monkeypatch.setattr(camera_pipeline, 'get_patch_batcher', lambda: batcher)
+
+
+def test_confident_spots_are_classified(monkeypatch, fallback_on):
+    use_batcher(monkeypatch, FakeBatcher([0.95, 0.1]))
+    status, confidence = camera_pipeline.classify_spots('cam', FRAME, AREAS)
+    assert status == [True, False]
+    assert confidence == pytest.approx([0.95, 0.9])
+
+
+def test_one_uncertain_spot_sends_the_frame_to_the_detector(monkeypatch, fallback_on):
+    use_batcher(monkeypatch, FakeBatcher([0.95, 0.75]))  # Confiança 0.75 < 0.8
+    assert camera_pipeline.classify_spots('cam', FRAME, AREAS) is None
+
+
+def test_uncertain_spot_is_kept_when_fallback_is_disabled(monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'PATCH_FALLBACK_TO_DETECTOR', False)
+    use_batcher(monkeypatch, FakeBatcher([0.95, 0.3]))
+    status, _ = camera_pipeline.classify_spots('cam', FRAME, AREAS)
+    assert status == [True, False]
+
+
+def test_missing_model_or_classifier_error_falls_back(monkeypatch, fallback_on):
+    use_batcher(monkeypatch, None)
+    assert camera_pipeline.classify_spots('cam', FRAME, AREAS) is None
+
+    class Broken:
+        def classify(self, patches):
+            raise RuntimeError('onnx failure')
+
+    use_batcher(monkeypatch, Broken())
+    assert camera_pipeline.classify_spots('cam', FRAME, AREAS) is None
+
+
+def make_pipeline(monkeypatch, probs):
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    monkeypatch.setattr(camera_pipeline, 'save_stable_state', lambda camera_id, status: None)
+    use_batcher(monkeypatch, FakeBatcher(probs))
+    detector_calls = []
+
+    def detect_vehicles(camera_id, frame, imgsz, *args):
+        detector_calls.append(camera_id)
+        boxes = np.array([[150, 150, 250, 250]], dtype=np.float32)  # Carro na primeira vaga
+        return boxes, np.array([0.9], dtype=np.float32), np.array([2], dtype=np.int64)
+
+    monkeypatch.setattr(camera_pipeline, 'detect_vehicles', detect_vehicles)
+    # Desenhar as caixas pede os nomes das classes do YOLO
+    monkeypatch.setattr(camera_pipeline, 'annotate_detections', lambda frame, *args: frame)
+    config = {'areas': NORMALIZED_AREAS, 'occupancy_engine': 'patch'}
+    pipeline = camera_pipeline.CameraPipeline('patch-test', lambda: None, lambda: config, lambda *args: None)
+    return pipeline, detector_calls
+
+
+def test_pipeline_uses_patch_engine_when_confident(monkeypatch, fallback_on):
+    pipeline, detector_calls = make_pipeline(monkeypatch, [0.1, 0.97])
+    _, stats = pipeline.process_frame(FRAME)
+    assert stats['engine'] == 'patch' and detector_calls == []
+    assert [spot['confidence'] for spot in stats['spots']] == [0.9, 0.97]
+
+
+def test_pipeline_runs_detector_on_low_confidence_frame(monkeypatch, fallback_on):
+    pipeline, detector_calls = make_pipeline(monkeypatch, [0.1, 0.6])
+    _, stats = pipeline.process_frame(FRAME)
+    assert stats['engine'] == 'detector' and detector_calls == ['patch-test']
+    assert 'confidence' not in stats['spots'][0]
+
+
+def test_spot_confidence_is_distance_from_the_decision_boundary():
+    assert spot_confidence(np.array([0.5, 0.9, 0.05])) == pytest.approx([0.5, 0.9, 0.95])
+
+
+def test_warp_spot_patches_accepts_any_corner_order():
+    frame = FRAME.copy()
+    frame[100:301, 100:301] = (0, 0, 255)
+    shuffled = [AREAS[0][2], AREAS[0][0], AREAS[0][3], AREAS[0][1]]
+    assert order_corners(shuffled).tolist() == [[100, 100], [300, 100], [300, 300], [100, 300]]
+    patch = warp_spot_patches(frame, [shuffled])[0]
+    assert patch.shape == (64, 64, 3) and (patch[..., 2] == 255).all()
+
+
+def test_batcher_merges_requests_and_splits_results():
+    class Echo:
+        def classify(self, patches):
+            return patches[:, 0, 0, 0].astype(np.float32) / 255
+
+    batcher = PatchBatcher(Echo(), window=0.2)
+    results = {}
+
+    def request(name, value, count):
+        results[name] = batcher.classify(np.full((count, 64, 64, 3), value, dtype=np.uint8))
+
+    threads = [threading.Thread(target=request, args=('a', 51, 2)), threading.Thread(target=request, args=('b', 102, 3))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results['a'] == pytest.approx([0.2, 0.2])
+    assert results['b'] == pytest.approx([0.4, 0.4, 0.4])
+    assert (batcher.batches, batcher.patches) == (1, 5)
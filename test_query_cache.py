@@ -0,0 +1,120 @@
+"""Testes do cache de consultas do Supabase: TTL, LRU, coalescência e invalidação (pytest)"""
+
+import threading
+import time
+
+import pytest
+
+import supabase_client
+from supabase_client import QueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(supabase_client.time, 'monotonic', fake)
+    return fake
+
+
+def counting_loader(values):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return values[len(calls) - 1]
+    return load, calls
+
+
+def test_hit_until_ttl_expires(clock):
+    cache = QueryCache()
+    load, calls = counting_loader(['a', 'b'])
+    assert cache.get_or_load('k', 30, load) == 'a'
+    clock.now += 29.9
+    assert cache.get_or_load('k', 30, load) == 'a'
+    clock.now += 0.2
+    assert cache.get_or_load('k', 30, load) == 'b'
+    assert len(calls) == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_zero_ttl_bypasses_the_cache(clock):
+    cache = QueryCache()
+    load, calls = counting_loader(['a', 'b'])
+    cache.get_or_load('k', 0, load)
+    cache.get_or_load('k', 0, load)
+    assert len(calls) == 2 and cache.stats()['entries'] == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load('a', 60, lambda: 1)
+    cache.get_or_load('b', 60, lambda: 2)
+    cache.get_or_load('a', 60, lambda: 'reloaded')  # 'a' passa a ser o mais recente
+    cache.get_or_load('c', 60, lambda: 3)
+    assert cache.get_or_load('a', 60, lambda: 'reloaded') == 1
+    assert cache.get_or_load('b', 60, lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = QueryCache()
+    release = threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', 60, slow_load)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while cache.stats()['coalesced'] < 4 and time.time() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['value'] * 5
+    assert len(calls) == 1
+
+
+def test_loader_error_is_raised_and_not_cached():
+    cache = QueryCache()
+
+    def fail():
+        raise RuntimeError('upstream down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('k', 60, fail)
+    assert cache.get_or_load('k', 60, lambda: 'ok') == 'ok'
+
+
+def test_invalidate_drops_tagged_entries_only(clock):
+    cache = QueryCache()
+    cache.get_or_load('history', 60, lambda: 1, tags=('cam1',))
+    cache.get_or_load('other', 60, lambda: 2, tags=('cam2',))
+    cache.invalidate('cam1')
+    assert cache.get_or_load('history', 60, lambda: 'fresh', tags=('cam1',)) == 'fresh'
+    assert cache.get_or_load('other', 60, lambda: 'fresh', tags=('cam2',)) == 2
+
+
+def test_load_racing_an_invalidation_is_returned_but_not_stored(clock):
+    cache = QueryCache()
+
+    def load_then_write():
+        cache.invalidate('cam1')  # Uma escrita chega enquanto a leitura está em voo
+        return 'stale'
+
+    assert cache.get_or_load('k', 60, load_then_write, tags=('cam1',)) == 'stale'
+    assert cache.get_or_load('k', 60, lambda: 'fresh', tags=('cam1',)) == 'fresh'
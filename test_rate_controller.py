@@ -0,0 +1,44 @@
+"""Testes da distribuição do orçamento de inferência por prioridade (pytest)"""
+
+import pytest
+
+from rate_controller import MIN_FPS, allocate_rates
+
+
+def test_everyone_gets_target_when_budget_covers_demand():
+    allocation = allocate_rates([('a', 10.0, 'high', 0.02), ('b', 5.0, 'low', 0.02)], budget=1.0)
+    assert allocation == {'a': (10.0, False), 'b': (5.0, False)}
+
+
+def test_lower_tier_shares_what_is_left_proportionally():
+    demands = [('hi', 10.0, 'high', 0.05), ('n1', 10.0, 'normal', 0.05), ('n2', 4.0, 'normal', 0.05)]
+    allocation = allocate_rates(demands, budget=0.85)
+    assert allocation['hi'] == (10.0, False)
+    # Sobram 0.35 s/s para uma demanda de 0.7: metade da taxa para cada uma
+    assert allocation['n1'] == (pytest.approx(5.0), True)
+    assert allocation['n2'] == (pytest.approx(2.0), True)
+
+
+def test_tiers_below_exhausted_budget_fall_to_min_fps():
+    demands = [('hi', 20.0, 'high', 0.05), ('low', 10.0, 'low', 0.05)]
+    allocation = allocate_rates(demands, budget=0.5)
+    assert allocation['hi'] == (pytest.approx(10.0), True)
+    assert allocation['low'] == (MIN_FPS, True)
+
+
+def test_min_fps_never_exceeds_desired_rate():
+    allocation = allocate_rates([('slow', 0.1, 'high', 1.0), ('big', 10.0, 'high', 1.0)], budget=0.0)
+    assert allocation['slow'] == (0.1, True)
+    assert allocation['big'] == (MIN_FPS, True)
+
+
+def test_unknown_priority_counts_as_default():
+    demands = [('hi', 10.0, 'high', 0.05), ('odd', 10.0, 'urgent', 0.05), ('low', 10.0, 'low', 0.05)]
+    allocation = allocate_rates(demands, budget=1.0)
+    assert allocation['odd'] == (10.0, False)  # Entra no nível 'normal', antes do 'low'
+    assert allocation['low'][1] is True
+
+
+def test_negative_budget_is_treated_as_zero():
+    allocation = allocate_rates([('a', 10.0, 'normal', 0.02)], budget=-1.0)
+    assert allocation['a'] == (MIN_FPS, True)
@@ -0,0 +1,42 @@
+"""Testes das coordenadas normalizadas das vagas (pytest)"""
+
+from spot_geometry import normalize_areas, parse_reference_size, scale_areas
+
+PIXEL_SPOT = [[128, 72], [640, 72], [640, 360], [128, 360]]
+
+
+def test_legacy_pixel_spots_are_normalized_by_the_reference_size():
+    assert normalize_areas([PIXEL_SPOT]) == [[[0.1, 0.1], [0.5, 0.1], [0.5, 0.5], [0.1, 0.5]]]
+    assert normalize_areas([PIXEL_SPOT], {'width': 640, 'height': 360}) == [[[0.2, 0.2], [1.0, 0.2], [1.0, 1.0], [0.2, 1.0]]]
+
+
+def test_points_outside_the_reference_frame_are_clamped():
+    assert normalize_areas([[[-10, 0], [1500, 0], [1500, 800], [-10, 800]]]) == [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]]
+
+
+def test_normalized_spots_are_kept_and_invalid_polygons_dropped():
+    spot = [[0.1234567, 0.2], [0.3, 0.2], [0.3, 0.4], [0.1, 0.4]]
+    triangle = [[0.1, 0.1], [0.2, 0.1], [0.2, 0.2]]
+    assert normalize_areas([spot, triangle, 'junk']) == [[[0.123457, 0.2], [0.3, 0.2], [0.3, 0.4], [0.1, 0.4]]]
+    assert normalize_areas(None) == []
+
+
+def test_reference_size_accepts_list_or_dict_and_falls_back():
+    assert parse_reference_size([1920, 1080]) == (1920, 1080)
+    assert parse_reference_size({'width': '640', 'height': 360}) == (640, 360)
+    for value in (None, [0, 720], {'width': 1280}, 'hd', [1, 2, 3]):
+        assert parse_reference_size(value) == (1280, 720)
+
+
+def test_same_spots_map_to_each_stage_resolution():
+    normalized = normalize_areas([PIXEL_SPOT])
+    assert scale_areas(normalized, 1280, 720) == [PIXEL_SPOT]
+    assert scale_areas(normalized, 640, 360) == [[[64, 36], [320, 36], [320, 180], [64, 180]]]
+    assert scale_areas([], 640, 360) == []
+
+
+def test_scaled_result_is_a_fresh_list_each_call():
+    normalized = normalize_areas([PIXEL_SPOT])
+    first = scale_areas(normalized, 1280, 720)
+    first[0][0][0] = -1  # Quem recebe pode alterar sem contaminar o cache
+    assert scale_areas(normalized, 1280, 720) == [PIXEL_SPOT]
@@ -0,0 +1,147 @@
+"""Testes do substream de inferência e do stream principal sob demanda (pytest)"""
+
+import math
+
+import numpy as np
+import pytest
+
+import api_server
+import camera_pipeline
+import stream_sources
+from stream_sources import DisplayDemand, MainStream, display_source, inference_source, substream_url
+
+MAIN = 'rtsp://admin:x@10.0.0.5:554/Streaming/Channels/301'
+SUB = 'rtsp://admin:x@10.0.0.5:554/Streaming/Channels/302'
+
+
+def test_hikvision_substream_is_derived_from_the_main_channel():
+    assert substream_url(MAIN) == SUB
+    assert substream_url('rtsp://cam/Streaming/Channels/101?transportmode=unicast') == \
+        'rtsp://cam/Streaming/Channels/102?transportmode=unicast'
+    assert substream_url('rtsp://cam/Streaming/Channels/1012') is None
+    assert substream_url('rtsp://cam/live') is None
+
+
+def test_sources_for_inference_and_display():
+    assert inference_source({'url': MAIN}) == MAIN
+    assert display_source({'url': MAIN}) is None  # Uma fonte só: nada a abrir à parte
+    config = {'url': MAIN, 'inference_url': 'auto'}
+    assert (inference_source(config), display_source(config)) == (SUB, MAIN)
+    # 'auto' numa URL que não é Hikvision cai de volta no stream principal
+    assert inference_source({'url': 'rtsp://cam/live', 'inference_url': 'auto'}) == 'rtsp://cam/live'
+    assert display_source({'url': MAIN, 'inference_url': SUB, 'display_url': 'rtsp://cam/hd'}) == 'rtsp://cam/hd'
+
+
+def test_demand_lingers_after_the_last_viewer(monkeypatch):
+    demand = DisplayDemand()
+    monkeypatch.setattr(stream_sources.time, 'time', lambda: 100.0)
+    assert not demand.wanted('cam')
+    assert demand.hold('cam') == math.inf and demand.wanted('cam', now=1e12)
+    assert demand.release('cam', linger=10.0) == 110.0
+    assert demand.wanted('cam', now=109.9) and not demand.wanted('cam', now=110.0)
+
+
+class FakeCapture:
+    def __init__(self, url):
+        self.url = url
+        self.status = 'connecting'
+        self.frame = None
+        self.started = False
+        self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def read(self):
+        return self.frame is not None, self.frame, self.status
+
+    def stop(self, wait=True):
+        self.stopped = True
+
+
+@pytest.fixture
+def main_stream(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(stream_sources.time, 'time', lambda: clock[0])
+    opened = []
+
+    def open_capture(url):
+        opened.append(FakeCapture(url))
+        return opened[-1]
+
+    stream = MainStream('cam', open_capture, DisplayDemand())
+    return stream, opened, clock
+
+
+def test_main_stream_opens_only_while_someone_watches(main_stream):
+    stream, opened, clock = main_stream
+    assert stream.read(MAIN) is None and opened == []
+
+    stream.demand.hold('cam')
+    assert stream.read(MAIN) is None  # Conecta em background; o pipeline segue no substream
+    assert stream.is_open and opened[0].url == MAIN
+    frame = np.ones((1080, 1920, 3), np.uint8)
+    opened[0].frame = frame
+    assert stream.read(MAIN) is frame
+
+    stream.demand.release('cam', linger=5.0)
+    clock[0] += 4.0
+    assert stream.read(MAIN) is frame
+    clock[0] += 1.0
+    assert stream.read(MAIN) is None
+    assert opened[0].stopped and not stream.is_open and stream.opens == 1
+
+
+def test_main_stream_reopens_on_new_url_and_retries_failures(main_stream):
+    stream, opened, clock = main_stream
+    stream.demand.hold('cam')
+    stream.read(MAIN)
+    stream.read('rtsp://cam/hd')
+    assert opened[0].stopped and opened[1].url == 'rtsp://cam/hd'
+
+    opened[1].status = 'failed'
+    clock[0] += stream_sources.DISPLAY_RETRY_SECONDS - 1
+    stream.read('rtsp://cam/hd')
+    assert len(opened) == 2  # Ainda dentro da espera: não martela a câmera
+    clock[0] += 1
+    stream.read('rtsp://cam/hd')
+    assert len(opened) == 3 and stream.opens == 3
+
+    stream.read(None)  # Câmera passou a ter uma fonte só
+    assert opened[2].stopped and not stream.is_open
+
+
+def test_overlay_is_drawn_on_the_main_frame_with_scaled_boxes(monkeypatch):
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    pipeline = camera_pipeline.CameraPipeline('cam', lambda: None, lambda: {}, lambda *args: None,
+                                              open_capture=FakeCapture)
+    substream = np.zeros((360, 640, 3), np.uint8)
+    config = {'url': MAIN, 'inference_url': 'auto'}
+
+    frame, scale_x, scale_y = pipeline.display_frame(substream, config)
+    assert frame.shape == substream.shape and (scale_x, scale_y) == (1.0, 1.0)
+
+    pipeline.main_stream.demand = DisplayDemand()
+    pipeline.main_stream.demand.hold('cam')
+    pipeline.display_frame(substream, config)
+    pipeline.main_stream.capture.frame = np.zeros((1080, 1920, 3), np.uint8)
+    frame, scale_x, scale_y = pipeline.display_frame(substream, config)
+    # Principal 1080p é reduzido para a resolução de exibição
+    assert frame.shape[:2] == (camera_pipeline.CAPTURE_HEIGHT, camera_pipeline.CAPTURE_WIDTH)
+    assert (scale_x, scale_y) == (camera_pipeline.CAPTURE_WIDTH / 640, camera_pipeline.CAPTURE_HEIGHT / 360)
+    pipeline.main_stream.close()
+
+
+def test_viewer_changes_reach_the_worker_pool(monkeypatch):
+    forwarded = []
+
+    class FakeWorkerPool:
+        def set_display_demand(self, camera_id, until):
+            forwarded.append((camera_id, until))
+
+    monkeypatch.setattr(api_server, 'worker_pool', FakeWorkerPool())
+    monkeypatch.setattr(stream_sources.time, 'time', lambda: 50.0)
+    with api_server.frame_hub.watch('viewer-cam'):
+        assert stream_sources.display_demand.wanted('viewer-cam')
+    assert forwarded == [('viewer-cam', math.inf), ('viewer-cam', 50.0 + stream_sources.DISPLAY_LINGER_SECONDS)]
+    stream_sources.display_demand.remove('viewer-cam')
@@ -0,0 +1,136 @@
+"""Testes do rastreador IoU/centróide e do agregado diário (pytest)"""
+
+from datetime import date
+
+import numpy as np
+
+from tracking import DailyStatistics, IoUTracker, SpotDwellTracker, spot_occupants
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 4)
+
+
+def test_iou_match_keeps_ids_while_boxes_move():
+    tracker = IoUTracker()
+    first = tracker.update(boxes((0, 0, 100, 100), (300, 300, 400, 400)), now=0.0)
+    second = tracker.update(boxes((305, 302, 405, 402), (5, 3, 105, 103)), now=0.1)
+    assert list(second) == [first[1], first[0]]
+
+
+def test_centroid_fallback_when_iou_is_below_threshold():
+    tracker = IoUTracker()
+    first = tracker.update(boxes((0, 0, 100, 100)), now=0.0)
+    # Deslocamento de 60 px: IoU ~0.14 (< 0.3), centro a 0.42 diagonal
+    second = tracker.update(boxes((60, 0, 160, 100)), now=0.1)
+    assert second[0] == first[0]
+
+
+def test_centroid_fallback_does_not_stop_at_first_out_of_range_row():
+    tracker = IoUTracker(iou_threshold=0.99)  # Só o centróide associa
+    first = tracker.update(boxes((0, 0, 100, 100), (1000, 0, 1100, 100)), now=0.0)
+    # A e B disputam o primeiro track; B perde e fica sem par no limite,
+    # mas C (mais distante que B do seu track) ainda tem par válido
+    second = tracker.update(boxes((5, 0, 105, 100), (20, 0, 120, 100), (1040, 0, 1140, 100)), now=0.1)
+    assert second[0] == first[0]
+    assert second[1] not in first
+    assert second[2] == first[1]
+
+
+def test_track_survives_misses_and_expires_after_max_misses():
+    tracker = IoUTracker(max_misses=2)
+    track_id = tracker.update(boxes((0, 0, 100, 100)), now=0.0)[0]
+    for step in range(2):
+        tracker.update(boxes(), now=0.1 * (step + 1))
+    assert tracker.update(boxes((2, 2, 102, 102)), now=0.3)[0] == track_id
+    for step in range(3):
+        tracker.update(boxes(), now=0.4 + 0.1 * step)
+    assert tracker.update(boxes((2, 2, 102, 102)), now=0.8)[0] != track_id
+
+
+def test_new_detections_get_fresh_ids():
+    tracker = IoUTracker()
+    first = tracker.update(boxes((0, 0, 100, 100)), now=0.0)
+    second = tracker.update(boxes((0, 0, 100, 100), (500, 500, 600, 600)), now=0.1)
+    assert second[0] == first[0]
+    assert second[1] not in first
+
+
+def test_daily_seed_adds_stored_entries_once():
+    daily = DailyStatistics('cam')
+    daily.day = date(2026, 1, 5)
+    daily.entries = 3  # Contadas desde o boot
+    daily.seed({'total_entries': 40, 'max_occupancy': 90.0, 'min_occupancy': 10.0})
+    daily.seed({'total_entries': 40})
+    assert daily.entries == 43
+    assert daily.max_occupancy == 90.0 and daily.min_occupancy == 10.0
+
+
+SPOT = [[0, 0], [200, 0], [200, 200], [0, 200]]
+
+
+def test_dwell_occlusion_with_new_track_id_is_not_a_new_arrival():
+    dwell = SpotDwellTracker(grace_seconds=5.0)
+    assert dwell.update(0.0, [7]) == 1
+    # Oclusão longa: o track 7 expirou e o mesmo carro volta como track 31
+    assert dwell.update(15.0, [31]) == 0
+    assert dwell.entries == 1 and not dwell.departures
+    info = dwell.spot_info(0, 20.0)
+    assert info['occupied_since'] == 0.0 and info['track_id'] == 31
+
+
+def test_dwell_counts_a_new_arrival_only_after_the_spot_empties():
+    dwell = SpotDwellTracker(grace_seconds=5.0)
+    dwell.update(0.0, [7])
+    dwell.update(100.0, [None])
+    dwell.update(102.0, [None])  # Vazia por menos que o grace: ainda é o mesmo carro
+    assert not dwell.departures
+    dwell.update(106.0, [None])
+    assert [item['dwell_seconds'] for item in dwell.departures] == [100.0]
+    assert dwell.update(110.0, [9]) == 1
+    assert dwell.entries == 2
+
+
+def test_passing_car_with_older_id_does_not_take_the_spot():
+    parked = np.array([[50, 50, 150, 150]], dtype=np.float32)
+    passing = np.array([[60, 40, 160, 140]], dtype=np.float32)  # Centro também dentro da vaga
+    dwell = SpotDwellTracker()
+    dwell.update(0.0, spot_occupants(np.array([8]), parked, [SPOT], dwell.occupants()))
+    both = np.concatenate([parked, passing])
+    occupants = spot_occupants(np.array([8, 3]), both, [SPOT], dwell.occupants())
+    assert occupants == [8]
+    assert dwell.update(1.0, occupants) == 0
+    # Sem ocupante anterior vale o track mais antigo
+    assert spot_occupants(np.array([8, 3]), both, [SPOT]) == [3]
+
+
+def test_pass_by_through_tracker_keeps_entries_at_one():
+    tracker = IoUTracker()
+    dwell = SpotDwellTracker()
+    passing_x = 400  # Carro em movimento visto antes (id menor) que cruza a vaga
+    tracker.update(boxes((passing_x, 40, passing_x + 100, 140)), now=0.0)
+    for step in range(1, 20):
+        passing_x -= 30
+        frame = boxes((50, 50, 150, 150), (passing_x, 40, passing_x + 100, 140))
+        ids = tracker.update(frame, now=float(step))
+        dwell.update(float(step), spot_occupants(ids, frame, [SPOT], dwell.occupants()))
+        assert dwell.spot_info(0, float(step))['track_id'] == ids[0]
+    assert dwell.entries == 1
+
+
+def test_daily_seed_is_fetched_in_background_and_applied_by_the_pipeline(monkeypatch):
+    import camera_pipeline
+
+    monkeypatch.setattr(camera_pipeline, 'load_stable_state', lambda camera_id: None)
+    saved = []
+    monkeypatch.setattr(camera_pipeline.db, 'get_daily_statistics_for_date', lambda camera_id, day: {'total_entries': 40})
+    monkeypatch.setattr(camera_pipeline.db, 'save_daily_statistics', lambda **row: saved.append(row))
+    pipeline = camera_pipeline.CameraPipeline('cam', lambda: None, lambda: {}, lambda *args: None)
+    pipeline.daily.entries = 3
+
+    pipeline.save_daily_statistics()  # Thread de gravação: só busca, não mexe no agregado
+    assert pipeline.daily.entries == 3 and saved == []
+    pipeline.apply_daily_seed()       # Thread do pipeline
+    assert pipeline.daily.entries == 43
+    pipeline.save_daily_statistics()
+    assert saved[-1]['total_entries'] == 43
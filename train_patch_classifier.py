@@ -0,0 +1,225 @@
+"""
+Dataset, treino e exportação do classificador de vagas (motor 'patch').
+
+O `spot_classifier.onnx` não vem no repositório: ele depende do ângulo e da
+iluminação das câmeras de cada instalação. Este script gera o modelo:
+
+    # 1. Patches rotulados pelo YOLO a partir de um vídeo gravado (ou RTSP) da câmera
+    python train_patch_classifier.py collect --camera cam1 --source gravacao.mp4 --every 2
+    # 2. Revise spot_dataset/free e spot_dataset/occupied (mova os patches errados)
+    # 3. Treina e exporta o ONNX no formato que o PatchClassifier carrega
+    python train_patch_classifier.py train --output spot_classifier.onnx
+
+`collect` retifica cada vaga da câmera (mesmo warp do pipeline) e rotula o
+patch com o critério do motor 'detector' (centro de um veículo dentro da
+vaga). `train` treina uma CNN pequena (entrada RGB 0..1 de PATCH_SIZE x
+PATCH_SIZE, saídas livre/ocupada) e confere o ONNX exportado com cv2.dnn,
+reportando a acurácia e a fração de vagas que cairia no detector por
+ficar abaixo de PATCH_MIN_CONFIDENCE. Precisa de torch (vem com o
+ultralytics).
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = Path('spot_dataset')
+LABELS = ('free', 'occupied')  # Índice = classe de saída (PatchClassifier usa a coluna 1)
+DEFAULT_EVERY = 2.0            # segundos entre frames amostrados
+DEFAULT_EPOCHS = 30
+DEFAULT_BATCH = 128
+VALIDATION_FRACTION = 0.2
+ONNX_OPSET = 12
+
+
+def collect(args) -> int:
+    """Grava os patches das vagas de uma câmera, rotulados pelo detector"""
+    import camera_pipeline
+    from patch_classifier import warp_spot_patches
+    from spot_geometry import normalize_areas, scale_areas
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        cam_config = json.load(f).get(args.camera, {})
+    # Configs antigas em pixels: normaliza como o servidor faz na carga
+    raw_areas = normalize_areas(cam_config.get('areas', []), cam_config.get('areas_reference_size'))
+    if not raw_areas:
+        logger.error("Camera %s has no spots in %s", args.camera, args.config)
+        return 1
+    detector = camera_pipeline.load_yolo(args.model)
+    for label in LABELS:
+        (Path(args.dataset) / label).mkdir(parents=True, exist_ok=True)
+
+    cap = cv2.VideoCapture(args.source)
+    if not cap.isOpened():
+        logger.error("Could not open %s", args.source)
+        return 1
+    counts = {label: 0 for label in LABELS}
+    next_sample = 0.0
+    frame_index = 0
+    try:
+        while args.max_frames is None or frame_index < args.max_frames:
+            grabbed, frame = cap.read()
+            if not grabbed:
+                break
+            position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if position < next_sample:
+                continue
+            next_sample = position + args.every
+            if frame.shape[1] > camera_pipeline.CAPTURE_WIDTH or frame.shape[0] > camera_pipeline.CAPTURE_HEIGHT:
+                frame = cv2.resize(frame, (camera_pipeline.CAPTURE_WIDTH, camera_pipeline.CAPTURE_HEIGHT),
+                                   interpolation=cv2.INTER_AREA)
+            areas = scale_areas(raw_areas, frame.shape[1], frame.shape[0])
+            detections = camera_pipeline.extract_detections(
+                camera_pipeline.run_detection(frame, args.imgsz, detector), detector.vehicle_class_ids
+            )
+            status = camera_pipeline.compute_parking_status(areas, camera_pipeline.detection_centers(detections))
+            for spot, (patch, occupied) in enumerate(zip(warp_spot_patches(frame, areas), status)):
+                label = LABELS[int(occupied)]
+                cv2.imwrite(str(Path(args.dataset) / label / f"{args.camera}_{frame_index:06d}_{spot:03d}.jpg"), patch)
+                counts[label] += 1
+            frame_index += 1
+    finally:
+        cap.release()
+    logger.info("Saved %d frames: %d free / %d occupied patches in %s",
+                frame_index, counts['free'], counts['occupied'], args.dataset)
+    return 0
+
+
+def load_dataset(dataset: Path, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Patches (N, 3, size, size) RGB 0..1 -- o mesmo pré-processamento do PatchClassifier"""
+    images: List[np.ndarray] = []
+    labels: List[int] = []
+    for label_index, label in enumerate(LABELS):
+        for path in sorted((dataset / label).glob('*.jpg')):
+            image = cv2.imread(str(path))
+            if image is None:
+                continue
+            if image.shape[:2] != (size, size):
+                image = cv2.resize(image, (size, size), interpolation=cv2.INTER_LINEAR)
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            labels.append(label_index)
+    if not images:
+        return np.empty((0, 3, size, size), dtype=np.float32), np.empty((0,), dtype=np.int64)
+    patches = np.stack(images).astype(np.float32).transpose(0, 3, 1, 2) / 255.0
+    return patches, np.array(labels, dtype=np.int64)
+
+
+def build_model():
+    import torch.nn as nn
+
+    def block(inputs, outputs):
+        return [nn.Conv2d(inputs, outputs, 3, padding=1, bias=False), nn.BatchNorm2d(outputs),
+                nn.ReLU(inplace=True), nn.MaxPool2d(2)]
+
+    return nn.Sequential(
+        *block(3, 16), *block(16, 32), *block(32, 64),
+        nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(64, len(LABELS)),
+    )
+
+
+def train(args) -> int:
+    """Treina a CNN, exporta o ONNX e valida o arquivo exportado com cv2.dnn"""
+    import torch
+    import torch.nn as nn
+
+    from camera_pipeline import PATCH_MIN_CONFIDENCE
+    from patch_classifier import PATCH_SIZE, PatchClassifier, spot_confidence
+
+    patches, labels = load_dataset(Path(args.dataset), PATCH_SIZE)
+    if len(set(labels.tolist())) < len(LABELS):
+        logger.error("Dataset %s needs patches in both %s", args.dataset, '/'.join(LABELS))
+        return 1
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    order = list(range(len(labels)))
+    random.shuffle(order)
+    split = max(1, int(len(order) * VALIDATION_FRACTION))
+    val_idx, train_idx = np.array(order[:split]), np.array(order[split:])
+    train_x, train_y = torch.from_numpy(patches[train_idx]), torch.from_numpy(labels[train_idx])
+
+    model = build_model()
+    # Pátios costumam ter muito mais de uma classe: pesa pela frequência inversa
+    counts = np.bincount(labels[train_idx], minlength=len(LABELS)).astype(np.float32)
+    weights = torch.from_numpy(counts.sum() / np.maximum(counts, 1.0) / len(LABELS))
+    loss_fn = nn.CrossEntropyLoss(weight=weights)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+
+    for epoch in range(args.epochs):
+        model.train()
+        permutation = torch.randperm(len(train_y))
+        total_loss = 0.0
+        for start in range(0, len(permutation), args.batch):
+            batch = permutation[start:start + args.batch]
+            x = train_x[batch]
+            # Aumentos baratos: espelhamento e brilho (as câmeras são fixas, sem rotação)
+            flip = torch.rand(len(x)) < 0.5
+            x = torch.where(flip[:, None, None, None], x.flip(3), x)
+            x = (x * torch.empty(len(x), 1, 1, 1).uniform_(0.7, 1.3)).clamp(0.0, 1.0)
+            optimizer.zero_grad()
+            loss = loss_fn(model(x), train_y[batch])
+            loss.backward()
+            optimizer.step()
+            total_loss += float(loss) * len(batch)
+        logger.info("Epoch %d/%d: loss %.4f", epoch + 1, args.epochs, total_loss / len(train_y))
+
+    model.eval()
+    output = Path(args.output)
+    torch.onnx.export(
+        model, torch.zeros(1, 3, PATCH_SIZE, PATCH_SIZE), str(output),
+        input_names=['patches'], output_names=['logits'],
+        dynamic_axes={'patches': {0: 'batch'}, 'logits': {0: 'batch'}}, opset_version=ONNX_OPSET,
+    )
+
+    # Confere o ONNX pelo mesmo caminho do servidor (BGR uint8 -> blobFromImages)
+    val_images = (patches[val_idx].transpose(0, 2, 3, 1)[..., ::-1] * 255.0).round().astype(np.uint8)
+    probs = PatchClassifier(str(output)).classify(val_images)
+    accuracy = float(np.mean((probs >= 0.5).astype(np.int64) == labels[val_idx]))
+    fallback = float(np.mean(spot_confidence(probs) < PATCH_MIN_CONFIDENCE))
+    logger.info("Exported %s: validation accuracy %.3f on %d patches; %.1f%% below confidence %.2f "
+                "(frames with such spots fall back to the detector)",
+                output, accuracy, len(val_idx), fallback * 100, PATCH_MIN_CONFIDENCE)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build, train and export the spot patch classifier")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    collect_parser = commands.add_parser('collect', help="save YOLO-labelled spot patches from a video")
+    collect_parser.add_argument('--camera', required=True, help="camera id whose spots are used")
+    collect_parser.add_argument('--source', required=True, help="video file or stream URL of that camera")
+    collect_parser.add_argument('--config', default='cameras_config.json')
+    collect_parser.add_argument('--model', default='yolo11s.pt', help="YOLO weights used as the labeller")
+    collect_parser.add_argument('--imgsz', type=int, default=640)
+    collect_parser.add_argument('--every', type=float, default=DEFAULT_EVERY, help="seconds between sampled frames")
+    collect_parser.add_argument('--max-frames', type=int, help="stop after this many sampled frames")
+    collect_parser.add_argument('--dataset', default=str(DATASET_DIR))
+
+    train_parser = commands.add_parser('train', help="train on the dataset and export ONNX")
+    train_parser.add_argument('--dataset', default=str(DATASET_DIR))
+    train_parser.add_argument('--output', default='spot_classifier.onnx')
+    train_parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS)
+    train_parser.add_argument('--batch', type=int, default=DEFAULT_BATCH)
+    train_parser.add_argument('--lr', type=float, default=1e-3)
+    train_parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    args = parse_args(argv)
+    return collect(args) if args.command == 'collect' else train(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())